@@ -0,0 +1,204 @@
+"""
+Measures the csv sales upload end to end at several file sizes and writes
+rows/sec, peak memory and query count to a JSON results file.
+
+Each size is run in a fresh process against a temporary SQLite database,
+using a file from benchmarks.sales_csv. The file is passed to the
+sale_upload view as an upload that Django has spooled to disk, so form
+validation, import ledger checks and DB writes are all included.
+
+Usage (from the project directory):
+    python -m benchmarks.ingestion --rows 10000 100000 1000000 \\
+        --duplicates 0.01 --unknown-fruits 0.01 --future-dates 0.01 \\
+        --malformed 0.01 --output results.json --compare previous.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.sales_csv import (
+    FRUIT_PRICES,
+    add_rate_arguments,
+    get_rates,
+    write_sales_csv,
+)
+
+
+def get_peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def run_upload(rows, rates, tmp_dir):
+    """
+    Imports a generated file of "rows" rows through the sale_upload view and
+    returns the measurements. Runs in its own process, so that the peak
+    memory isn't carried over from another run.
+    """
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.core.files.uploadedfile import UploadedFile
+    from django.core.management import call_command
+    from django.contrib.messages.storage.cookie import CookieStorage
+    from django.db import connection
+    from django.http import QueryDict
+    from django.test import RequestFactory
+    from django.urls import reverse
+    from django.utils.datastructures import MultiValueDict
+
+    # Use a temporary database and keep the upload in the request
+    settings.DATABASES["default"]["NAME"] = os.path.join(tmp_dir, "db.sqlite3")
+    settings.DEBUG = False
+    settings.SALE_UPLOAD_BACKGROUND_THRESHOLD = sys.maxsize
+
+    from stock.models import Fruit
+    from sales.models import Sale
+    from sales.views import sale_upload
+    from users.models import CustomUser
+
+    call_command("migrate", verbosity=0)
+    for name, price in FRUIT_PRICES.items():
+        Fruit.objects.create(name=name, price=price)
+    user = CustomUser.objects.create_user("benchmark", "123456")
+
+    path = os.path.join(tmp_dir, "sales.csv")
+    write_sales_csv(path, rows, **rates)
+    file_size = os.path.getsize(path)
+    memory_before = get_peak_memory_mb()
+
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with open(path, "rb") as f:
+        request = RequestFactory().post(reverse("sale_upload"))
+        request.user = user
+        request._post = QueryDict()
+        request._files = MultiValueDict(
+            {
+                "file_name": [
+                    UploadedFile(f, "sales.csv", "text/csv", file_size)
+                ]
+            }
+        )
+        request._messages = CookieStorage(request)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = sale_upload(request)
+        seconds = time.perf_counter() - started
+
+    if response.status_code != 302:
+        raise RuntimeError("The upload was not accepted.")
+
+    return {
+        "rows": rows,
+        "file_size_mb": round(file_size / 1024 / 1024, 2),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds),
+        "peak_memory_mb": round(get_peak_memory_mb(), 1),
+        "memory_before_upload_mb": round(memory_before, 1),
+        "queries": queries,
+        "sales_written": Sale.objects.count(),
+    }
+
+
+def get_label():
+    """
+    Returns the current git commit, to tell results of releases apart.
+    """
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_comparison(results, path):
+    with open(path) as f:
+        previous = json.load(f)
+    previous_runs = {run["rows"]: run for run in previous["runs"]}
+    print(f"Compared with {previous['label']}:")
+    for run in results["runs"]:
+        before = previous_runs.get(run["rows"])
+        if before is None:
+            continue
+        print(
+            f"  {run['rows']:,} rows: rows/sec "
+            f"x{run['rows_per_second'] / before['rows_per_second']:.2f}, "
+            f"peak memory x{run['peak_memory_mb'] / before['peak_memory_mb']:.2f}, "
+            f"queries {before['queries']} -> {run['queries']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    add_rate_arguments(parser)
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument(
+        "--compare", default=None, help="Results file of an earlier run."
+    )
+    args = parser.parse_args()
+    rates = get_rates(args)
+
+    results = {
+        "label": args.label or get_label(),
+        "created_on": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "rates": rates,
+        "runs": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                run = executor.submit(run_upload, rows, rates, tmp_dir)
+                run = run.result()
+        results["runs"].append(run)
+        print(
+            f"{rows:,} rows: {run['seconds']:.2f}s, "
+            f"{run['rows_per_second']:,} rows/sec, "
+            f"peak memory {run['peak_memory_mb']:.0f} MB, "
+            f"{run['queries']:,} queries"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares how long the validation stage of the csv sales import takes with
+1, 2, 4 and 8 worker processes, using a generated csv file.
+
+The parse_sold_on() cache is cleared before each run, as the worker
+processes are forked with a copy of it and would otherwise start with the
+dates already parsed by the previous runs.
+
+Usage (from the project directory):
+    python -m benchmarks.parallel_validation --rows 2000000
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import django
+
+from benchmarks.sales_csv import FRUIT_NAMES, write_sales_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+    from sales.imports import parse_sold_on, validate_csv_file
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "sales.csv")
+        write_sales_csv(path, args.rows)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{args.rows:,} rows ({size_mb:.0f} MB), {os.cpu_count()} CPUs")
+
+        baseline = None
+        for workers in args.workers:
+            parse_sold_on.cache_clear()
+            started = time.perf_counter()
+            rows = 0
+            for chunk in validate_csv_file(
+                path, frozenset(FRUIT_NAMES), workers
+            ):
+                rows += chunk.rows
+            seconds = time.perf_counter() - started
+            baseline = baseline or seconds
+            print(
+                f"{workers} worker(s): {seconds:.2f}s, "
+                f"{rows / seconds:,.0f} rows/sec, "
+                f"speedup x{baseline / seconds:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Generates synthetic sales csv files in the upload format, with chosen rates
+of rows that the import should reject.
+
+Usage (from the project directory):
+    python -m benchmarks.sales_csv sales.csv --rows 100000 --duplicates 0.01
+"""
+
+import random
+import argparse
+from datetime import datetime, timedelta
+
+# Fruits (and their prices) that exist when the generated files are imported
+FRUIT_PRICES = {
+    "apple": 90,
+    "lemon": 100,
+    "orange": 80,
+    "kiwi": 120,
+    "banana": 60,
+    "grape": 300,
+}
+FRUIT_NAMES = list(FRUIT_PRICES)
+
+# Fruits that are used for rows that should be rejected as unknown
+UNKNOWN_FRUIT_NAMES = ["durian", "mango", "papaya"]
+
+START = datetime(year=2015, month=1, day=1)
+MINUTES = 3_000_000  # About 5.7 years of sales from START
+
+
+def malformed_row(rand, row):
+    """
+    Returns a copy of a valid row broken in one of the ways that the import
+    checks for.
+    """
+    fruit_name, quantity, proceeds, sold_on = row
+    return rand.choice(
+        [
+            [fruit_name, quantity, proceeds],
+            [fruit_name, quantity + ".5", proceeds, sold_on],
+            [fruit_name, quantity, "-" + proceeds, sold_on],
+            [fruit_name, quantity, proceeds, sold_on.replace(" ", "T")],
+            [fruit_name, quantity, proceeds, sold_on[:10]],
+        ]
+    )
+
+
+def generate_rows(
+    rows,
+    duplicates=0.0,
+    unknown_fruits=0.0,
+    future_dates=0.0,
+    malformed=0.0,
+    seed=0,
+):
+    """
+    Yields "rows" csv rows as lists of str. Each of the rates is the share of
+    rows (between 0 and 1) that are repeats of an earlier row, refer to an
+    unknown fruit, are dated in the future or don't have the upload format.
+    The rows are the same for the same seed.
+    """
+    rand = random.Random(seed)
+    future_start = datetime.now() + timedelta(days=1)
+    recent = []
+
+    for _ in range(rows):
+        draw = rand.random()
+        if draw < duplicates and recent:
+            yield rand.choice(recent)
+            continue
+        draw -= duplicates
+
+        fruit_name = rand.choice(FRUIT_NAMES)
+        quantity = rand.randint(1, 20)
+        sold_on = START + timedelta(minutes=rand.randint(0, MINUTES))
+        if draw < unknown_fruits:
+            fruit_name = rand.choice(UNKNOWN_FRUIT_NAMES)
+        elif draw - unknown_fruits < future_dates:
+            sold_on = future_start + timedelta(minutes=rand.randint(0, 10**6))
+
+        price = FRUIT_PRICES.get(fruit_name, 100)
+        row = [
+            fruit_name,
+            str(quantity),
+            str(quantity * price),
+            f"{sold_on:%Y-%m-%d %H:%M}",
+        ]
+        if 0 <= draw - unknown_fruits - future_dates < malformed:
+            row = malformed_row(rand, row)
+
+        # Duplicates are drawn from a bounded window of recent rows
+        if len(recent) < 1000:
+            recent.append(row)
+        else:
+            recent[rand.randrange(1000)] = row
+        yield row
+
+
+def write_sales_csv(path, rows, **rates):
+    """
+    Writes the rows from generate_rows() to a csv file at "path".
+    """
+    with open(path, "w", newline="") as f:
+        for row in generate_rows(rows, **rates):
+            f.write(",".join(row) + "\r\n")
+
+
+def add_rate_arguments(parser):
+    parser.add_argument("--duplicates", type=float, default=0.0)
+    parser.add_argument("--unknown-fruits", type=float, default=0.0)
+    parser.add_argument("--future-dates", type=float, default=0.0)
+    parser.add_argument("--malformed", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def get_rates(args):
+    return {
+        "duplicates": args.duplicates,
+        "unknown_fruits": args.unknown_fruits,
+        "future_dates": args.future_dates,
+        "malformed": args.malformed,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10_000)
+    add_rate_arguments(parser)
+    args = parser.parse_args()
+    write_sales_csv(args.path, args.rows, **get_rates(args))
+
+
+if __name__ == "__main__":
+    main()
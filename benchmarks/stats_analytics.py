@@ -0,0 +1,173 @@
+"""
+Compares ways of summarising all sales by local day and fruit, as done when
+the daily rollup is rebuilt, and writes time and peak memory to a JSON
+results file.
+
+The methods are:
+    objects   one Sale object per row, grouped in Python
+    database  grouped in the DB by sold_on truncated to the local day
+    columnar  stats.columnar, with NumPy if it is installed
+    loop      stats.columnar without NumPy
+
+Each size is written once to a temporary SQLite database, and each method is
+run in a fresh process against it.
+
+Usage (from the project directory):
+    python -m benchmarks.stats_analytics --rows 1000000 10000000 \\
+        --methods objects database columnar loop --output results.json
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.sales_csv import FRUIT_PRICES, generate_rows
+from benchmarks.ingestion import get_label, get_peak_memory_mb
+
+METHODS = ["objects", "database", "columnar", "loop"]
+
+
+def setup_django(db_path):
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.DEBUG = False
+
+
+def create_sales_db(db_path, rows):
+    """
+    Creates the tables in a new database at "db_path" and inserts "rows"
+    generated sales directly, without the rollup or upload checks.
+    """
+    setup_django(db_path)
+
+    from django.core.management import call_command
+    from stock.models import Fruit
+
+    call_command("migrate", verbosity=0)
+    fruit_ids = {
+        name: Fruit.objects.create(name=name, price=price).pk
+        for name, price in FRUIT_PRICES.items()
+    }
+
+    connection = sqlite3.connect(db_path)
+    sql = (
+        "INSERT INTO sales_sale (fruit_id, fruit_name, quantity, "
+        "fruit_price_when_sold, proceeds, sold_on, dedup_key) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    sales = (
+        (
+            fruit_ids[fruit_name],
+            fruit_name,
+            int(quantity),
+            FRUIT_PRICES[fruit_name],
+            int(proceeds),
+            f"{sold_on}:00",
+            str(i),
+        )
+        for i, (fruit_name, quantity, proceeds, sold_on) in enumerate(
+            generate_rows(rows)
+        )
+    )
+    with connection:
+        connection.executemany(sql, sales)
+    connection.close()
+
+
+def run_method(method, db_path):
+    """
+    Summarises all sales with "method" and returns the measurements. Runs in
+    its own process, so that the peak memory isn't carried over.
+    """
+    setup_django(db_path)
+
+    from unittest import mock
+    from sales.models import Sale
+    from stats.rollups import summarise_sales_by_day
+    from stats.columnar import load_sales_columns, summarise_columns_by_day
+
+    memory_before = get_peak_memory_mb()
+    started = time.perf_counter()
+    if method == "objects":
+        summary = summarise_sales_by_day(list(Sale.objects.all()))
+    elif method == "database":
+        summary = summarise_sales_by_day(Sale.objects.all())
+    elif method == "columnar":
+        summary = summarise_columns_by_day(
+            load_sales_columns(Sale.objects.all())
+        )
+    else:
+        with mock.patch("stats.columnar.numpy", None):
+            summary = summarise_columns_by_day(
+                load_sales_columns(Sale.objects.all())
+            )
+    seconds = time.perf_counter() - started
+
+    return {
+        "method": method,
+        "seconds": round(seconds, 3),
+        "peak_memory_mb": round(get_peak_memory_mb(), 1),
+        "memory_before_mb": round(memory_before, 1),
+        "groups": len(summary),
+        "total_proceeds": sum(totals[1] for totals in summary.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--methods", nargs="+", choices=METHODS, default=METHODS
+    )
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", default="stats_benchmark_results.json")
+    args = parser.parse_args()
+
+    results = {
+        "label": args.label or get_label(),
+        "created_on": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "db.sqlite3")
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                executor.submit(create_sales_db, db_path, rows).result()
+
+            for method in args.methods:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    run = executor.submit(run_method, method, db_path)
+                    run = run.result()
+                run["rows"] = rows
+                results["runs"].append(run)
+                print(
+                    f"{rows:,} rows, {method}: {run['seconds']:.2f}s, "
+                    f"peak memory {run['peak_memory_mb']:.0f} MB, "
+                    f"{run['groups']:,} days and fruits"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 
 from environs import Env
+from django.core.exceptions import ImproperlyConfigured
 
 
 env = Env()
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     "home",
     "stock",
     "sales",
+    "stats",
 ]
 
 
@@ -112,6 +114,47 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 
+# Number of rows written per bulk INSERT transaction by the csv sales upload.
+SALE_UPLOAD_BATCH_SIZE = env.int("SALE_UPLOAD_BATCH_SIZE", 2000)
+
+# Uploaded csv files larger than this (in bytes) are imported in the
+# background by "manage.py process_sale_imports" instead of in the request.
+SALE_UPLOAD_BACKGROUND_THRESHOLD = env.int(
+    "SALE_UPLOAD_BACKGROUND_THRESHOLD", 1024 * 1024
+)
+
+# Number of processes used by background imports to validate csv files, and
+# the size (in bytes) of the chunks the files are split into for them.
+SALE_IMPORT_WORKERS = env.int("SALE_IMPORT_WORKERS", 1)
+SALE_IMPORT_CHUNK_SIZE = env.int("SALE_IMPORT_CHUNK_SIZE", 4 * 1024 * 1024)
+
+# Seconds after which a running import job that hasn't recorded any progress
+# is taken to have lost its worker, and is run again by another one.
+SALE_IMPORT_JOB_TIMEOUT = env.int("SALE_IMPORT_JOB_TIMEOUT", 600)
+
+# Number of threads used to decompress and read the csv files in a zip upload.
+SALE_ARCHIVE_WORKERS = env.int("SALE_ARCHIVE_WORKERS", 4)
+
+# Cache used for the stats pages, e.g. "memcached://localhost:11211". The
+# default in-memory cache isn't shared between processes, so writes made by
+# the import worker, the management commands or another server process
+# don't invalidate it. It is therefore only allowed when DEBUG is on.
+CACHES = {"default": env.dj_cache_url("CACHE_URL", default="locmem://")}
+if not DEBUG and CACHES["default"]["BACKEND"].endswith(".LocMemCache"):
+    raise ImproperlyConfigured(
+        "Set CACHE_URL to a cache shared by all processes, e.g. "
+        '"memcached://localhost:11211", or "db://stats_cache" after running '
+        '"python manage.py createcachetable".'
+    )
+
+# While one process recomputes the cached stats, others wait up to
+# STATS_CACHE_WAIT seconds for the result if there is no earlier result from
+# the same day to serve. The lock expires after STATS_CACHE_LOCK_TIMEOUT
+# seconds in case the recomputing process dies.
+STATS_CACHE_WAIT = env.float("STATS_CACHE_WAIT", 2.0)
+STATS_CACHE_LOCK_TIMEOUT = env.int("STATS_CACHE_LOCK_TIMEOUT", 30)
+
+
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "home"
 
@@ -1,6 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count
+from .imports import delete_sale_import
 from .models import Sale
 from .models import CsvUploadFile
+from .models import SaleImportJob
+from .models import SaleImport
+from .signals import sales_changed
 
 
 class SaleAdmin(admin.ModelAdmin):
@@ -13,6 +19,66 @@ class SaleAdmin(admin.ModelAdmin):
         "sold_on",
     )
 
+    # The delete_selected action deletes the queryset with a single DELETE,
+    # which bypasses Sale.delete(), so sales_changed is sent here instead.
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            sales_changed.send(sender=Sale, added=[], removed=queryset)
+            queryset.delete()
+
+
+class SaleImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "file_name",
+        "status",
+        "rows_parsed",
+        "rows_accepted",
+        "rows_rejected",
+        "created_on",
+        "finished_on",
+    )
+    exclude = ("content_hash",)
+
+
+class SaleImportAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "file_name",
+        "sale_count",
+        "imported_on",
+    )
+    exclude = ("content_hash",)
+    actions = ["delete_imports"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.annotate(sale_count=Count("sales"))
+
+    def sale_count(self, obj):
+        return obj.sale_count
+
+    sale_count.short_description = "Sales"
+
+    # The default delete confirmation loads every related Sale object to list
+    # it, so imports are only deleted with the delete_imports action.
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def delete_imports(self, request, queryset):
+        deleted = 0
+        for sale_import in queryset:
+            deleted += delete_sale_import(sale_import)
+        self.message_user(
+            request,
+            f"{deleted} sales from {len(queryset)} imports were deleted.",
+            messages.SUCCESS,
+        )
+
+    delete_imports.short_description = "Delete selected imports and sales"
+
 
 admin.site.register(Sale, SaleAdmin)
 admin.site.register(CsvUploadFile)
+admin.site.register(SaleImportJob, SaleImportJobAdmin)
+admin.site.register(SaleImport, SaleImportAdmin)
@@ -1,7 +1,10 @@
+import pytz
 from django import forms
+from django.conf import settings
 
 from .models import Sale
-from .models import CsvUploadFile
+from .models import CsvUploadFile, SaleImport
+from .imports import hash_file_content
 from stock.models import Fruit
 
 
@@ -92,8 +95,42 @@ class CsvUploadForm(forms.ModelForm):
         },
     )
 
+    time_zone = forms.ChoiceField(
+        label="Timezone",
+        choices=[(tz, tz) for tz in pytz.common_timezones],
+        initial=settings.TIME_ZONE,
+        required=False,
+        help_text="The timezone of the dates and times in the file.",
+    )
+
+    dry_run = forms.BooleanField(
+        label="Only check the file",
+        required=False,
+        help_text="Every row is checked without any sales being imported.",
+    )
+
     class Meta:
 
         model = CsvUploadFile
 
         fields = ("file_name",)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file_name = cleaned_data.get("file_name")
+        time_zone = cleaned_data.get("time_zone") or settings.TIME_ZONE
+
+        # Files that have been imported before in the same timezone are
+        # rejected without reading their rows
+        if file_name:
+            self.content_hash = hash_file_content(
+                file_name.chunks(), time_zone
+            )
+            if SaleImport.objects.filter(
+                content_hash=self.content_hash
+            ).exists():
+                self.add_error(
+                    "file_name", "This file has already been imported."
+                )
+
+        return cleaned_data
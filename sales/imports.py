@@ -0,0 +1,960 @@
+import io
+import os
+import csv
+import bz2
+import gzip
+import queue
+import zipfile
+import threading
+import pytz
+import django
+import mmap
+import hashlib
+import tempfile
+import time
+from collections import deque, Counter
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Sale,
+    SaleImport,
+    SaleImportJob,
+    ImportedRow,
+    build_sale_dedup_key,
+)
+from .signals import sales_changed
+from stock.models import Fruit
+
+# Extensions of the compressed files accepted by open_upload_members()
+COMPRESSED_EXTENSIONS = (".gz", ".bz2", ".zip")
+
+# Number of rows passed at a time from the threads reading archive members
+MEMBER_BATCH_SIZE = 1000
+
+# Number of row digests looked up in the ImportedRow ledger per query. Kept
+# below SQLite's limit of 999 variables per query.
+LEDGER_LOOKUP_SIZE = 500
+
+# Reasons csv rows are rejected for, with their descriptions in reports
+REJECTION_REASONS = {
+    "columns": "Not four values (fruit, quantity, proceeds, date time)",
+    "unknown_fruit": "Unknown fruit",
+    "quantity": "Quantity is not a whole number",
+    "zero_quantity": "Quantity is zero",
+    "proceeds": "Proceeds are not a whole number",
+    "sold_on": 'Date and time not in the format "YYYY-MM-DD HH:MM"',
+    "future": "Date and time in the future",
+    "duplicate": "Repeat of an earlier row in the file",
+    "already_imported": "Imported from an earlier file",
+    "existing_sale": "Identical to an existing sale",
+}
+
+# Number of line numbers kept as samples for each rejection reason
+SAMPLE_LINES = 5
+
+# Longest time in seconds between two calls of the progress callback while
+# rows are being parsed
+PROGRESS_INTERVAL = 5
+
+
+@lru_cache(maxsize=65536)
+def parse_sold_on(date_str, time_zone):
+    """
+    Converts a "YYYY-MM-DD HH:MM" str in the given timezone to a UTC datetime,
+    or returns None if it doesn't have that format or isn't a valid date.
+    The fixed format is parsed by slicing rather than with strptime(), and
+    as the same timestamps are repeated throughout csv files the results are
+    cached, bounded to the most recent 65536 distinct values.
+    """
+    if (
+        len(date_str) != 16
+        or date_str[4] != "-"
+        or date_str[7] != "-"
+        or date_str[10] != " "
+        or date_str[13] != ":"
+    ):
+        return None
+    digits = date_str[0:4] + date_str[5:7] + date_str[8:10]
+    digits += date_str[11:13] + date_str[14:16]
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+
+    try:
+        naive_datetime = datetime(
+            int(digits[0:4]),
+            int(digits[4:6]),
+            int(digits[6:8]),
+            int(digits[8:10]),
+            int(digits[10:12]),
+        )
+    except ValueError:
+        return None
+
+    aware_datetime = pytz.timezone(time_zone).localize(naive_datetime)
+    return aware_datetime.astimezone(dt_timezone.utc)
+
+
+class UploadSummary:
+    """
+    Class summarising the outcome of a csv upload.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        # Number of rejected rows for each key in REJECTION_REASONS, and the
+        # line numbers of the first few of them
+        self.reasons = Counter()
+        self.sample_lines = {}
+        # Names in the csv file that have no corresponding Fruit object
+        self.unknown_fruits = set()
+        # SaleImport that the accepted rows were recorded under
+        self.sale_import = None
+        # (name, number of rows before it) of each csv file in the upload, as
+        # recorded by read_csv_members()
+        self.members = []
+
+    @property
+    def duplicates(self):
+        return self.reasons["duplicate"]
+
+    @property
+    def already_imported(self):
+        return self.reasons["already_imported"]
+
+    def add_rejected(self, reason, line=None, row=None):
+        self.rejected += 1
+        self.reasons[reason] += 1
+        if reason == "unknown_fruit":
+            self.unknown_fruits.add(row[0])
+        if line is not None:
+            lines = self.sample_lines.setdefault(reason, [])
+            if len(lines) < SAMPLE_LINES:
+                lines.append(line)
+
+    def merge(self, chunk, line_offset):
+        """
+        Adds the rows counted in a ValidatedChunk that starts after line
+        "line_offset" of the file.
+        """
+        self.rows += chunk.rows
+        self.rejected += chunk.rejected
+        self.reasons.update(chunk.reasons)
+        self.unknown_fruits |= chunk.unknown_fruits
+        for reason, lines in chunk.sample_lines.items():
+            samples = self.sample_lines.setdefault(reason, [])
+            for line in lines[: SAMPLE_LINES - len(samples)]:
+                samples.append(line_offset + line)
+
+    def locate_line(self, line):
+        """
+        Returns "line" as "file name:line number" if the upload had several
+        csv files, as the line numbers count the rows of all of them.
+        """
+        if len(self.members) <= 1:
+            return line
+        for name, offset in reversed(self.members):
+            if line > offset:
+                return f"{name}:{line - offset}"
+
+    def rejection_report(self):
+        """
+        Returns a (description, number of rows, sample line numbers) tuple for
+        each reason rows were rejected for, the most frequent first.
+        """
+        return [
+            (
+                REJECTION_REASONS[reason],
+                count,
+                [
+                    self.locate_line(line)
+                    for line in self.sample_lines.get(reason, [])
+                ],
+            )
+            for reason, count in self.reasons.most_common()
+        ]
+
+
+class ValidatedChunk(UploadSummary):
+    """
+    Class holding the outcome of validate_csv_chunk() for one chunk of a csv
+    file, including the converted content of each accepted row.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # (row digest, line number in the chunk, (fruit name, quantity,
+        # proceeds, UTC sold_on)) tuples
+        self.sales = []
+
+
+def hash_row(row, time_zone):
+    """
+    Helper function for unique_rows(). Returns a 16-byte digest of a csv row
+    read in the "time_zone" timezone. The timezone is included as the same
+    row is a different sale when read in another timezone. The unit separator
+    is used to join the elements as it doesn't appear in csv text.
+    """
+    value = "\x1f".join([*row, time_zone])
+    return hashlib.blake2b(value.encode(), digest_size=16).digest()
+
+
+def hash_file_content(chunks, time_zone):
+    """
+    Returns the SHA-256 hex digest of a file given as an iterable of bytes,
+    e.g. UploadedFile.chunks(), and of the timezone its dates and times are
+    read in, as in hash_row().
+    """
+    sha256 = hashlib.sha256()
+    for chunk in chunks:
+        sha256.update(chunk)
+    sha256.update(b"\x1f" + time_zone.encode())
+    return sha256.hexdigest()
+
+
+def unique_rows(rows, summary, time_zone):
+    """
+    Helper function for generate_sale_objects(). Yields (digest, line number,
+    row) for each row the first time it is seen while reading through "rows"
+    lazily, the digest being the hash_row() of the row in "time_zone". Only
+    the digest of each distinct row is kept, so memory is bounded by the
+    number of distinct rows rather than the size of the file.
+    """
+    seen = set()
+    for row in rows:
+        summary.rows += 1
+        key = hash_row(row, time_zone)
+        if key in seen:
+            summary.add_rejected("duplicate", summary.rows)
+            continue
+        seen.add(key)
+        yield key, summary.rows, row
+
+
+def drop_imported_rows(items, summary, line_offset=0):
+    """
+    Returns the (digest, line number, ...) items whose row digest isn't
+    recorded in the ImportedRow ledger. The digests are looked up on the
+    unique index of ImportedRow.row_hash, LEDGER_LOOKUP_SIZE at a time. Rows
+    recorded under summary.sale_import are repeats of an earlier row in the
+    same file.
+    """
+    row_hashes = [item[0].hex() for item in items]
+    imported = {}
+    for i in range(0, len(row_hashes), LEDGER_LOOKUP_SIZE):
+        imported.update(
+            ImportedRow.objects.filter(
+                row_hash__in=row_hashes[i : i + LEDGER_LOOKUP_SIZE]
+            ).values_list("row_hash", "sale_import_id")
+        )
+    if not imported:
+        return items
+
+    sale_import_id = summary.sale_import and summary.sale_import.pk
+    new_items = []
+    for row_hash, item in zip(row_hashes, items):
+        if row_hash not in imported:
+            new_items.append(item)
+        elif imported[row_hash] == sale_import_id:
+            summary.add_rejected("duplicate", line_offset + item[1])
+        else:
+            summary.add_rejected("already_imported", line_offset + item[1])
+    return new_items
+
+
+def skip_imported_rows(rows, summary):
+    """
+    Helper function for generate_sale_objects(). Yields the items from
+    unique_rows() for rows not imported from an earlier file, checking them
+    against the ledger LEDGER_LOOKUP_SIZE rows at a time.
+    """
+    pending = []
+    for item in rows:
+        pending.append(item)
+        if len(pending) >= LEDGER_LOOKUP_SIZE:
+            yield from drop_imported_rows(pending, summary)
+            pending = []
+    yield from drop_imported_rows(pending, summary)
+
+
+def load_fruit_lookup():
+    """
+    Helper function for generate_sale_objects(). Loads every Fruit object in
+    a single query so that rows can be checked against an in-memory dict.
+    """
+    return {fruit.name: fruit for fruit in Fruit.objects.all()}
+
+
+def convert_row(row, fruits, time_zone, now):
+    """
+    Helper function for generate_sale_objects(). Checks the elements included
+    in a row of a csv file and the formatting thereof, and converts them to
+    (fruit name, quantity, proceeds, UTC sold_on). If the row doesn't pass
+    the checks, the key in REJECTION_REASONS of the first failed check is
+    returned instead. "fruits" is the dict returned by load_fruit_lookup() or
+    a set of fruit names, and the datetime element is read as a local time in
+    the "time_zone" timezone.
+    """
+    if len(row) != 4:
+        return "columns"
+
+    # Check whether a corresponding Fruit object exists
+    if row[0] not in fruits:
+        return "unknown_fruit"
+
+    if not (row[1].isascii() and row[1].isdigit()):
+        return "quantity"
+
+    # Sales of nothing are rejected, also as fruit_price_when_sold is
+    # worked out by dividing the proceeds by the quantity
+    quantity = int(row[1])
+    if quantity == 0:
+        return "zero_quantity"
+
+    if not (row[2].isascii() and row[2].isdigit()):
+        return "proceeds"
+
+    # Check whether the datetime element has the correct format
+    sold_on = parse_sold_on(row[3], time_zone)
+    if sold_on is None:
+        return "sold_on"
+
+    # Check whether the datetime element is in the future
+    if sold_on > now:
+        return "future"
+
+    # Rows identical to an existing record are not checked here, as they are
+    # dropped by the unique constraint on Sale.dedup_key when inserted.
+
+    return row[0], quantity, int(row[2]), sold_on
+
+
+def write_sale_batch(sales, imported_rows):
+    """
+    Helper function for generate_sale_objects(). Writes a batch of unsaved
+    Sale objects, and the ImportedRow ledger entries of the rows they were
+    converted from, to the DB in a single transaction. Sales identical to an
+    existing record conflict with the unique constraint on Sale.dedup_key
+    and are skipped.
+
+    bulk_create() doesn't return which sales were skipped, so the ones that
+    were inserted are sent with sales_changed as the sales of the import
+    with a primary key above the largest one before the insert. Returns the
+    indexes in "sales" of the skipped sales, which are only looked up if
+    fewer sales were inserted than given.
+    """
+    with transaction.atomic():
+        last_pk = Sale.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+        Sale.objects.bulk_create(sales, ignore_conflicts=True)
+        ImportedRow.objects.bulk_create(imported_rows, ignore_conflicts=True)
+        added = Sale.objects.filter(
+            sale_import=sales[0].sale_import, pk__gt=last_pk
+        )
+        sales_changed.send(sender=Sale, added=added, removed=[])
+        if added.count() == len(sales):
+            return []
+        inserted = Counter(added.values_list("dedup_key", flat=True))
+
+    skipped = []
+    for i, sale in enumerate(sales):
+        if inserted[sale.dedup_key]:
+            inserted[sale.dedup_key] -= 1
+        else:
+            skipped.append(i)
+    return skipped
+
+
+class SaleBatchWriter:
+    """
+    Builds unsaved Sale objects and writes them with write_sale_batch() each
+    time "batch_size" of them have been added. Rows are counted as accepted
+    once their sale has been inserted, and as "existing_sale" rejections if
+    it was identical to an existing record. "progress", if given, is called
+    with the UploadSummary each time the writer is flushed, and by tick()
+    while rows are being parsed, so that it is also called during long runs
+    of rows that are rejected rather than written.
+    """
+
+    def __init__(
+        self, fruits, summary, sale_import, batch_size=None, progress=None
+    ):
+        if batch_size is None:
+            batch_size = settings.SALE_UPLOAD_BATCH_SIZE
+        self.fruits = fruits
+        self.summary = summary
+        self.sale_import = sale_import
+        self.batch_size = batch_size
+        self.progress = progress
+        self.reported_rows = 0
+        self.reported_on = time.monotonic()
+        self.batch = []
+        self.imported_rows = []
+        self.lines = []
+
+    def add(self, digest, line, fruit_name, quantity, proceeds, sold_on):
+        fruit = self.fruits[fruit_name]
+
+        # fruit_name is set here as bulk_create() doesn't call Sale.save()
+        self.batch.append(
+            Sale(
+                fruit=fruit,
+                fruit_name=fruit.name,
+                quantity=quantity,
+                proceeds=proceeds,
+                fruit_price_when_sold=proceeds / quantity,
+                sold_on=sold_on,
+                dedup_key=build_sale_dedup_key(
+                    fruit.name, quantity, proceeds, sold_on
+                ),
+                sale_import=self.sale_import,
+            )
+        )
+        self.imported_rows.append(
+            ImportedRow(row_hash=digest.hex(), sale_import=self.sale_import)
+        )
+        self.lines.append(line)
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            skipped = write_sale_batch(self.batch, self.imported_rows)
+            self.summary.accepted += len(self.batch) - len(skipped)
+            for i in skipped:
+                self.summary.add_rejected("existing_sale", self.lines[i])
+            self.batch = []
+            self.imported_rows = []
+            self.lines = []
+        self.report_progress()
+
+    def tick(self):
+        """
+        Calls "progress" if "batch_size" rows have been parsed or
+        PROGRESS_INTERVAL seconds have passed since it was last called,
+        whether or not any of the rows were written.
+        """
+        if (
+            self.summary.rows - self.reported_rows >= self.batch_size
+            or time.monotonic() - self.reported_on >= PROGRESS_INTERVAL
+        ):
+            self.report_progress()
+
+    def report_progress(self):
+        if self.progress:
+            self.progress(self.summary)
+        self.reported_rows = self.summary.rows
+        self.reported_on = time.monotonic()
+
+
+def track_progress(rows, writer):
+    """
+    Helper function for generate_sale_objects(). Yields the rows, calling
+    writer.tick() after each one has been taken, so that progress is reported
+    as rows are parsed even when none of them reach the writer.
+    """
+    for row in rows:
+        yield row
+        writer.tick()
+
+
+def finish_sale_import(sale_import, content_hash):
+    """
+    Records the content hash of a file once all of it has been imported, so
+    that the file is rejected if it is uploaded again.
+    """
+    if not content_hash:
+        return
+    sale_import.content_hash = content_hash
+    try:
+        with transaction.atomic():
+            sale_import.save(update_fields=["content_hash"])
+    except IntegrityError:
+        # The same file was imported at the same time by another upload, so
+        # its hash is already recorded.
+        sale_import.content_hash = None
+
+
+def delete_sale_import(sale_import):
+    """
+    Deletes a SaleImport together with the Sale objects and ImportedRow
+    ledger entries it created. Each of them is removed with a single DELETE on
+    its indexed sale_import column, without the rows being loaded into memory.
+    Returns the number of Sale objects deleted.
+    """
+    with transaction.atomic():
+        sales_changed.send(
+            sender=Sale, added=[], removed=sale_import.sales.all()
+        )
+        _, deleted = SaleImport.objects.filter(pk=sale_import.pk).delete()
+    return deleted.get(Sale._meta.label, 0)
+
+
+def generate_sale_objects(
+    file_content,
+    batch_size=None,
+    progress=None,
+    time_zone=None,
+    file_name="",
+    content_hash=None,
+    sale_import=None,
+):
+    """
+    Helper function for sale_upload().
+    Converts each row in a csv file into a Sale object and returns an
+    UploadSummary. "file_content" can be any iterable of rows, e.g. a
+    csv.reader, and is consumed lazily. Rows repeated within the file are
+    ignored. If given, "progress" is called with the UploadSummary after each
+    batch is written, and at least every SALE_UPLOAD_BATCH_SIZE rows parsed
+    or PROGRESS_INTERVAL seconds. Dates and times are read as local times in
+    "time_zone" (TIME_ZONE by default).
+
+    The upload is recorded as a SaleImport, and rows that were accepted from
+    an earlier file are skipped. "content_hash" is the hash_file_content() of
+    the file, recorded once it has been imported. If "sale_import" is given,
+    the rows are recorded under it instead of a new SaleImport, and rows
+    already recorded under it are skipped as repeats.
+
+    Sale objects are built in memory and written with bulk_create() in batches
+    of SALE_UPLOAD_BATCH_SIZE rows, each batch in its own transaction, rather
+    than being saved one at a time. The target throughput for this path is
+    10,000 rows/sec.
+    """
+    time_zone = time_zone or settings.TIME_ZONE
+    now = timezone.now()
+    summary = UploadSummary()
+    fruits = load_fruit_lookup()
+    summary.sale_import = sale_import or SaleImport.objects.create(
+        file_name=file_name
+    )
+    writer = SaleBatchWriter(
+        fruits, summary, summary.sale_import, batch_size, progress
+    )
+
+    # The csv files of a read_csv_members() stream are recorded as they are
+    # reached, so that sample lines are reported per file
+    summary.members = getattr(file_content, "members", [])
+    rows = track_progress(file_content, writer)
+    rows = unique_rows(rows, summary, time_zone)
+    rows = skip_imported_rows(rows, summary)
+    for digest, line, row in rows:
+
+        # Rows that don't pass the checks in convert_row() are ignored
+        sale = convert_row(row, fruits, time_zone, now)
+        if isinstance(sale, str):
+            summary.add_rejected(sale, line, row)
+            continue
+
+        writer.add(digest, line, *sale)
+
+    writer.flush()
+    finish_sale_import(summary.sale_import, content_hash)
+    return summary
+
+
+def dry_run_sale_objects(file_content, time_zone=None):
+    """
+    Helper function for sale_upload(). Runs the checks of
+    generate_sale_objects() on the rows in "file_content" without writing
+    anything, and returns an UploadSummary of the rows that would be accepted
+    and the reasons the others would be rejected for. Rows are looked up in
+    the ImportedRow ledger, and sales identical to an existing record found
+    by their dedup_key, LEDGER_LOOKUP_SIZE rows at a time.
+    """
+    time_zone = time_zone or settings.TIME_ZONE
+    now = timezone.now()
+    summary = UploadSummary()
+    fruits = load_fruit_lookup()
+    pending = []
+
+    # The csv files of a read_csv_members() stream are recorded as they are
+    # reached, so that sample lines are reported per file
+    summary.members = getattr(file_content, "members", [])
+    rows = unique_rows(file_content, summary, time_zone)
+    rows = skip_imported_rows(rows, summary)
+    for digest, line, row in rows:
+        sale = convert_row(row, fruits, time_zone, now)
+        if isinstance(sale, str):
+            summary.add_rejected(sale, line, row)
+            continue
+
+        pending.append((build_sale_dedup_key(*sale), line))
+        if len(pending) >= LEDGER_LOOKUP_SIZE:
+            count_new_sales(pending, summary)
+            pending = []
+
+    count_new_sales(pending, summary)
+    return summary
+
+
+def count_new_sales(sales, summary):
+    """
+    Helper function for dry_run_sale_objects(). Counts the (dedup key, line
+    number) pairs of valid rows as accepted, unless the sale is identical to
+    an existing record.
+    """
+    existing = set(
+        Sale.objects.filter(
+            dedup_key__in=[dedup_key for dedup_key, _ in sales]
+        ).values_list("dedup_key", flat=True)
+    )
+    for dedup_key, line in sales:
+        if dedup_key in existing:
+            summary.add_rejected("existing_sale", line)
+        else:
+            summary.accepted += 1
+
+
+@contextmanager
+def map_csv_file(path):
+    """
+    Memory-maps the file at "path" read-only, so that it is read through the
+    page cache rather than copied into buffers. Pages that have been read
+    can be dropped by the OS, keeping memory use flat for files of any size.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            yield mapped
+
+
+def split_csv_file(path, chunk_size):
+    """
+    Helper function for validate_csv_file(). Splits the file at "path" into
+    (start, end) byte ranges of roughly "chunk_size" bytes, each ending on a
+    line boundary. Quoted values spanning several lines are not supported.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    offsets = [0]
+    with map_csv_file(path) as f:
+        while offsets[-1] < size:
+            f.seek(min(offsets[-1] + chunk_size, size))
+            f.readline()  # Move on to the start of the next line
+            offsets.append(f.tell())
+    return list(zip(offsets, offsets[1:]))
+
+
+def read_lines(f, start, end):
+    """
+    Helper function for validate_csv_chunk(). Yields the decoded lines of a
+    binary file that start between the byte offsets "start" and "end".
+    """
+    f.seek(start)
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode("utf-8-sig")
+
+
+def validate_csv_chunk(path, start, end, fruit_names, time_zone, now):
+    """
+    Helper function for validate_csv_file(). Checks and converts the rows in
+    one byte range of a csv file. This runs in a worker process, so it only
+    gets the set of known fruit names and doesn't access the DB.
+    """
+    chunk = ValidatedChunk()
+    with map_csv_file(path) as f:
+        for row in csv.reader(read_lines(f, start, end)):
+            chunk.rows += 1
+            sale = convert_row(row, fruit_names, time_zone, now)
+            if isinstance(sale, str):
+                chunk.add_rejected(sale, chunk.rows, row)
+                continue
+            chunk.sales.append((hash_row(row, time_zone), chunk.rows, sale))
+    return chunk
+
+
+def validate_csv_file(
+    path, fruit_names, workers, time_zone=None, chunk_size=None
+):
+    """
+    Yields a ValidatedChunk for each chunk of the csv file at "path", in file
+    order. With more than one worker the chunks are validated in a process
+    pool, with at most two chunks per worker held in memory at a time.
+    """
+    time_zone = time_zone or settings.TIME_ZONE
+    chunk_size = chunk_size or settings.SALE_IMPORT_CHUNK_SIZE
+    now = timezone.now()
+    chunks = split_csv_file(path, chunk_size)
+    args = (fruit_names, time_zone, now)
+
+    if workers <= 1:
+        for start, end in chunks:
+            yield validate_csv_chunk(path, start, end, *args)
+        return
+
+    # django.setup() is needed where worker processes are spawned, not forked
+    with ProcessPoolExecutor(workers, initializer=django.setup) as executor:
+        pending = deque()
+        for start, end in chunks:
+            pending.append(
+                executor.submit(validate_csv_chunk, path, start, end, *args)
+            )
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_csv_file(
+    path,
+    workers=1,
+    batch_size=None,
+    progress=None,
+    time_zone=None,
+    file_name="",
+    content_hash=None,
+    sale_import=None,
+):
+    """
+    Alternative to generate_sale_objects() for large csv files on disk. The
+    file is split into chunks that are validated and converted in parallel
+    by validate_csv_file(), while the DB writes stay in this process.
+    Returns an UploadSummary.
+
+    Each chunk is written before the next one is read, so rows repeated from
+    an earlier chunk are found in the ImportedRow ledger and memory use
+    doesn't grow with the size of the file. "sale_import" is used as in
+    generate_sale_objects().
+    """
+    summary = UploadSummary()
+    fruits = load_fruit_lookup()
+    summary.sale_import = sale_import or SaleImport.objects.create(
+        file_name=file_name
+    )
+    writer = SaleBatchWriter(
+        fruits, summary, summary.sale_import, batch_size, progress
+    )
+
+    chunks = validate_csv_file(path, frozenset(fruits), workers, time_zone)
+    for chunk in chunks:
+        line_offset = summary.rows
+        summary.merge(chunk, line_offset)
+
+        # Rows repeated within the chunk are ignored
+        seen = set()
+        new_sales = []
+        for item in chunk.sales:
+            if item[0] in seen:
+                summary.add_rejected("duplicate", line_offset + item[1])
+                continue
+            seen.add(item[0])
+            new_sales.append(item)
+
+        for digest, line, sale in drop_imported_rows(
+            new_sales, summary, line_offset
+        ):
+            writer.add(digest, line_offset + line, *sale)
+        writer.flush()
+
+    finish_sale_import(summary.sale_import, content_hash)
+    return summary
+
+
+def read_uploaded_csv(uploaded_file):
+    """
+    Helper function for sale_upload(). Returns a csv.reader that decodes the
+    uploaded file as it is read, so the file is never saved to MEDIA_ROOT.
+    Django keeps small uploads in memory and only spools those larger than
+    FILE_UPLOAD_MAX_MEMORY_SIZE to a temporary file.
+    """
+    uploaded_file.seek(0)
+    text = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    return csv.reader(text)
+
+
+def open_upload_members(uploaded_file, name):
+    """
+    Helper function for sale_upload(). Returns a list of (name, file) pairs
+    for the csv files in an upload called "name": the file itself, the
+    decompressed stream of a ".gz" or ".bz2" file, or one stream for each csv
+    file in a ".zip" archive. Compressed content is decompressed as it is
+    read and never written to disk.
+    """
+    lower_name = name.lower()
+    uploaded_file.seek(0)
+    if lower_name.endswith(".gz"):
+        return [(name[:-3], gzip.GzipFile(fileobj=uploaded_file, mode="rb"))]
+    if lower_name.endswith(".bz2"):
+        return [(name[:-4], bz2.BZ2File(uploaded_file))]
+    if lower_name.endswith(".zip"):
+        archive = zipfile.ZipFile(uploaded_file)
+        return [
+            (info.filename, archive.open(info))
+            for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(".csv")
+        ]
+    return [(name, uploaded_file)]
+
+
+class MemberRows:
+    """
+    Iterable returned by read_csv_members(). Yields the rows of each csv file
+    of an upload in turn, from (name, rows) pairs, and records the name of
+    each file in "members" together with the number of rows before it.
+    """
+
+    def __init__(self, rows_by_member):
+        self.rows_by_member = rows_by_member
+        self.members = []
+
+    def __iter__(self):
+        count = 0
+        for name, rows in self.rows_by_member:
+            self.members.append((name, count))
+            for row in rows:
+                count += 1
+                yield row
+
+
+def read_csv_members(members, workers=None):
+    """
+    Helper function for sale_upload(). Returns the rows of the csv files from
+    open_upload_members() as a single MemberRows stream, one file after
+    another. Several members are read ahead concurrently, each in its own
+    thread with at most "workers" threads at a time.
+    """
+    if len(members) <= 1:
+        return MemberRows((name, read_uploaded_csv(f)) for name, f in members)
+    workers = workers or settings.SALE_ARCHIVE_WORKERS
+    return MemberRows(merge_member_rows(members, min(workers, len(members))))
+
+
+def merge_member_rows(members, workers):
+    """
+    Helper function for read_csv_members(). Yields (name, rows) for each
+    member in order, while the following members are read ahead in threads.
+    At most two batches of rows per member are held in memory, so a slow
+    consumer holds the threads back rather than the members being read into
+    memory.
+    """
+    member_batches = [queue.Queue(maxsize=2) for _ in members]
+    stop = threading.Event()
+
+    def put(batches, item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_member(f, batches):
+        try:
+            batch = []
+            for row in read_uploaded_csv(f):
+                batch.append(row)
+                if len(batch) >= MEMBER_BATCH_SIZE:
+                    if not put(batches, batch):
+                        return
+                    batch = []
+            put(batches, batch)
+        except Exception as e:
+            put(batches, e)
+        finally:
+            put(batches, None)
+
+    def read_batches(batches):
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    with ThreadPoolExecutor(workers) as executor:
+        for (_, f), batches in zip(members, member_batches):
+            executor.submit(read_member, f, batches)
+        try:
+            for (name, _), batches in zip(members, member_batches):
+                yield name, read_batches(batches)
+        finally:
+            stop.set()
+
+
+def run_sale_import_job(job, workers=1):
+    """
+    Imports the uploaded csv file of a claimed SaleImportJob, recording
+    progress on the job as rows are parsed so that it can be followed while
+    it runs, and so that the job isn't reclaimed by another worker. The
+    content saved in the DB is first copied to a local temporary file, which
+    is imported with import_csv_file() if there is more than one worker. The
+    saved content is deleted once the job is done or has failed.
+
+    The rows are imported under the SaleImport of the job, so when a job is
+    run again after its worker died, the rows of the batches committed by the
+    earlier run are found in the ledger and skipped rather than written again.
+    """
+
+    def record_progress(summary):
+        SaleImportJob.objects.filter(pk=job.pk).update(
+            rows_parsed=summary.rows,
+            rows_accepted=summary.accepted,
+            rows_rejected=summary.rejected,
+            heartbeat_on=timezone.now(),
+        )
+
+    if job.sale_import is None:
+        job.sale_import = SaleImport.objects.create(file_name=job.file_name)
+        job.save(update_fields=["sale_import"])
+
+    options = {
+        "progress": record_progress,
+        "time_zone": job.time_zone,
+        "file_name": job.file_name,
+        "content_hash": job.content_hash or None,
+        "sale_import": job.sale_import,
+    }
+    compressed = job.file_name.lower().endswith(COMPRESSED_EXTENSIONS)
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".csv") as f:
+            job.write_content(f)
+            f.flush()
+            if workers > 1 and not compressed:
+                summary = import_csv_file(f.name, workers, **options)
+            else:
+                members = open_upload_members(f, job.file_name)
+                rows = read_csv_members(members)
+                summary = generate_sale_objects(rows, **options)
+    except Exception as e:
+        job.status = SaleImportJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = SaleImportJob.DONE
+        job.rows_parsed = summary.rows
+        # Rows written by an earlier run of the job are counted as repeats
+        # by this one, so the accepted rows are counted from the sales
+        job.rows_accepted = job.sale_import.sales.count()
+        job.rows_rejected = summary.rows - job.rows_accepted
+        job.unknown_fruits = ", ".join(sorted(summary.unknown_fruits))
+
+    job.delete_content()
+    job.finished_on = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "error",
+            "rows_parsed",
+            "rows_accepted",
+            "rows_rejected",
+            "unknown_fruits",
+            "finished_on",
+        ]
+    )
+    return job
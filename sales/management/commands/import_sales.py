@@ -0,0 +1,122 @@
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.imports import (
+    COMPRESSED_EXTENSIONS,
+    dry_run_sale_objects,
+    generate_sale_objects,
+    hash_file_content,
+    import_csv_file,
+    open_upload_members,
+    read_csv_members,
+)
+from sales.models import SaleImport
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports sales from a csv file on disk, e.g. historical data or "
+        "nightly exports. The file is memory-mapped and read in chunks, so "
+        "files of several GB can be imported with flat memory use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the csv file to import.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.SALE_IMPORT_WORKERS,
+            help="Number of processes used to validate the file.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.SALE_UPLOAD_BATCH_SIZE,
+            help="Number of sales written per transaction.",
+        )
+        parser.add_argument(
+            "--time-zone",
+            default=settings.TIME_ZONE,
+            help="Timezone of the dates and times in the file.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Check every row and report why rows would be rejected, "
+            "without importing anything.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.isfile(path):
+            raise CommandError(f'File "{path}" does not exist.')
+
+        with open(path, "rb") as f:
+            content_hash = hash_file_content(
+                iter(lambda: f.read(1 << 20), b""), options["time_zone"]
+            )
+        if SaleImport.objects.filter(content_hash=content_hash).exists():
+            raise CommandError(f'File "{path}" has already been imported.')
+
+        def report_progress(summary):
+            self.stdout.write(
+                f"{summary.rows} rows read, {summary.accepted} sales written",
+                ending="\r",
+            )
+            self.stdout.flush()
+
+        import_options = {
+            "batch_size": options["batch_size"],
+            "progress": report_progress if options["verbosity"] > 1 else None,
+            "time_zone": options["time_zone"],
+            "file_name": os.path.basename(path),
+            "content_hash": content_hash,
+        }
+        started = time.monotonic()
+        try:
+            if options["dry_run"]:
+                with open(path, "rb") as f:
+                    members = open_upload_members(f, path)
+                    summary = dry_run_sale_objects(
+                        read_csv_members(members), options["time_zone"]
+                    )
+
+            # Compressed files are decompressed as a stream rather than split
+            # into chunks
+            elif path.lower().endswith(COMPRESSED_EXTENSIONS):
+                with open(path, "rb") as f:
+                    members = open_upload_members(f, path)
+                    summary = generate_sale_objects(
+                        read_csv_members(members), **import_options
+                    )
+            else:
+                summary = import_csv_file(
+                    path, options["workers"], **import_options
+                )
+        except UnicodeDecodeError:
+            raise CommandError(f'File "{path}" is not UTF-8 encoded.')
+        except (zipfile.BadZipFile, OSError, EOFError):
+            raise CommandError(f'File "{path}" could not be decompressed.')
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            f"Read {summary.rows} rows in {elapsed:.1f} s "
+            f"({summary.rows / elapsed if elapsed else 0:.0f} rows/sec)"
+            + (" without importing them" if options["dry_run"] else "")
+            + f"\n  accepted: {summary.accepted}"
+            + f"\n  rejected: {summary.rejected}"
+        )
+        for description, count, lines in summary.rejection_report():
+            self.stdout.write(
+                f"    {description}: {count} "
+                f"(lines {', '.join(str(line) for line in lines)})"
+            )
+        if summary.unknown_fruits:
+            self.stdout.write(
+                "Rows for the following unknown fruits were ignored: "
+                + ", ".join(sorted(summary.unknown_fruits))
+            )
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sales.imports import run_sale_import_job
+from sales.models import SaleImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued csv sale imports outside the request cycle. Several "
+        "workers can be run at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no queued jobs are left instead of polling.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when no job is queued.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.SALE_IMPORT_WORKERS,
+            help="Number of processes used to validate each csv file.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = SaleImportJob.claim_next()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            job = run_sale_import_job(job, options["workers"])
+            self.stdout.write(
+                f"Job {job.pk} ({job.file_name}): {job.status}, "
+                f"{job.rows_accepted} accepted, {job.rows_rejected} rejected, "
+                f"{job.rows_per_second} rows/sec"
+            )
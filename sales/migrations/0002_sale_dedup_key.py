@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:41
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sale",
+            name="dedup_key",
+            field=models.CharField(editable=False, max_length=40, null=True),
+        ),
+        migrations.AlterField(
+            model_name="csvuploadfile",
+            name="file_name",
+            field=models.FileField(
+                upload_to="csv_files",
+                validators=[
+                    django.core.validators.FileExtensionValidator(
+                        allowed_extensions=["csv"],
+                        message=[
+                            'Please select a file having a ".csv" file extension.'
+                        ],
+                    )
+                ],
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="sale",
+            constraint=models.UniqueConstraint(
+                fields=("dedup_key",), name="sale_unique_dedup_key"
+            ),
+        ),
+    ]
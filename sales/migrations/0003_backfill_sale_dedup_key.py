@@ -0,0 +1,66 @@
+import hashlib
+from datetime import timezone
+
+from django.db import migrations
+
+# Kept below SQLite's limit of 999 variables per query
+BATCH_SIZE = 500
+
+
+def build_sale_dedup_key(fruit_name, quantity, proceeds, sold_on):
+    # Copy of sales.models.build_sale_dedup_key() as of this migration
+    sold_on_utc = sold_on.astimezone(timezone.utc).isoformat()
+    value = f"{fruit_name}\x1f{quantity}\x1f{proceeds}\x1f{sold_on_utc}"
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def backfill_dedup_keys(apps, schema_editor):
+    """
+    Sets the dedup_key of existing sales in batches of BATCH_SIZE rows.
+    If identical sales already exist, only the oldest one is given a key and
+    the others are left as null so as not to break the unique constraint.
+    """
+    Sale = apps.get_model("sales", "Sale")
+    last_pk = 0
+
+    while True:
+        batch = list(
+            Sale.objects.filter(pk__gt=last_pk, dedup_key__isnull=True)
+            .order_by("pk")
+            .only("fruit_name", "quantity", "proceeds", "sold_on")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        keyed_sales = {}
+        for sale in batch:
+            key = build_sale_dedup_key(
+                sale.fruit_name, sale.quantity, sale.proceeds, sale.sold_on
+            )
+            keyed_sales.setdefault(key, sale)
+
+        taken = set(
+            Sale.objects.filter(dedup_key__in=keyed_sales).values_list(
+                "dedup_key", flat=True
+            )
+        )
+        updated = []
+        for key, sale in keyed_sales.items():
+            if key not in taken:
+                sale.dedup_key = key
+                updated.append(sale)
+        Sale.objects.bulk_update(updated, ["dedup_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0002_sale_dedup_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_dedup_keys, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0003_backfill_sale_dedup_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SaleImportJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_name", models.CharField(max_length=255)),
+                ("content", models.BinaryField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="queued",
+                        max_length=10,
+                    ),
+                ),
+                ("rows_parsed", models.PositiveIntegerField(default=0)),
+                ("rows_accepted", models.PositiveIntegerField(default=0)),
+                ("rows_rejected", models.PositiveIntegerField(default=0)),
+                ("unknown_fruits", models.TextField(blank=True)),
+                ("error", models.TextField(blank=True)),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("started_on", models.DateTimeField(blank=True, null=True)),
+                ("finished_on", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "sale import job",
+                "verbose_name_plural": "sale import jobs",
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0004_saleimportjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="saleimportjob",
+            name="time_zone",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
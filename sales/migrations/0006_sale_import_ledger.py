@@ -0,0 +1,67 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0005_saleimportjob_time_zone"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SaleImport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_name", models.CharField(blank=True, max_length=255)),
+                (
+                    "content_hash",
+                    models.CharField(
+                        blank=True, max_length=64, null=True, unique=True
+                    ),
+                ),
+                ("imported_on", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "sale import",
+                "verbose_name_plural": "sale imports",
+            },
+        ),
+        migrations.CreateModel(
+            name="ImportedRow",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("row_hash", models.CharField(max_length=32, unique=True)),
+                (
+                    "sale_import",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="imported_rows",
+                        to="sales.saleimport",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "imported row",
+                "verbose_name_plural": "imported rows",
+            },
+        ),
+    ]
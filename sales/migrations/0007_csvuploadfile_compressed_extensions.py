@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0006_sale_import_ledger"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="csvuploadfile",
+            name="file_name",
+            field=models.FileField(
+                upload_to="csv_files",
+                validators=[
+                    django.core.validators.FileExtensionValidator(
+                        allowed_extensions=["csv", "gz", "bz2", "zip"],
+                        message=[
+                            'Please select a file having a ".csv", ".csv.gz", ".bz2" or ".zip" file extension.'
+                        ],
+                    )
+                ],
+            ),
+        ),
+    ]
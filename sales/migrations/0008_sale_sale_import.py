@@ -0,0 +1,26 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0007_csvuploadfile_compressed_extensions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sale",
+            name="sale_import",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="sales",
+                to="sales.saleimport",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import sales.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0008_sale_sale_import"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="sale",
+            name="sold_on",
+            field=models.DateTimeField(
+                db_index=True,
+                validators=[sales.models.reject_future_date_time],
+            ),
+        ),
+    ]
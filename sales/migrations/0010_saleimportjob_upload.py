@@ -0,0 +1,79 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_content_to_upload(apps, schema_editor):
+    """
+    Saves the content of existing jobs to the default storage, and records
+    its hash as the upload view does.
+    """
+    SaleImportJob = apps.get_model("sales", "SaleImportJob")
+    for job in SaleImportJob.objects.exclude(content=b"").iterator():
+        content = bytes(job.content)
+        # Copy of sales.imports.hash_file_content() as of this migration
+        sha256 = hashlib.sha256(content)
+        sha256.update(b"\x1f" + (job.time_zone or settings.TIME_ZONE).encode())
+        job.content_hash = sha256.hexdigest()
+        job.upload.save(job.file_name, ContentFile(content), save=False)
+        job.save(update_fields=["upload", "content_hash"])
+
+
+def move_upload_to_content(apps, schema_editor):
+    SaleImportJob = apps.get_model("sales", "SaleImportJob")
+    for job in SaleImportJob.objects.exclude(upload="").iterator():
+        with job.upload.open("rb") as upload:
+            job.content = upload.read()
+        job.save(update_fields=["content"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0009_sale_sold_on_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="saleimportjob",
+            name="upload",
+            field=models.FileField(default="", upload_to="sale_import_jobs"),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="saleimportjob",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="saleimportjob",
+            name="sale_import",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="jobs",
+                to="sales.saleimport",
+            ),
+        ),
+        migrations.AddField(
+            model_name="saleimportjob",
+            name="heartbeat_on",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(move_content_to_upload, move_upload_to_content),
+        # Given a default so that the field can be added back to existing
+        # rows when the migration is reversed
+        migrations.AlterField(
+            model_name="saleimportjob",
+            name="content",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.RemoveField(
+            model_name="saleimportjob",
+            name="content",
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copy of SaleImportJobChunk.SIZE as of this migration
+CHUNK_SIZE = 1024 * 1024
+
+
+def move_upload_to_chunks(apps, schema_editor):
+    """
+    Saves the uploaded file of each job in the DB, and deletes the file.
+    """
+    SaleImportJob = apps.get_model("sales", "SaleImportJob")
+    SaleImportJobChunk = apps.get_model("sales", "SaleImportJobChunk")
+    for job in SaleImportJob.objects.exclude(upload="").iterator():
+        if job.upload.storage.exists(job.upload.name):
+            with job.upload.open("rb") as upload:
+                for data in upload.chunks(CHUNK_SIZE):
+                    SaleImportJobChunk.objects.create(job=job, data=data)
+        job.upload.delete(save=False)
+
+
+def move_chunks_to_upload(apps, schema_editor):
+    SaleImportJob = apps.get_model("sales", "SaleImportJob")
+    for job in SaleImportJob.objects.filter(chunks__isnull=False).distinct():
+        data = b"".join(
+            bytes(chunk)
+            for chunk in job.chunks.order_by("pk").values_list(
+                "data", flat=True
+            )
+        )
+        job.upload.save(job.file_name, ContentFile(data), save=False)
+        job.save(update_fields=["upload"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0010_saleimportjob_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SaleImportJobChunk",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="sales.saleimportjob",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "sale import job chunk",
+                "verbose_name_plural": "sale import job chunks",
+            },
+        ),
+        migrations.RunPython(move_upload_to_chunks, move_chunks_to_upload),
+        # Given a default so that the field can be added back to existing
+        # rows when the migration is reversed
+        migrations.AlterField(
+            model_name="saleimportjob",
+            name="upload",
+            field=models.FileField(default="", upload_to="sale_import_jobs"),
+        ),
+        migrations.RemoveField(
+            model_name="saleimportjob",
+            name="upload",
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.validators import (
@@ -8,6 +12,7 @@ from django.core.validators import (
 )
 
 from stock.models import Fruit
+from .signals import sales_changed
 
 
 def reject_future_date_time(value):
@@ -19,6 +24,18 @@ def reject_future_date_time(value):
         raise ValidationError("Future dates are not accepted.")
 
 
+def build_sale_dedup_key(fruit_name, quantity, proceeds, sold_on):
+    """
+    Returns the value stored in the "dedup_key" field of the Sale model.
+    Identical sale records (same fruit, quantity, proceeds and sale date and
+    time) always have the same key. sold_on is converted to UTC so that the
+    key doesn't depend on the timezone it was entered in.
+    """
+    sold_on_utc = sold_on.astimezone(dt_timezone.utc).isoformat()
+    value = f"{fruit_name}\x1f{quantity}\x1f{proceeds}\x1f{sold_on_utc}"
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
 class Sale(models.Model):
 
     # on_delete=models.SET_NULL is used to ensure that this Sale object is not
@@ -45,20 +62,111 @@ class Sale(models.Model):
     proceeds = models.PositiveIntegerField(blank=True, null=True)
 
     # Includes a custom validator to ensure that future dates are not entered.
-    sold_on = models.DateTimeField(validators=[reject_future_date_time])
+    # Indexed for the date range queries of the stats reports.
+    sold_on = models.DateTimeField(
+        validators=[reject_future_date_time], db_index=True
+    )
+
+    # Used to reject identical sale records with a unique constraint rather
+    # than checking for an existing record before each insert. Set in save().
+    # Null only for duplicates that existed before the constraint was added.
+    dedup_key = models.CharField(max_length=40, null=True, editable=False)
+
+    # The csv upload this Sale object was created by, if any, so that a whole
+    # upload can be listed or deleted through the index on this column.
+    sale_import = models.ForeignKey(
+        "SaleImport",
+        related_name="sales",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = "sale"
         verbose_name_plural = "sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"], name="sale_unique_dedup_key"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.fruit}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so that save() can send the previous values with sales_changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_saved_copy(self):
+        """
+        Returns an unsaved Sale object with the values this Sale object was
+        loaded with, or None if it wasn't loaded from the DB. Values of fields
+        that were deferred when it was loaded, e.g. with only(), are fetched
+        from the DB.
+        """
+        values = getattr(self, "_loaded_values", None)
+        if values is None:
+            return None
+        missing = [
+            name
+            for name in ["fruit_name", "quantity", "proceeds", "sold_on"]
+            if name not in values
+        ]
+        if missing:
+            saved = Sale.objects.filter(pk=self.pk).values(*missing).first()
+            if saved is None:
+                return None
+            values = {**values, **saved}
+        return Sale(
+            fruit_name=values["fruit_name"],
+            quantity=values["quantity"],
+            proceeds=values["proceeds"],
+            sold_on=values["sold_on"],
+        )
+
     def save(self, *args, **kwargs):
         # Only executed when the Sale object is created, not when updated.
         if self._state.adding is True:
             self.fruit_name = self.fruit.name
-        super(Sale, self).save(*args, **kwargs)
+        previous = None if self._state.adding else self.get_saved_copy()
+        # Raises IntegrityError if an identical sale record already exists.
+        # Only recomputed if the sale changed, so that duplicates left without
+        # a key by the 0003 migration can be saved with their other changes.
+        dedup_key = build_sale_dedup_key(
+            self.fruit_name, self.quantity, self.proceeds, self.sold_on
+        )
+        if previous is None or dedup_key != build_sale_dedup_key(
+            previous.fruit_name,
+            previous.quantity,
+            previous.proceeds,
+            previous.sold_on,
+        ):
+            self.dedup_key = dedup_key
+        with transaction.atomic():
+            super(Sale, self).save(*args, **kwargs)
+            sales_changed.send(
+                sender=Sale,
+                added=[self],
+                removed=[previous] if previous else [],
+            )
+        self._loaded_values = {
+            "fruit_name": self.fruit_name,
+            "quantity": self.quantity,
+            "proceeds": self.proceeds,
+            "sold_on": self.sold_on,
+        }
+
+    def delete(self, *args, **kwargs):
+        removed = self.get_saved_copy() or self
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            sales_changed.send(sender=Sale, added=[], removed=[removed])
+        return deleted
 
     def retrieve_fruit_price(self):
         self.fruit_price_when_sold = self.fruit.price
@@ -75,9 +183,13 @@ class CsvUploadFile(models.Model):
             FileExtensionValidator(
                 allowed_extensions=[
                     "csv",
+                    "gz",
+                    "bz2",
+                    "zip",
                 ],
                 message=[
-                    'Please select a file having a ".csv" file extension.'
+                    'Please select a file having a ".csv", ".csv.gz", ".bz2" '
+                    'or ".zip" file extension.'
                 ],
             )
         ],
@@ -97,3 +209,192 @@ class CsvUploadFile(models.Model):
     def delete(self, *args, **kwargs):
         self.file_name.delete()
         super().delete(*args, **kwargs)
+
+
+class SaleImport(models.Model):
+
+    file_name = models.CharField(max_length=255, blank=True)
+
+    # SHA-256 of the file content, set once the whole file has been imported
+    # so that the same file is rejected if it is uploaded again.
+    content_hash = models.CharField(
+        max_length=64, unique=True, blank=True, null=True
+    )
+
+    imported_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "sale import"
+        verbose_name_plural = "sale imports"
+
+    def __str__(self):
+        return f"{self.file_name}"
+
+
+class ImportedRow(models.Model):
+
+    # Digest of an accepted csv row and the timezone it was read in (see
+    # sales.imports.hash_row()), so that rows already imported from an
+    # earlier file are skipped.
+    row_hash = models.CharField(max_length=32, unique=True)
+
+    sale_import = models.ForeignKey(
+        SaleImport, related_name="imported_rows", on_delete=models.CASCADE
+    )
+
+    class Meta:
+        verbose_name = "imported row"
+        verbose_name_plural = "imported rows"
+
+    def __str__(self):
+        return f"{self.row_hash}"
+
+
+class SaleImportJob(models.Model):
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    file_name = models.CharField(max_length=255)
+
+    # hash_file_content() of the upload, recorded on the SaleImport once all
+    # of the file has been imported.
+    content_hash = models.CharField(max_length=64, blank=True)
+
+    # Timezone the dates and times in the csv file are read in. TIME_ZONE is
+    # used if blank.
+    time_zone = models.CharField(max_length=64, blank=True)
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True
+    )
+
+    # Progress counts, updated after each batch of rows is written.
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_accepted = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+
+    unknown_fruits = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    # SaleImport the rows are imported under. Each batch is committed
+    # together with its ImportedRow ledger entries, so a job that is run
+    # again after its worker died skips the rows of the committed batches.
+    sale_import = models.ForeignKey(
+        SaleImport,
+        related_name="jobs",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+
+    created_on = models.DateTimeField(auto_now_add=True)
+    started_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+
+    # Updated when the job is claimed and after each batch. Running jobs
+    # without a heartbeat for SALE_IMPORT_JOB_TIMEOUT seconds are taken to
+    # have lost their worker, and can be claimed again.
+    heartbeat_on = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "sale import job"
+        verbose_name_plural = "sale import jobs"
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Marks the oldest queued or stale job as running and returns it, or
+        returns None if there is none. A running job is stale if its heartbeat
+        is older than SALE_IMPORT_JOB_TIMEOUT seconds. The status is changed
+        with a conditional UPDATE, so when several workers race for the same
+        job only one of them gets it and the others move on to the next one.
+        """
+        while True:
+            now = timezone.now()
+            stale = now - timedelta(seconds=settings.SALE_IMPORT_JOB_TIMEOUT)
+            claimable = models.Q(status=cls.QUEUED) | models.Q(
+                status=cls.RUNNING, heartbeat_on__lt=stale
+            )
+            pk = (
+                cls.objects.filter(claimable)
+                .order_by("created_on", "pk")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if pk is None:
+                return None
+            claimed = cls.objects.filter(claimable, pk=pk).update(
+                status=cls.RUNNING, started_on=now, heartbeat_on=now
+            )
+            if claimed:
+                return cls.objects.get(pk=pk)
+
+    def save_content(self, chunks):
+        """
+        Saves the uploaded csv content, given as an iterable of bytes, e.g.
+        UploadedFile.chunks(), as SaleImportJobChunk objects one chunk at a
+        time, so that the whole file is never held in memory.
+        """
+        for data in chunks:
+            SaleImportJobChunk.objects.create(job=self, data=data)
+
+    def write_content(self, f):
+        """
+        Writes the saved csv content to the file object "f", fetching one
+        chunk from the DB at a time.
+        """
+        chunks = (
+            self.chunks.order_by("pk")
+            .values_list("data", flat=True)
+            .iterator(chunk_size=1)
+        )
+        for data in chunks:
+            f.write(data)
+
+    def delete_content(self):
+        self.chunks.all().delete()
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def rows_per_second(self):
+        if self.started_on is None:
+            return 0
+        end = self.finished_on or timezone.now()
+        seconds = (end - self.started_on).total_seconds()
+        if seconds <= 0:
+            return 0
+        return round(self.rows_parsed / seconds)
+
+
+class SaleImportJobChunk(models.Model):
+
+    # Size in bytes of the chunks the content of an upload is saved in
+    SIZE = 1024 * 1024
+
+    # The uploaded csv content is kept in the DB rather than on disk so that
+    # workers on other nodes can run the job without a shared media volume,
+    # and so that it is never served from MEDIA_URL. It is split into chunks
+    # so that it is neither written nor read all at once.
+    job = models.ForeignKey(
+        SaleImportJob, related_name="chunks", on_delete=models.CASCADE
+    )
+    data = models.BinaryField()
+
+    class Meta:
+        verbose_name = "sale import job chunk"
+        verbose_name_plural = "sale import job chunks"
@@ -0,0 +1,9 @@
+import django.dispatch
+
+# Sent when sales are written, with "added" and "removed" sales as a list of
+# Sale objects or a queryset, so that derived data such as the daily rollup
+# in the stats app can be updated in the same transaction. An update is sent
+# as the sale with its previous values removed and with its new values added.
+# Sent explicitly by the write paths rather than with post_save/post_delete,
+# as those would stop Django from deleting whole imports with one query.
+sales_changed = django.dispatch.Signal()
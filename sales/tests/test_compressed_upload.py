@@ -0,0 +1,156 @@
+import io
+import bz2
+import gzip
+import zipfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.test import TestCase
+
+from stock.models import Fruit
+from users.models import CustomUser
+from sales.models import Sale
+from sales.imports import (
+    dry_run_sale_objects,
+    open_upload_members,
+    read_csv_members,
+)
+
+
+def build_zip(members):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return content.getvalue()
+
+
+class CompressedUploadTests(TestCase):
+    def setUp(self):
+        Fruit.objects.create(name="lemon", price=100)
+        Fruit.objects.create(name="apple", price=90)
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        self.csv_content = (
+            "lemon,2,200,2020-04-01 00:00\r\n"
+            "apple,1,90,2020-04-01 00:00\r\n"
+        ).encode("utf-8")
+
+    def upload(self, name, content):
+        csv_file = SimpleUploadedFile(name, content)
+        return self.client.post(
+            reverse("sale_upload"), {"file_name": csv_file}
+        )
+
+    def test_upload_of_gzip_file(self):
+        response = self.upload("sales.csv.gz", gzip.compress(self.csv_content))
+        self.assertRedirects(response, reverse("sale_list"))
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_upload_of_bz2_file(self):
+        response = self.upload("sales.csv.bz2", bz2.compress(self.csv_content))
+        self.assertRedirects(response, reverse("sale_list"))
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_upload_of_zip_file_merges_members(self):
+        content = build_zip(
+            {
+                "register1.csv": self.csv_content,
+                "register2.csv": "lemon,5,500,2020-04-02 00:00\r\n"
+                "lemon,2,200,2020-04-01 00:00\r\n",
+                "readme.txt": "Not a csv file",
+            }
+        )
+        response = self.upload("sales.zip", content)
+        self.assertRedirects(response, reverse("sale_list"))
+        # The sale repeated in both members is only imported once
+        self.assertEqual(Sale.objects.count(), 3)
+
+    def test_upload_of_invalid_archive_fails(self):
+        response = self.upload("sales.csv.gz", self.csv_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response,
+            "form",
+            "file_name",
+            "The file could not be decompressed. Please select a valid "
+            "archive containing CSV files.",
+        )
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_upload_of_unsupported_extension_fails(self):
+        response = self.upload("sales.txt", self.csv_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_read_csv_members_reads_members_concurrently(self):
+        members = {
+            f"register{i}.csv": "".join(
+                f"apple,{i},90,2020-04-01 00:{m:02d}\r\n" for m in range(60)
+            )
+            for i in range(1, 6)
+        }
+        content = io.BytesIO(build_zip(members))
+        rows = list(
+            read_csv_members(
+                open_upload_members(content, "sales.zip"), workers=3
+            )
+        )
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(
+            sorted(rows),
+            sorted(
+                [
+                    ["apple", str(i), "90", f"2020-04-01 00:{m:02d}"]
+                    for i in range(1, 6)
+                    for m in range(60)
+                ]
+            ),
+        )
+
+    def test_read_csv_members_reads_members_in_order(self):
+        members = {
+            f"register{i}.csv": "".join(
+                f"apple,{i},90,2020-04-01 00:{m:02d}\r\n" for m in range(1500)
+            )
+            for i in range(1, 4)
+        }
+        content = io.BytesIO(build_zip(members))
+        rows = read_csv_members(
+            open_upload_members(content, "sales.zip"), workers=3
+        )
+        self.assertEqual(
+            [row[1] for row in rows],
+            ["1"] * 1500 + ["2"] * 1500 + ["3"] * 1500,
+        )
+        self.assertEqual(
+            rows.members,
+            [
+                ("register1.csv", 0),
+                ("register2.csv", 1500),
+                ("register3.csv", 3000),
+            ],
+        )
+
+    def test_sample_lines_of_zip_file_name_their_member(self):
+        content = build_zip(
+            {
+                "register1.csv": self.csv_content,
+                "register2.csv": "lemon,x,500,2020-04-02 00:00\r\n"
+                "banana,1,90,2020-04-02 00:00\r\n"
+                "lemon,2,200,2020-04-01 00:00\r\n",
+            }
+        )
+        members = open_upload_members(io.BytesIO(content), "sales.zip")
+        summary = dry_run_sale_objects(read_csv_members(members))
+        self.assertEqual(
+            sorted(summary.rejection_report()),
+            [
+                ("Quantity is not a whole number", 1, ["register2.csv:1"]),
+                (
+                    "Repeat of an earlier row in the file",
+                    1,
+                    ["register2.csv:3"],
+                ),
+                ("Unknown fruit", 1, ["register2.csv:2"]),
+            ],
+        )
@@ -0,0 +1,65 @@
+import os
+import tempfile
+from io import StringIO
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from stock.models import Fruit
+from sales.models import Sale, SaleImport
+
+
+class ImportSalesCommandTests(TestCase):
+    def setUp(self):
+        Fruit.objects.create(name="apple", price=90)
+        Fruit.objects.create(name="lemon", price=100)
+        rows = [f"apple,1,90,2020-01-01 10:{m:02d}" for m in range(60)]
+        rows += ["lemon,2,200,2020-01-02 10:00"] * 2
+        rows += ["banana,2,200,2020-01-02 10:00", "lemon,x,200,2020-01-02"]
+        f = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        f.write("\n".join(rows) + "\n")
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_import_sales_writes_sales_and_prints_summary(self):
+        out = StringIO()
+        with self.settings(SALE_IMPORT_CHUNK_SIZE=500):
+            call_command(
+                "import_sales", self.path, "--batch-size=25", stdout=out
+            )
+        self.assertEqual(Sale.objects.count(), 61)
+        output = out.getvalue()
+        self.assertIn("Read 64 rows", output)
+        self.assertIn("rows/sec", output)
+        self.assertIn("accepted: 61", output)
+        self.assertIn("rejected: 3", output)
+        self.assertIn("Unknown fruit: 1 (lines 63)", output)
+        self.assertIn("Quantity is not a whole number: 1 (lines 64)", output)
+        self.assertIn(
+            "Repeat of an earlier row in the file: 1 (lines 62)", output
+        )
+        self.assertIn("unknown fruits were ignored: banana", output)
+        self.assertEqual(
+            SaleImport.objects.get().file_name, os.path.basename(self.path)
+        )
+
+    def test_import_sales_rejects_file_imported_before(self):
+        call_command("import_sales", self.path, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "already been imported"):
+            call_command("import_sales", self.path, stdout=StringIO())
+        self.assertEqual(Sale.objects.count(), 61)
+
+    def test_import_sales_dry_run_writes_nothing(self):
+        out = StringIO()
+        call_command("import_sales", self.path, "--dry-run", stdout=out)
+        self.assertIn("without importing them", out.getvalue())
+        self.assertIn("accepted: 61", out.getvalue())
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(SaleImport.objects.count(), 0)
+
+    def test_import_sales_with_missing_file(self):
+        with self.assertRaisesMessage(CommandError, "does not exist"):
+            call_command("import_sales", self.path + ".missing")
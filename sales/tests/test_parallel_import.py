@@ -0,0 +1,75 @@
+import os
+import tempfile
+from io import StringIO
+from django.test import TestCase
+from django.core.management import call_command
+
+from stock.models import Fruit
+from sales.models import Sale, SaleImportJob
+from sales.imports import import_csv_file, split_csv_file
+
+
+class ParallelImportTests(TestCase):
+    def setUp(self):
+        Fruit.objects.create(name="apple", price=90)
+        Fruit.objects.create(name="lemon", price=100)
+        rows = [
+            f"apple,1,90,2020-01-01 {h:02d}:{m:02d}"
+            for h in range(24)
+            for m in range(60)
+        ]
+        rows += ["lemon,2,200,2020-01-02 10:00"] * 3
+        rows += ["banana,2,200,2020-01-02 10:00", "lemon,x,200,2020-01-02"]
+        self.content = "\n".join(rows) + "\n"
+        f = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        f.write(self.content)
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_split_csv_file_ends_chunks_on_line_boundaries(self):
+        chunks = split_csv_file(self.path, 1000)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(self.content.encode()))
+        content = self.content.encode()
+        for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(content[end - 1 : end], b"\n")
+
+    def test_import_csv_file_with_several_workers(self):
+        with self.settings(SALE_IMPORT_CHUNK_SIZE=1000):
+            summary = import_csv_file(self.path, workers=2)
+        self.assertEqual(summary.rows, 1445)
+        self.assertEqual(summary.accepted, 1441)
+        self.assertEqual(summary.duplicates, 2)
+        self.assertEqual(summary.rejected, 4)
+        self.assertEqual(summary.unknown_fruits, {"banana"})
+        self.assertEqual(Sale.objects.count(), 1441)
+        self.assertEqual(Sale.objects.filter(fruit_name="lemon").count(), 1)
+
+    def test_import_csv_file_matches_single_worker(self):
+        with self.settings(SALE_IMPORT_CHUNK_SIZE=1000):
+            summary = import_csv_file(self.path, workers=1)
+        self.assertEqual(summary.rows, 1445)
+        self.assertEqual(summary.accepted, 1441)
+        self.assertEqual(Sale.objects.count(), 1441)
+
+    def test_process_sale_imports_command_with_several_workers(self):
+        job = SaleImportJob.objects.create(file_name="sales.csv")
+        # Saved in several chunks, as larger uploads are
+        content = self.content.encode()
+        job.save_content([content[:1000], content[1000:]])
+        with self.settings(SALE_IMPORT_CHUNK_SIZE=1000):
+            call_command(
+                "process_sale_imports",
+                "--once",
+                "--workers=2",
+                stdout=StringIO(),
+            )
+        job.refresh_from_db()
+        self.assertEqual(job.status, SaleImportJob.DONE)
+        self.assertEqual(job.rows_accepted, 1441)
+        self.assertEqual(Sale.objects.count(), 1441)
@@ -1,4 +1,6 @@
+from unittest import mock
 from datetime import datetime
+from django.db import IntegrityError
 from django.urls import reverse
 from django.test import TestCase
 from django.utils import timezone
@@ -60,6 +62,25 @@ class SaleCreateViewTests(TestCase):
         )
         self.assertEqual(Sale.objects.count(), 1)
 
+    def test_sale_create_view_doesnt_hide_other_integrity_errors(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        apple = Fruit.objects.create(name="apple", price=100)
+        with mock.patch(
+            "stats.rollups.apply_rollup_changes",
+            side_effect=IntegrityError("rollup"),
+        ):
+            with self.assertRaisesMessage(IntegrityError, "rollup"):
+                self.client.post(
+                    reverse("sale_create"),
+                    {
+                        "fruit": apple.id,
+                        "quantity": 10,
+                        "sold_on": timezone.now(),
+                    },
+                )
+        self.assertEqual(Sale.objects.count(), 0)
+
     @freeze_time("2021-01-01 00:00")
     def test_sale_create_view_time_edge_case(self):
         user = CustomUser.objects.create_user("testuser", "123456")
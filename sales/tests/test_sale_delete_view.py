@@ -5,6 +5,7 @@ from django.utils import timezone
 from stock.models import Fruit
 from users.models import CustomUser
 from sales.models import Sale
+from stats.models import DailyFruitSales
 
 
 class SaleDeleteViewTests(TestCase):
@@ -23,3 +24,29 @@ class SaleDeleteViewTests(TestCase):
             post_response, reverse("sale_list"), status_code=302
         )
         self.assertEqual(Sale.objects.count(), 0)
+
+    def test_sale_admin_delete_selected_action_updates_stats(self):
+        user = CustomUser.objects.create_superuser("admin", "a@b.c", "123456")
+        self.client.force_login(user=user)
+        apple = Fruit.objects.create(name="apple", price=90)
+        sold_on = timezone.now()
+        sales = [
+            Sale.objects.create(
+                fruit=apple, quantity=2, proceeds=180, sold_on=sold_on
+            ),
+            Sale.objects.create(
+                fruit=apple, quantity=3, proceeds=270, sold_on=sold_on
+            ),
+        ]
+        self.assertEqual(DailyFruitSales.objects.get().quantity, 5)
+        response = self.client.post(
+            reverse("admin:sales_sale_changelist"),
+            {
+                "action": "delete_selected",
+                "_selected_action": [sales[0].pk],
+                "post": "yes",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(DailyFruitSales.objects.get().quantity, 3)
@@ -0,0 +1,93 @@
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from stock.models import Fruit
+from users.models import CustomUser
+from sales.models import Sale, SaleImport, ImportedRow
+from sales.imports import generate_sale_objects, delete_sale_import
+
+
+class SaleImportDeleteViewTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=self.user)
+        self.apple = Fruit.objects.create(name="apple", price=90)
+        rows = [
+            ["apple", "1", "90", f"2020-01-01 10:{m:02d}"] for m in range(60)
+        ]
+        self.summary = generate_sale_objects(rows, file_name="first.csv")
+        generate_sale_objects(
+            [["apple", "2", "180", "2020-01-02 10:00"]], file_name="second.csv"
+        )
+        Sale.objects.create(
+            fruit=self.apple, quantity=3, proceeds=270, sold_on=timezone.now()
+        )
+
+    def test_uploaded_sales_refer_to_their_import(self):
+        sale_import = self.summary.sale_import
+        self.assertEqual(sale_import.sales.count(), 60)
+        self.assertEqual(Sale.objects.filter(sale_import=None).count(), 1)
+
+    def test_sale_import_list_view(self):
+        response = self.client.get(reverse("sale_import_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "sales/sale_import_list.html")
+        self.assertContains(response, "first.csv")
+        self.assertContains(response, "second.csv")
+        sale_counts = {
+            sale_import.file_name: sale_import.sale_count
+            for sale_import in response.context["sale_imports"]
+        }
+        self.assertEqual(sale_counts, {"first.csv": 60, "second.csv": 1})
+
+    def test_sale_import_delete_view(self):
+        response = self.client.post(
+            reverse("sale_import_delete", args=(self.summary.sale_import.pk,)),
+            follow=True,
+        )
+        self.assertRedirects(
+            response, reverse("sale_import_list"), status_code=302
+        )
+        self.assertContains(response, "60 sales imported from")
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(SaleImport.objects.count(), 1)
+        self.assertEqual(ImportedRow.objects.count(), 1)
+
+    def test_sale_import_delete_view_only_deletes_on_post(self):
+        self.client.get(
+            reverse("sale_import_delete", args=(self.summary.sale_import.pk,))
+        )
+        self.assertEqual(Sale.objects.count(), 62)
+
+    def test_delete_sale_import_does_not_load_sales(self):
+        queries = []
+
+        def log_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(log_query):
+            deleted = delete_sale_import(self.summary.sale_import)
+        self.assertEqual(deleted, 60)
+        # Sales and ledger rows are deleted in one statement each, without
+        # selecting them first. The sales are only read grouped by day, hour
+        # and fruit, to take them off the rollups.
+        selects = [
+            sql
+            for sql in queries
+            if sql.startswith("SELECT") and 'FROM "sales_sale" ' in sql
+        ]
+        self.assertEqual(len(selects), 1)
+        self.assertIn("GROUP BY", selects[0])
+        deletes = [sql for sql in queries if sql.startswith("DELETE")]
+        self.assertEqual(len(deletes), 5)
+
+    def test_deleted_file_can_be_uploaded_again(self):
+        rows = [["apple", "5", "450", "2020-01-03 10:00"]]
+        summary = generate_sale_objects(rows, content_hash="abc")
+        delete_sale_import(summary.sale_import)
+        summary = generate_sale_objects(rows, content_hash="abc")
+        self.assertEqual(summary.accepted, 1)
+        self.assertEqual(summary.sale_import.content_hash, "abc")
@@ -0,0 +1,163 @@
+from io import BytesIO, StringIO
+from datetime import timedelta
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from stock.models import Fruit
+from users.models import CustomUser
+from sales.imports import generate_sale_objects
+from sales.models import Sale, SaleImport, SaleImportJob
+
+CSV_CONTENT = (
+    "apple,3,270,2021-02-01 10:00\n"
+    "lemon,4,400,2021-02-02 10:05\n"
+    "banana,5,550,2021-02-03 10:10\n"
+    "apple,3,270,2021-02-01 10:00\n"
+)
+
+
+class SaleImportJobTests(TestCase):
+    def setUp(self):
+        Fruit.objects.create(name="apple", price=90)
+        Fruit.objects.create(name="lemon", price=100)
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+
+    def create_job(self, file_name="sales.csv", content=CSV_CONTENT.encode()):
+        job = SaleImportJob.objects.create(file_name=file_name)
+        job.save_content([content])
+        return job
+
+    @override_settings(SALE_UPLOAD_BACKGROUND_THRESHOLD=10)
+    def test_large_upload_is_queued_as_job(self):
+        with open("sales/tests/test_sales.csv", "r") as csv_file:
+            response = self.client.post(
+                reverse("sale_upload"), {"file_name": csv_file}
+            )
+        job = SaleImportJob.objects.get()
+        self.assertRedirects(
+            response, reverse("sale_import_job", args=[job.pk])
+        )
+        self.assertEqual(job.status, SaleImportJob.QUEUED)
+        self.assertEqual(job.file_name, "test_sales.csv")
+        self.assertEqual(Sale.objects.count(), 0)
+        # The content is kept in the DB rather than under MEDIA_ROOT
+        content = BytesIO()
+        job.write_content(content)
+        with open("sales/tests/test_sales.csv", "rb") as csv_file:
+            self.assertEqual(content.getvalue(), csv_file.read())
+        self.assertEqual(len(job.content_hash), 64)
+
+    def test_small_upload_is_not_queued(self):
+        with open("sales/tests/test_sales.csv", "r") as csv_file:
+            self.client.post(reverse("sale_upload"), {"file_name": csv_file})
+        self.assertFalse(SaleImportJob.objects.exists())
+
+    def test_claim_next_does_not_return_same_job_twice(self):
+        first = self.create_job("first.csv")
+        second = self.create_job("second.csv")
+        self.assertEqual(SaleImportJob.claim_next(), first)
+        self.assertEqual(SaleImportJob.claim_next(), second)
+        self.assertIsNone(SaleImportJob.claim_next())
+        first.refresh_from_db()
+        self.assertEqual(first.status, SaleImportJob.RUNNING)
+        self.assertIsNotNone(first.started_on)
+
+    def test_claim_next_reclaims_stale_running_jobs(self):
+        first = self.create_job("first.csv")
+        second = self.create_job("second.csv")
+        self.assertEqual(SaleImportJob.claim_next(), first)
+        self.assertEqual(SaleImportJob.claim_next(), second)
+
+        # The worker of the first job stopped recording progress
+        SaleImportJob.objects.filter(pk=first.pk).update(
+            heartbeat_on=timezone.now() - timedelta(seconds=601)
+        )
+        SaleImportJob.objects.filter(pk=second.pk).update(
+            heartbeat_on=timezone.now() - timedelta(seconds=599)
+        )
+        self.assertEqual(SaleImportJob.claim_next(), first)
+        self.assertIsNone(SaleImportJob.claim_next())
+
+    def test_rerun_job_skips_rows_of_committed_batches(self):
+        job = self.create_job()
+        job.sale_import = SaleImport.objects.create(file_name="sales.csv")
+        job.save()
+        # The first row was written by an earlier run before its worker died
+        generate_sale_objects(
+            [["apple", "3", "270", "2021-02-01 10:00"]],
+            sale_import=job.sale_import,
+        )
+        call_command("process_sale_imports", "--once", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, SaleImportJob.DONE)
+        self.assertEqual(job.rows_parsed, 4)
+        self.assertEqual(job.rows_accepted, 2)
+        self.assertEqual(job.rows_rejected, 2)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(SaleImport.objects.count(), 1)
+
+    def test_progress_is_recorded_when_every_row_is_rejected(self):
+        rows = [
+            ["cherry", str(i), "270", "2021-02-01 10:00"] for i in range(25)
+        ]
+        rows_parsed = []
+        summary = generate_sale_objects(
+            rows,
+            batch_size=10,
+            progress=lambda summary: rows_parsed.append(summary.rows),
+        )
+        self.assertEqual(summary.rejected, 25)
+        # Recorded every 10 rows parsed although no batch was written, and
+        # when the writer is flushed at the end
+        self.assertEqual(rows_parsed, [10, 20, 25])
+
+    def test_process_sale_imports_command_runs_queued_jobs(self):
+        job = self.create_job()
+        out = StringIO()
+        call_command("process_sale_imports", "--once", stdout=out)
+        job.refresh_from_db()
+        self.assertEqual(job.status, SaleImportJob.DONE)
+        self.assertEqual(job.rows_parsed, 4)
+        self.assertEqual(job.rows_accepted, 2)
+        self.assertEqual(job.rows_rejected, 2)
+        self.assertEqual(job.unknown_fruits, "banana")
+        self.assertIsNotNone(job.finished_on)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertIn(f"Job {job.pk} (sales.csv): done", out.getvalue())
+        # The uploaded content is deleted once it has been imported
+        self.assertFalse(job.chunks.exists())
+
+    def test_failed_job_records_error(self):
+        job = self.create_job(content="レモン".encode("shift_jis"))
+        call_command("process_sale_imports", "--once", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, SaleImportJob.FAILED)
+        self.assertIn("utf-8", job.error)
+        self.assertFalse(job.chunks.exists())
+
+    def test_sale_import_job_page_shows_progress(self):
+        job = self.create_job()
+        response = self.client.get(reverse("sale_import_job", args=[job.pk]))
+        self.assertTemplateUsed(response, "sales/sale_import_job.html")
+        self.assertContains(response, "Queued")
+        self.assertContains(response, "window.location.reload()")
+
+        call_command("process_sale_imports", "--once", stdout=StringIO())
+        response = self.client.get(reverse("sale_import_job", args=[job.pk]))
+        self.assertContains(response, "Done")
+        self.assertContains(response, "Rows accepted</th>")
+        self.assertNotContains(response, "window.location.reload()")
+        self.assertContains(
+            response, "Rows for the following unknown fruits were ignored"
+        )
+
+    def test_sale_import_job_page_redirection_when_not_logged_in(self):
+        job = self.create_job()
+        self.client.logout()
+        response = self.client.get(reverse("sale_import_job", args=[job.pk]))
+        self.assertRedirects(
+            response, f"/accounts/login/?next=/sales/upload/{job.pk}/"
+        )
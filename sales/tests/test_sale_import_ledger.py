@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.test import TestCase
+
+from stock.models import Fruit
+from users.models import CustomUser
+from sales.models import Sale, SaleImport, ImportedRow
+from sales.imports import generate_sale_objects, hash_file_content
+
+
+class SaleImportLedgerTests(TestCase):
+    def setUp(self):
+        Fruit.objects.create(name="lemon", price=100)
+        Fruit.objects.create(name="apple", price=90)
+        self.user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=self.user)
+
+    def upload(self, content, time_zone=""):
+        csv_file = SimpleUploadedFile("sales.csv", content.encode("utf-8"))
+        return self.client.post(
+            reverse("sale_upload"),
+            {"file_name": csv_file, "time_zone": time_zone},
+        )
+
+    def test_file_content_hash_is_recorded_after_upload(self):
+        content = "lemon,2,200,2020-04-01 00:00\r\n"
+        self.upload(content)
+        sale_import = SaleImport.objects.get()
+        self.assertEqual(sale_import.file_name, "sales.csv")
+        self.assertEqual(
+            sale_import.content_hash,
+            hash_file_content([content.encode("utf-8")], settings.TIME_ZONE),
+        )
+        self.assertEqual(sale_import.imported_rows.count(), 1)
+
+    def test_file_imported_before_is_rejected(self):
+        content = "lemon,2,200,2020-04-01 00:00\r\n"
+        self.upload(content)
+        Sale.objects.all().delete()
+
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response,
+            "form",
+            "file_name",
+            "This file has already been imported.",
+        )
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(SaleImport.objects.count(), 1)
+
+    def test_file_imported_in_other_time_zone_is_imported_again(self):
+        content = "lemon,2,200,2020-04-01 00:00\r\n"
+        self.upload(content, "Asia/Tokyo")
+        response = self.upload(content, "UTC")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(SaleImport.objects.count(), 2)
+        self.assertEqual(ImportedRow.objects.count(), 2)
+
+    def test_rows_imported_in_other_time_zone_are_imported_again(self):
+        rows = [["lemon", "2", "200", "2020-04-01 00:00"]]
+        generate_sale_objects(rows, time_zone="Asia/Tokyo")
+        summary = generate_sale_objects(rows, time_zone="UTC")
+        self.assertEqual(summary.accepted, 1)
+        self.assertEqual(summary.already_imported, 0)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_only_new_rows_of_overlapping_file_are_imported(self):
+        generate_sale_objects(
+            [
+                ["lemon", "2", "200", "2020-04-01 00:00"],
+                ["apple", "1", "90", "2020-04-01 00:00"],
+            ]
+        )
+        # Rows already in the ledger are skipped even if their sale was
+        # deleted since
+        Sale.objects.filter(fruit_name="apple").delete()
+
+        summary = generate_sale_objects(
+            [
+                ["lemon", "2", "200", "2020-04-01 00:00"],
+                ["apple", "1", "90", "2020-04-01 00:00"],
+                ["apple", "3", "270", "2020-04-02 00:00"],
+            ]
+        )
+        self.assertEqual(summary.rows, 3)
+        self.assertEqual(summary.accepted, 1)
+        self.assertEqual(summary.already_imported, 2)
+        self.assertEqual(summary.rejected, 2)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(ImportedRow.objects.count(), 3)
+        self.assertEqual(summary.sale_import.imported_rows.count(), 1)
@@ -1,3 +1,4 @@
+from django.db import IntegrityError
 from django.test import TestCase
 from django.utils import timezone
 
@@ -197,3 +198,23 @@ class SaleModelTests(TestCase):
         self.assertEqual(sale.fruit_price_when_sold, 100)
         self.assertEqual(sale.quantity, 6)
         self.assertEqual(sale.proceeds, 600)
+
+    def test_identical_sale_rejected_by_dedup_key(self):
+        sale = Sale.objects.get(id=1)
+        self.assertEqual(len(sale.dedup_key), 40)
+        with self.assertRaises(IntegrityError):
+            Sale.objects.create(
+                fruit=sale.fruit,
+                fruit_price_when_sold=100,
+                quantity=3,
+                proceeds=300,
+                sold_on=sale.sold_on,
+            )
+
+    def test_dedup_key_updated_when_sale_updated(self):
+        sale = Sale.objects.get(id=1)
+        old_key = sale.dedup_key
+        sale.quantity = 6
+        sale.calculate_proceeds()
+        sale.save()
+        self.assertNotEqual(sale.dedup_key, old_key)
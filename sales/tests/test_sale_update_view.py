@@ -1,4 +1,6 @@
 import pytz
+from unittest import mock
+from django.db import IntegrityError
 from django.urls import reverse
 from django.test import TestCase
 from django.utils import timezone
@@ -69,3 +71,125 @@ class SaleUpdateViewTests(TestCase):
         self.assertEqual(lemon_sale.quantity, 10)
         self.assertEqual(lemon_sale.proceeds, 1000)
         self.assertEqual(lemon_sale.sold_on, new_date_aware)
+
+    def test_sale_update_view_rejects_identical_record(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        lemon = Fruit.objects.create(name="lemon", price=100)
+        sold_on = timezone.now().replace(second=0, microsecond=0)
+        Sale.objects.create(
+            fruit=lemon,
+            fruit_price_when_sold=100,
+            quantity=10,
+            proceeds=1000,
+            sold_on=sold_on,
+        )
+        lemon_sale = Sale.objects.create(
+            fruit=lemon,
+            fruit_price_when_sold=100,
+            quantity=5,
+            proceeds=500,
+            sold_on=sold_on,
+        )
+        response = self.client.post(
+            reverse("sale_update", args=[lemon_sale.pk]),
+            {
+                "quantity": 10,
+                "sold_on": timezone.localtime(sold_on).strftime(
+                    "%Y-%m-%d %H:%M"
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, "An identical sale record already exists."
+        )
+        lemon_sale.refresh_from_db()
+        self.assertEqual(lemon_sale.quantity, 5)
+
+    def create_legacy_duplicate(self):
+        lemon = Fruit.objects.create(name="lemon", price=100)
+        sold_on = timezone.now().replace(second=0, microsecond=0)
+        sale = Sale.objects.create(
+            fruit=lemon,
+            fruit_price_when_sold=100,
+            quantity=5,
+            proceeds=500,
+            sold_on=sold_on,
+        )
+        # Identical sales that existed before the unique constraint was added
+        # were left without a key
+        duplicate = Sale.objects.create(
+            fruit=lemon,
+            fruit_price_when_sold=100,
+            quantity=6,
+            proceeds=600,
+            sold_on=sold_on,
+        )
+        Sale.objects.filter(pk=duplicate.pk).update(
+            quantity=5, proceeds=500, dedup_key=None
+        )
+        return sale, duplicate
+
+    def test_sale_update_view_saves_unchanged_legacy_duplicate(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        sale, duplicate = self.create_legacy_duplicate()
+        response = self.client.post(
+            reverse("sale_update", args=[duplicate.pk]),
+            {
+                "quantity": 5,
+                "sold_on": timezone.localtime(sale.sold_on).strftime(
+                    "%Y-%m-%d %H:%M"
+                ),
+            },
+        )
+        self.assertRedirects(response, reverse("sale_list"))
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.dedup_key)
+
+    def test_sale_update_view_gives_changed_legacy_duplicate_a_key(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        sale, duplicate = self.create_legacy_duplicate()
+        response = self.client.post(
+            reverse("sale_update", args=[duplicate.pk]),
+            {
+                "quantity": 7,
+                "sold_on": timezone.localtime(sale.sold_on).strftime(
+                    "%Y-%m-%d %H:%M"
+                ),
+            },
+        )
+        self.assertRedirects(response, reverse("sale_list"))
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.quantity, 7)
+        self.assertIsNotNone(duplicate.dedup_key)
+
+    def test_sale_update_view_doesnt_hide_other_integrity_errors(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        lemon = Fruit.objects.create(name="lemon", price=100)
+        sale = Sale.objects.create(
+            fruit=lemon,
+            fruit_price_when_sold=100,
+            quantity=5,
+            proceeds=500,
+            sold_on=timezone.now(),
+        )
+        with mock.patch(
+            "stats.rollups.apply_rollup_changes",
+            side_effect=IntegrityError("rollup"),
+        ):
+            with self.assertRaisesMessage(IntegrityError, "rollup"):
+                self.client.post(
+                    reverse("sale_update", args=[sale.pk]),
+                    {
+                        "quantity": 7,
+                        "sold_on": timezone.localtime(sale.sold_on).strftime(
+                            "%Y-%m-%d %H:%M"
+                        ),
+                    },
+                )
+        sale.refresh_from_db()
+        self.assertEqual(sale.quantity, 5)
@@ -1,12 +1,21 @@
 import os
+import tempfile
+from datetime import datetime, timedelta
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from stock.models import Fruit
 from users.models import CustomUser
-from sales.models import Sale, CsvUploadFile
+from sales.models import Sale, SaleImport, ImportedRow, CsvUploadFile
 from sales.forms import CsvUploadForm
-from sales.views import generate_sale_objects, convert_str_to_tz_aware_datetime
+from sales.imports import (
+    UploadSummary,
+    parse_sold_on,
+    generate_sale_objects,
+    unique_rows,
+)
 
 
 class SaleUploadTests(TestCase):
@@ -56,11 +65,35 @@ class SaleUploadTests(TestCase):
             ).exists()
         )
 
-    def test_convert_str_to_tz_aware_datetime(self):
-        datetime_str = "2016-06-06 00:00"
-        expected = "2016-06-06 00:00:00+09:00"
-        datetime_obj = convert_str_to_tz_aware_datetime(datetime_str)
-        self.assertEqual(str(datetime_obj), expected)
+    def test_parse_sold_on_returns_utc_datetime(self):
+        sold_on = parse_sold_on("2016-06-06 00:00", "Asia/Tokyo")
+        self.assertEqual(str(sold_on), "2016-06-05 15:00:00+00:00")
+        sold_on = parse_sold_on("2016-06-06 00:00", "Europe/London")
+        self.assertEqual(str(sold_on), "2016-06-05 23:00:00+00:00")
+
+    def test_parse_sold_on_rejects_invalid_dates(self):
+        for date_str in [
+            "2021-2-1 10:00",
+            "2021-02-01 8:00",
+            "2021-13-01 10:00",
+            "2021-02-30 10:00",
+            "2021-02-01T10:00",
+            "２０２１-02-01 10:00",
+        ]:
+            self.assertIsNone(parse_sold_on(date_str, "Asia/Tokyo"))
+
+    def test_parse_sold_on_caches_repeated_timestamps(self):
+        parse_sold_on.cache_clear()
+        for _ in range(5):
+            parse_sold_on("2016-06-06 00:00", "Asia/Tokyo")
+        self.assertEqual(parse_sold_on.cache_info().hits, 4)
+        self.assertEqual(parse_sold_on.cache_info().misses, 1)
+
+    def test_upload_in_other_time_zone(self):
+        csv_content = [["apple", "3", "270", "2021-02-01 10:00"]]
+        generate_sale_objects(csv_content, time_zone="UTC")
+        sale = Sale.objects.get()
+        self.assertEqual(str(sale.sold_on), "2021-02-01 10:00:00+00:00")
 
     def test_input_fails_with_incorrect_elem_number_in_row(self):
         csv_content = [
@@ -96,18 +129,51 @@ class SaleUploadTests(TestCase):
             ).exists()
         )
 
+    def test_unknown_fruits_are_reported_in_summary(self):
+        csv_content = [
+            ["banana", "4", "170", "2021-02-01 10:00"],
+            ["banana", "5", "170", "2021-02-01 10:00"],
+            ["pineapple", "4", "170", "2021-02-01 10:00"],
+            ["apple", "3", "270", "2021-02-01 10:00"],
+        ]
+        summary = generate_sale_objects(csv_content)
+        self.assertEqual(summary.unknown_fruits, {"banana", "pineapple"})
+        self.assertEqual(summary.rows, 4)
+        self.assertEqual(summary.accepted, 1)
+        self.assertEqual(summary.rejected, 3)
+
+    def test_unknown_fruits_are_shown_after_upload(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        with open("sales/tests/test_sales.csv", "r") as csv_file:
+            response = self.client.post(
+                reverse("sale_upload"), {"file_name": csv_file}, follow=True
+            )
+        self.assertContains(
+            response,
+            "Rows for the following unknown fruits were ignored: ",
+            1,
+        )
+        self.assertContains(response, "ブルーベリー")
+
     def test_input_fails_with_non_digits_for_quantity_and_proceeds(self):
         csv_content = [
             ["apple", "three", "270", "2021-02-01 10:00"],
             ["lemon", "4", "one hundred", "2021-02-01 10:00"],
+            # Digits other than 0-9 are rejected rather than passed to int()
+            ["orange", "²", "110", "2021-02-01 10:00"],
+            ["orange", "1", "１１０", "2021-02-01 10:00"],
         ]
-        generate_sale_objects(csv_content)
+        summary = generate_sale_objects(csv_content)
+        self.assertEqual(summary.reasons["quantity"], 2)
+        self.assertEqual(summary.reasons["proceeds"], 2)
         self.assertFalse(
             Sale.objects.filter(fruit_name="apple", proceeds=270).exists()
         )
         self.assertFalse(
             Sale.objects.filter(fruit_name="lemon", quantity=4).exists()
         )
+        self.assertFalse(Sale.objects.filter(fruit_name="orange").exists())
 
     def test_input_fails_if_time_not_in_correct_format(self):
         csv_content = [
@@ -146,7 +212,7 @@ class SaleUploadTests(TestCase):
     def test_input_fails_if_identical_sales_record_already_exists(self):
         banana = Fruit.objects.create(name="banana", price=100)
         pineapple = Fruit.objects.create(name="pineapple", price=200)
-        datetime_obj = convert_str_to_tz_aware_datetime("2021-04-01 00:00")
+        datetime_obj = parse_sold_on("2021-04-01 00:00", "Asia/Tokyo")
         Sale.objects.create(
             fruit=banana, quantity=2, proceeds=200, sold_on=datetime_obj
         )
@@ -195,6 +261,51 @@ class SaleUploadTests(TestCase):
         generate_sale_objects(csv_content)
         self.assertEqual(Sale.objects.count(), 1)
 
+    def test_rows_identical_to_existing_sales_are_rejected(self):
+        Sale.objects.create(
+            fruit=Fruit.objects.get(name="lemon"),
+            quantity=2,
+            proceeds=200,
+            sold_on=parse_sold_on("2020-04-01 00:00", "Asia/Tokyo"),
+        )
+        csv_content = [
+            ["apple", "1", "90", "2020-04-01 00:00"],
+            ["lemon", "2", "200", "2020-04-01 00:00"],
+            ["orange", "1", "110", "2020-04-01 00:00"],
+        ]
+        summary = generate_sale_objects(csv_content, batch_size=2)
+        self.assertEqual(summary.accepted, 2)
+        self.assertEqual(summary.rejected, 1)
+        self.assertEqual(summary.reasons["existing_sale"], 1)
+        self.assertEqual(summary.sample_lines["existing_sale"], [2])
+        self.assertEqual(Sale.objects.count(), 3)
+
+    def test_unique_rows_streams_first_occurrence_of_each_row(self):
+        summary = UploadSummary()
+        rows = iter(
+            [
+                ["lemon", "2", "200", "2020-04-01 00:00"],
+                ["apple", "2", "180", "2020-04-01 00:00"],
+                ["lemon", "2", "200", "2020-04-01 00:00"],
+                ["lemon", "2", "200", "2020-04-01 00:01"],
+            ]
+        )
+        unique = (row for _, _, row in unique_rows(rows, summary, "UTC"))
+        self.assertEqual(
+            next(unique), ["lemon", "2", "200", "2020-04-01 00:00"]
+        )
+        # Rows are read lazily, not all at once
+        self.assertEqual(summary.rows, 1)
+        self.assertEqual(
+            list(unique),
+            [
+                ["apple", "2", "180", "2020-04-01 00:00"],
+                ["lemon", "2", "200", "2020-04-01 00:01"],
+            ],
+        )
+        self.assertEqual(summary.rows, 4)
+        self.assertEqual(summary.duplicates, 1)
+
     def test_sale_upload_with_data_from_file(self):
 
         user = CustomUser.objects.create_user("testuser", "123456")
@@ -212,7 +323,7 @@ class SaleUploadTests(TestCase):
         self.assertEqual(Sale.objects.count(), 5)
 
         datetime_str = "2000-01-01 10:00"
-        sold_date = convert_str_to_tz_aware_datetime(datetime_str)
+        sold_date = parse_sold_on(datetime_str, "Asia/Tokyo")
         self.assertTrue(
             Sale.objects.filter(
                 fruit_name="レモン", quantity=1, proceeds=100, sold_on=sold_date
@@ -220,7 +331,7 @@ class SaleUploadTests(TestCase):
         )
 
         datetime_str = "2000-01-01 10:01"
-        sold_date = convert_str_to_tz_aware_datetime(datetime_str)
+        sold_date = parse_sold_on(datetime_str, "Asia/Tokyo")
         self.assertTrue(
             Sale.objects.filter(
                 fruit_name="ブルーベリー",
@@ -231,7 +342,7 @@ class SaleUploadTests(TestCase):
         )
 
         datetime_str = "2000-01-01 10:02"
-        sold_date = convert_str_to_tz_aware_datetime(datetime_str)
+        sold_date = parse_sold_on(datetime_str, "Asia/Tokyo")
         self.assertTrue(
             Sale.objects.filter(
                 fruit_name="グレープフルーツ",
@@ -242,7 +353,7 @@ class SaleUploadTests(TestCase):
         )
 
         datetime_str = "2000-01-01 10:03"
-        sold_date = convert_str_to_tz_aware_datetime(datetime_str)
+        sold_date = parse_sold_on(datetime_str, "Asia/Tokyo")
         self.assertTrue(
             Sale.objects.filter(
                 fruit_name="パイナップル",
@@ -253,14 +364,14 @@ class SaleUploadTests(TestCase):
         )
 
         datetime_str = "2000-01-01 10:04"
-        sold_date = convert_str_to_tz_aware_datetime(datetime_str)
+        sold_date = parse_sold_on(datetime_str, "Asia/Tokyo")
         self.assertTrue(
             Sale.objects.filter(
                 fruit_name="リンゴ", quantity=5, proceeds=500, sold_on=sold_date
             ).exists()
         )
 
-    def test_csv_file_is_deleted_after_upload(self):
+    def test_csv_file_is_not_saved_to_media_root(self):
 
         user = CustomUser.objects.create_user("testuser", "123456")
         self.client.force_login(user=user)
@@ -271,11 +382,61 @@ class SaleUploadTests(TestCase):
         Fruit.objects.create(name="パイナップル", price=100)
         Fruit.objects.create(name="リンゴ", price=100)
 
-        with open("sales/tests/test_sales.csv", "r") as csv_file:
-            self.client.post(reverse("sale_upload"), {"file_name": csv_file})
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                with open("sales/tests/test_sales.csv", "r") as csv_file:
+                    self.client.post(
+                        reverse("sale_upload"), {"file_name": csv_file}
+                    )
+            self.assertFalse(os.listdir(media_root))
 
         self.assertEqual(CsvUploadFile.objects.count(), 0)
-        self.assertFalse(os.listdir("media/csv_files"))
+        self.assertEqual(Sale.objects.count(), 5)
+
+    def test_sale_upload_with_time_zone(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        Fruit.objects.create(name="レモン", price=100)
+        with open("sales/tests/test_sales.csv", "r") as csv_file:
+            self.client.post(
+                reverse("sale_upload"),
+                {"file_name": csv_file, "time_zone": "UTC"},
+            )
+        sale = Sale.objects.get()
+        self.assertEqual(str(sale.sold_on), "2000-01-01 10:00:00+00:00")
+
+    def test_sale_upload_rejects_file_that_is_not_utf8(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        csv_file = SimpleUploadedFile(
+            "sales.csv", "レモン,1,100,2000-01-01 10:00".encode("shift_jis")
+        )
+        response = self.client.post(
+            reverse("sale_upload"), {"file_name": csv_file}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "The file could not be read.")
+
+    @override_settings(SALE_UPLOAD_BATCH_SIZE=500)
+    def test_sale_upload_removes_rows_written_before_decode_error(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        start = datetime(year=2020, month=1, day=1)
+        rows = "".join(
+            f"apple,1,90,{start + timedelta(minutes=i):%Y-%m-%d %H:%M}\n"
+            for i in range(5000)
+        )
+        csv_file = SimpleUploadedFile(
+            "sales.csv",
+            rows.encode() + "レモン,1,100,2000-01-01 10:00".encode("shift_jis"),
+        )
+        response = self.client.post(
+            reverse("sale_upload"), {"file_name": csv_file}
+        )
+        self.assertContains(response, "The file could not be read.")
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertFalse(SaleImport.objects.exists())
+        self.assertFalse(ImportedRow.objects.exists())
 
     def test_sale_upload_get_request(self):
         user = CustomUser.objects.create_user("testuser", "123456")
@@ -284,3 +445,39 @@ class SaleUploadTests(TestCase):
         self.assertTemplateUsed(response, "sales/sale_upload.html")
         self.assertIn("form", response.context)
         self.assertIsInstance(response.context["form"], CsvUploadForm)
+
+    @override_settings(SALE_UPLOAD_BATCH_SIZE=100)
+    def test_upload_of_10k_rows_is_written_in_batches(self):
+        start = datetime(year=2020, month=1, day=1)
+        csv_content = [
+            [
+                "apple",
+                "1",
+                "90",
+                (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M"),
+            ]
+            for i in range(10000)
+        ]
+        # CaptureQueriesContext only keeps the last 9000 queries
+        queries = []
+
+        def log_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(log_query):
+            generate_sale_objects(csv_content)
+        self.assertEqual(Sale.objects.count(), 10000)
+
+        def count_inserts(table):
+            return sum(
+                sql.startswith("INSERT") and f'INTO "{table}" ' in sql
+                for sql in queries
+            )
+
+        # One Sale and one ImportedRow INSERT per batch of 100 rows
+        self.assertEqual(count_inserts("sales_sale"), 100)
+        self.assertEqual(count_inserts("sales_importedrow"), 100)
+        # The other queries are made per batch (e.g. savepoints and rollup
+        # updates) or per ledger lookup, not per row
+        self.assertLess(len(queries), 20 * 100)
@@ -0,0 +1,102 @@
+from datetime import datetime
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from stock.models import Fruit
+from users.models import CustomUser
+from sales.models import Sale, SaleImport
+from sales.imports import dry_run_sale_objects, generate_sale_objects
+
+
+class SaleUploadDryRunTests(TestCase):
+    def setUp(self):
+        self.lemon = Fruit.objects.create(name="lemon", price=100)
+        Fruit.objects.create(name="apple", price=90)
+        self.rows = [
+            ["lemon", "2", "200", "2020-04-01 00:00"],
+            ["apple", "1", "90", "2020-04-01 00:00"],
+            ["lemon", "2", "200", "2020-04-01 00:00"],
+            ["banana", "1", "90", "2020-04-01 00:00"],
+            ["lemon", "x", "200", "2020-04-01 00:00"],
+            ["lemon", "2", "2.0", "2020-04-01 00:00"],
+            ["lemon", "2", "200", "2020-04-01"],
+            ["lemon", "2", "200", "2999-04-01 00:00"],
+            ["lemon", "2", "200"],
+            ["apple", "1", "90", "2020-04-02 00:00"],
+        ]
+
+    def test_dry_run_counts_rejection_reasons_with_sample_lines(self):
+        summary = dry_run_sale_objects(self.rows)
+        self.assertEqual(summary.rows, 10)
+        self.assertEqual(summary.accepted, 3)
+        self.assertEqual(summary.rejected, 7)
+        self.assertEqual(
+            sorted(summary.rejection_report()),
+            [
+                ("Date and time in the future", 1, [8]),
+                ('Date and time not in the format "YYYY-MM-DD HH:MM"', 1, [7]),
+                (
+                    "Not four values (fruit, quantity, proceeds, date time)",
+                    1,
+                    [9],
+                ),
+                ("Proceeds are not a whole number", 1, [6]),
+                ("Quantity is not a whole number", 1, [5]),
+                ("Repeat of an earlier row in the file", 1, [3]),
+                ("Unknown fruit", 1, [4]),
+            ],
+        )
+        self.assertEqual(summary.unknown_fruits, {"banana"})
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(SaleImport.objects.count(), 0)
+
+    def test_rows_with_zero_quantity_are_rejected(self):
+        rows = [
+            ["lemon", "0", "0", "2020-04-01 00:00"],
+            ["lemon", "00", "200", "2020-04-01 00:01"],
+            ["lemon", "1", "100", "2020-04-01 00:02"],
+        ]
+        for summary in (
+            dry_run_sale_objects(rows),
+            generate_sale_objects(rows),
+        ):
+            self.assertEqual(summary.accepted, 1)
+            self.assertEqual(
+                summary.rejection_report(), [("Quantity is zero", 2, [1, 2])]
+            )
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_dry_run_finds_existing_and_imported_rows(self):
+        generate_sale_objects([["apple", "1", "90", "2020-04-01 00:00"]])
+        sold_on = timezone.make_aware(datetime(2020, 4, 2, 0, 0))
+        Sale.objects.create(
+            fruit=self.lemon, quantity=1, proceeds=100, sold_on=sold_on
+        )
+        summary = dry_run_sale_objects(
+            [
+                ["apple", "1", "90", "2020-04-01 00:00"],
+                ["lemon", "1", "100", "2020-04-02 00:00"],
+                ["lemon", "1", "100", "2020-04-03 00:00"],
+            ]
+        )
+        self.assertEqual(summary.accepted, 1)
+        self.assertEqual(summary.already_imported, 1)
+        self.assertEqual(summary.reasons["existing_sale"], 1)
+        self.assertEqual(summary.sample_lines["existing_sale"], [2])
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_dry_run_upload_shows_report_without_importing(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        content = "".join(",".join(row) + "\r\n" for row in self.rows)
+        csv_file = SimpleUploadedFile("sales.csv", content.encode("utf-8"))
+        response = self.client.post(
+            reverse("sale_upload"), {"file_name": csv_file, "dry_run": "on"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "3 would be imported and 7 ignored")
+        self.assertContains(response, "Quantity is not a whole number")
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(SaleImport.objects.count(), 0)
@@ -6,6 +6,9 @@ from .views import (
     sale_update,
     sale_delete,
     sale_upload,
+    sale_import_job,
+    sale_import_list,
+    sale_import_delete,
 )
 
 
@@ -15,4 +18,11 @@ urlpatterns = [
     path("<int:pk>/update/", sale_update, name="sale_update"),
     path("<int:pk>/delete/", sale_delete, name="sale_delete"),
     path("upload/", sale_upload, name="sale_upload"),
+    path("upload/<int:pk>/", sale_import_job, name="sale_import_job"),
+    path("imports/", sale_import_list, name="sale_import_list"),
+    path(
+        "imports/<int:pk>/delete/",
+        sale_import_delete,
+        name="sale_import_delete",
+    ),
 ]
@@ -1,20 +1,27 @@
-import re
-import csv
-import pytz
-from datetime import datetime
-from django.utils import timezone
+import zipfile
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Count
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
-from .models import Sale, CsvUploadFile
+from .models import Sale, SaleImport, SaleImportJob, SaleImportJobChunk
 from .forms import SaleCreateForm, SaleUpdateForm, CsvUploadForm
-from stock.models import Fruit
+from .imports import (
+    delete_sale_import,
+    dry_run_sale_objects,
+    generate_sale_objects,
+    open_upload_members,
+    read_csv_members,
+)
 
 
 @login_required
 def sale_list(request):
-    sales = Sale.objects.order_by("-sold_on")
+    # pk keeps sales made at the same time in the order they were added
+    sales = Sale.objects.order_by("-sold_on", "pk")
     total_sales = sales.count()
 
     page = request.GET.get("page", 1)
@@ -34,6 +41,19 @@ def sale_list(request):
     )
 
 
+def is_duplicate_sale(sale):
+    """
+    Helper function for sale_create() and sale_update(). Returns whether
+    another sale has the same dedup_key as "sale", which was rejected by the
+    unique constraint on it.
+    """
+    return (
+        Sale.objects.filter(dedup_key=sale.dedup_key)
+        .exclude(pk=sale.pk)
+        .exists()
+    )
+
+
 @login_required
 def sale_create(request):
     if request.method == "POST":
@@ -44,14 +64,16 @@ def sale_create(request):
             sale.retrieve_fruit_price()
             sale.calculate_proceeds()
 
-            # New record not saved if an identical sale record already exists
-            if not Sale.objects.filter(
-                fruit=sale.fruit,
-                quantity=sale.quantity,
-                proceeds=sale.proceeds,
-                sold_on=sale.sold_on,
-            ).exists():
-                sale.save()
+            # New record not saved if an identical sale record already exists,
+            # which is detected by the unique constraint on Sale.dedup_key
+            try:
+                with transaction.atomic():
+                    sale.save()
+            except IntegrityError:
+                # Other errors, e.g. from writing the stats rollups, are not
+                # mistaken for duplicates
+                if not is_duplicate_sale(sale):
+                    raise
 
             return redirect("sale_list")
     else:
@@ -75,8 +97,17 @@ def sale_update(request, pk):
         if form.is_valid():
             sale = form.save(commit=False)
             sale.calculate_proceeds()
-            sale.save()
-            return redirect("sale_list")
+            try:
+                with transaction.atomic():
+                    sale.save()
+            except IntegrityError:
+                if not is_duplicate_sale(sale):
+                    raise
+                form.add_error(
+                    "sold_on", "An identical sale record already exists."
+                )
+            else:
+                return redirect("sale_list")
     else:
         form = SaleUpdateForm(instance=sale)
     return render(
@@ -84,118 +115,131 @@ def sale_update(request, pk):
     )
 
 
-def convert_str_to_tz_aware_datetime(date_str):
-    """
-    Helper function for sale_upload().
-    """
-
-    # Convert str to timezone-naive datetime
-    try:
-        naive_datetime = datetime.strptime(date_str, "%Y-%m-%d %H:%M")
-    except ValueError as e:
-        print(e)
-
-    # Convert timezone-naive datetime to timezone-aware datetime
-    tokyo = pytz.timezone("Asia/Tokyo")
-    aware_datetime = tokyo.localize(naive_datetime)
-
-    return aware_datetime
-
-
-def check_row_content(row):
-    """
-    Helper function for sale_upload(). Checks the elements included in
-    each row of a csv file and the formatting thereof.
-    """
-    if len(row) != 4:
-        return False
-
-    # Check whether a corresponding Fruit object exists
-    try:
-        Fruit.objects.get(name=row[0])
-    except Exception:
-        return False
-
-    if not row[1].isdigit():
-        return False
-
-    if not row[2].isdigit():
-        return False
+@login_required
+def sale_upload(request):
+    if request.method == "POST":
+        form = CsvUploadForm(request.POST, request.FILES)
 
-    # Check whether the datetime element has the correct format
-    if not bool(re.match(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$", row[3])):
-        return False
+        if form.is_valid():
+            uploaded_file = form.cleaned_data["file_name"]
+            time_zone = form.cleaned_data["time_zone"]
+            dry_run = form.cleaned_data["dry_run"]
+
+            # Large files are queued for the process_sale_imports command so
+            # that the import isn't cut off by the web server's worker timeout
+            if (
+                not dry_run
+                and uploaded_file.size
+                > settings.SALE_UPLOAD_BACKGROUND_THRESHOLD
+            ):
+                # Saved in one transaction so that workers don't claim the
+                # job before all of its content has been saved
+                with transaction.atomic():
+                    job = SaleImportJob.objects.create(
+                        file_name=uploaded_file.name,
+                        content_hash=form.content_hash,
+                        time_zone=time_zone,
+                    )
+                    job.save_content(
+                        uploaded_file.chunks(SaleImportJobChunk.SIZE)
+                    )
+                return redirect("sale_import_job", pk=job.pk)
+
+            # Create Sale objects from the csv content as it is read in, with
+            # compressed files decompressed on the fly
+            try:
+                members = open_upload_members(
+                    uploaded_file, uploaded_file.name
+                )
+                if not members:
+                    raise zipfile.BadZipFile
+                if dry_run:
+                    summary = dry_run_sale_objects(
+                        read_csv_members(members), time_zone=time_zone
+                    )
+                    return render(
+                        request,
+                        "sales/sale_upload.html",
+                        {"form": form, "summary": summary},
+                    )
+                sale_import = SaleImport.objects.create(
+                    file_name=uploaded_file.name
+                )
+                try:
+                    summary = generate_sale_objects(
+                        read_csv_members(members),
+                        time_zone=time_zone,
+                        content_hash=form.content_hash,
+                        sale_import=sale_import,
+                    )
+                except Exception:
+                    # The batches written before the error are removed, so
+                    # that the fixed file can be uploaded again in full
+                    delete_sale_import(sale_import)
+                    raise
+            except UnicodeDecodeError:
+                form.add_error(
+                    "file_name",
+                    "The file could not be read. Please select a UTF-8 "
+                    "encoded CSV file.",
+                )
+            except (zipfile.BadZipFile, OSError, EOFError):
+                form.add_error(
+                    "file_name",
+                    "The file could not be decompressed. Please select a "
+                    "valid archive containing CSV files.",
+                )
+            else:
+                if summary.unknown_fruits:
+                    messages.warning(
+                        request,
+                        "Rows for the following unknown fruits were ignored: "
+                        + ", ".join(sorted(summary.unknown_fruits)),
+                    )
+                return redirect("sale_list")
 
-    # Check whether the datetime element is in the future
-    sold_date = convert_str_to_tz_aware_datetime(row[3])
-    if sold_date > timezone.now():
-        return False
+    else:
+        form = CsvUploadForm()
+    return render(request, "sales/sale_upload.html", {"form": form})
 
-    # Check whether the same record already exists in the DB
-    # Necessary to change to UTC time to compare with datetime in the DB
-    utc_sold_date = sold_date.astimezone(pytz.utc)
-    if Sale.objects.filter(
-        fruit_name=row[0],
-        quantity=row[1],
-        proceeds=row[2],
-        sold_on=utc_sold_date,
-    ).exists():
-        return False
 
-    return True
+@login_required
+def sale_import_job(request, pk):
+    job = get_object_or_404(SaleImportJob, pk=pk)
+    return render(request, "sales/sale_import_job.html", {"job": job})
 
 
-def generate_sale_objects(file_content):
-    """
-    Helper function for sale_upload().
-    Converts each row in a csv file into a Sale object.
-    """
-    for row in file_content:
+@login_required
+def sale_import_list(request):
+    sale_imports = SaleImport.objects.annotate(
+        sale_count=Count("sales")
+    ).order_by("-imported_on", "-pk")
 
-        # Rows that don't pass the checks in check_row_content() are ignored
-        verified = check_row_content(row)
+    page = request.GET.get("page", 1)
+    paginator = Paginator(sale_imports, 8)
 
-        if verified:
-            fruit = Fruit.objects.get(name=row[0])
-            quantity = int(row[1])
-            proceeds = int(row[2])
-            fruit_price_when_sold = proceeds / quantity
-            sold_on = convert_str_to_tz_aware_datetime(row[3])
+    try:
+        sale_imports = paginator.page(page)
+    except PageNotAnInteger:
+        sale_imports = paginator.page(1)
+    except EmptyPage:
+        sale_imports = paginator.page(paginator.num_pages)
 
-            Sale.objects.create(
-                fruit=fruit,
-                quantity=quantity,
-                proceeds=proceeds,
-                fruit_price_when_sold=fruit_price_when_sold,
-                sold_on=sold_on,
-            )
+    return render(
+        request,
+        "sales/sale_import_list.html",
+        {"sale_imports": sale_imports},
+    )
 
 
 @login_required
-def sale_upload(request):
+def sale_import_delete(request, pk):
+    sale_import = get_object_or_404(SaleImport, pk=pk)
     if request.method == "POST":
-        form = CsvUploadForm(request.POST, request.FILES)
-
-        if form.is_valid():
-            form.save()
-            csv_file = CsvUploadFile.objects.latest("uploaded_on")
-
-            # Read in content from the CSV file
-            file_content = []
-            with open(csv_file.file_name.path, "r") as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    if row not in file_content:  # Duplicate rows are ignored
-                        file_content.append(row)
-
-            # Create Sale objects from the csv content
-            generate_sale_objects(file_content)
-
-            # Delete the uploaded csv file
-            csv_file.delete()
-
-            return redirect("sale_list")
-
-    else:
-        form = CsvUploadForm()
-    return render(request, "sales/sale_upload.html", {"form": form})
+        deleted = delete_sale_import(sale_import)
+        messages.warning(
+            request,
+            f'{deleted} sales imported from "{sale_import.file_name}" were '
+            "deleted.",
+        )
+    return redirect("sale_import_list")
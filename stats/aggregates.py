@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from collections import namedtuple
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+# Periods that sales can be grouped by, as Trunc() kinds
+PERIODS = ("hour", "day", "week", "month", "year")
+
+
+def truncate_date(day, period):
+    """
+    Returns the first day of the week (Monday), month or year that "day" is
+    in, or "day" itself for days.
+    """
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    if period == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+FruitTotal = namedtuple("FruitTotal", ["fruit_name", "proceeds", "quantity"])
+
+
+class FruitBreakdown:
+    """
+    Proceeds and quantity of each fruit in a set of sales, as FruitTotal
+    tuples in descending order of proceeds (then quantity), along with the
+    overall totals. Formatting is left to the template.
+    """
+
+    __slots__ = ("fruits", "proceeds", "quantity")
+
+    def __init__(self, fruits=()):
+        self.fruits = list(fruits)
+        self.proceeds = sum(fruit.proceeds for fruit in self.fruits)
+        self.quantity = sum(fruit.quantity for fruit in self.fruits)
+
+    def __iter__(self):
+        return iter(self.fruits)
+
+    def __len__(self):
+        return len(self.fruits)
+
+    def __getitem__(self, index):
+        return self.fruits[index]
+
+    def as_dict(self):
+        """
+        Returns {fruit name: [proceeds, quantity]}.
+        """
+        return {
+            fruit.fruit_name: [fruit.proceeds, fruit.quantity]
+            for fruit in self.fruits
+        }
+
+
+def summarise_sales_by_fruit(sales, period=None, date_field="sold_on"):
+    """
+    Groups the "sales" queryset by fruit in the DB and returns a
+    FruitBreakdown. If "period" is one of PERIODS, the sales are also grouped
+    by "date_field" truncated to that period in the current (JPT) timezone,
+    and {start of period: FruitBreakdown} is returned instead. The start is a
+    datetime for hours and a date otherwise, e.g. the first day of the month
+    for months. "sales" can be a queryset of Sale or DailyFruitSales objects,
+    which have the same fruit_name, quantity and proceeds fields. Only one
+    row per period and fruit is fetched, already in the order of the
+    breakdowns.
+    """
+    values = ["fruit_name"]
+    if period is not None:
+        sales = sales.annotate(
+            period=Trunc(
+                date_field,
+                period,
+                tzinfo=timezone.get_current_timezone(),
+            )
+        )
+        values = ["period", "fruit_name"]
+
+    rows = (
+        sales.values(*values)
+        .annotate(proceeds=Sum("proceeds"), quantity=Sum("quantity"))
+        .order_by(*values[:-1], "-proceeds", "-quantity", "fruit_name")
+        .values_list(*values, "proceeds", "quantity")
+    )
+
+    if period is None:
+        return FruitBreakdown(
+            FruitTotal(fruit_name, proceeds or 0, quantity)
+            for fruit_name, proceeds, quantity in rows
+        )
+
+    fruits_by_date = {}
+    for date, fruit_name, proceeds, quantity in rows:
+        if period != "hour" and isinstance(date, datetime):
+            date = date.date()
+        fruits_by_date.setdefault(date, []).append(
+            FruitTotal(fruit_name, proceeds or 0, quantity)
+        )
+    return {
+        date: FruitBreakdown(fruits) for date, fruits in fruits_by_date.items()
+    }
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class StatsConfig(AppConfig):
     name = "stats"
+
+    def ready(self):
+        from sales.signals import sales_changed
+        from .rollups import update_sales_rollups
+        from .cache import invalidate_stats
+
+        sales_changed.connect(update_sales_rollups, dispatch_uid="rollups")
+        sales_changed.connect(invalidate_stats, dispatch_uid="stats_cache")
@@ -0,0 +1,286 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .aggregates import truncate_date
+
+# Key of the counter that is incremented whenever sales are written. Cached
+# stats include its value in their keys, so that incrementing it makes all of
+# them unreachable at once, in every process sharing the cache.
+VERSION_KEY = "stats:version"
+
+# Outcomes of get_cached_stats() that are counted. "served_stale" and
+# "waited" are requests that were coalesced with another one recomputing
+# the same stats.
+METRIC_EVENTS = (
+    "hits",
+    "recomputed",
+    "served_stale",
+    "waited",
+    "wait_timeouts",
+)
+
+# Seconds between checks for stats that another process is recomputing
+WAIT_INTERVAL = 0.05
+
+# Key of the counter included in the keys of all cached report rows, which is
+# incremented when the whole rollup is rebuilt
+BUCKET_EPOCH_KEY = "stats:buckets:epoch"
+
+# Periods (as in stats.aggregates.PERIODS) that a changed day is in and
+# whose cached report rows are invalidated
+BUCKET_PERIODS = ("day", "week", "month", "year")
+
+
+def get_counter(key):
+    """
+    Returns the value of the counter at "key" in the cache.
+    """
+    value = cache.get(key)
+    if value is None:
+        # Started from the time rather than 1, so that a counter evicted from
+        # the cache can't come back with a value used before
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not in the cache, so a new starting value works as well
+        get_counter(key)
+
+
+def get_stats_version():
+    """
+    Returns the current value of the stats version counter.
+    """
+    return get_counter(VERSION_KEY)
+
+
+def bump_stats_version():
+    """
+    Increments the stats version counter, so that all cached stats are
+    recomputed the next time they are read.
+    """
+    bump_counter(VERSION_KEY)
+
+
+def get_stats_etag():
+    """
+    Returns an entity tag for the stats cached by get_cached_stats(), which
+    only change when sales are written or the local (JPT) day changes.
+    """
+    today = timezone.localtime(timezone.now()).date().isoformat()
+    return f"{get_stats_version()}-{today}"
+
+
+def invalidate_stats(sender, **kwargs):
+    """
+    Receiver of the sales_changed signal. Bumps the version both straight
+    away and once the transaction is committed, so that stats computed by
+    another process before the commit aren't kept.
+    """
+    bump_stats_version()
+    transaction.on_commit(bump_stats_version)
+
+
+def get_seconds_until_tomorrow():
+    """
+    Returns the number of seconds until the next midnight in the current
+    (JPT) timezone.
+    """
+    now = timezone.localtime(timezone.now())
+    tomorrow = datetime.combine(
+        now.date() + timedelta(days=1), datetime.min.time()
+    )
+    tomorrow = timezone.make_aware(tomorrow, timezone.get_current_timezone())
+    return max(int((tomorrow - now).total_seconds()), 1)
+
+
+def record_stats_cache_event(event):
+    """
+    Increments the counter of "event" (one of METRIC_EVENTS) in the cache.
+    """
+    key = f"stats:metrics:{event}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First event, or the counter was evicted. Two processes starting the
+        # counter at the same time can lose one event, which is acceptable.
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats_cache_metrics():
+    """
+    Returns {event: count} for each of METRIC_EVENTS.
+    """
+    counts = cache.get_many([f"stats:metrics:{e}" for e in METRIC_EVENTS])
+    return {
+        event: counts.get(f"stats:metrics:{event}", 0)
+        for event in METRIC_EVENTS
+    }
+
+
+def reset_stats_cache_metrics():
+    cache.delete_many([f"stats:metrics:{e}" for e in METRIC_EVENTS])
+
+
+def wait_for_stats(key):
+    """
+    Helper function for get_cached_stats().
+    Polls the cache for "key", which another process is computing, for up to
+    STATS_CACHE_WAIT seconds. Returns the value, or None if it didn't appear.
+    """
+    deadline = time.monotonic() + settings.STATS_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def get_cached_stats(name, compute):
+    """
+    Returns the value cached for "name" for the current stats version and
+    local (JPT) day, or calls "compute" and caches its result until the end
+    of the day. As the day is part of the key, stats covering "today" move
+    on at midnight even if no sales are written.
+
+    Only one process computes a missing value at a time, using a lock key
+    added to the cache. Meanwhile, the others are served the previous value
+    computed on the same day if there is one (stale-while-revalidate), or
+    otherwise wait for the value. They compute it themselves if it doesn't
+    appear in time, e.g. because the process holding the lock died.
+    """
+    today = timezone.localtime(timezone.now()).date().isoformat()
+    key = f"stats:{name}:{get_stats_version()}:{today}"
+    value = cache.get(key)
+    if value is not None:
+        record_stats_cache_event("hits")
+        return value
+
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, timeout=settings.STATS_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        previous = cache.get(f"stats:{name}:previous")
+        if previous is not None and previous[0] == today:
+            record_stats_cache_event("served_stale")
+            return previous[1]
+        value = wait_for_stats(key)
+        if value is not None:
+            record_stats_cache_event("waited")
+            return value
+        record_stats_cache_event("wait_timeouts")
+
+    try:
+        value = compute()
+        timeout = get_seconds_until_tomorrow()
+        cache.set_many(
+            {key: value, f"stats:{name}:previous": (today, value)},
+            timeout=timeout,
+        )
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    record_stats_cache_event("recomputed")
+    return value
+
+
+def get_bucket_generation_key(period, bucket):
+    return f"stats:buckets:generation:{period}:{bucket.isoformat()}"
+
+
+def get_cached_buckets(period, buckets):
+    """
+    Returns ({bucket: FruitBreakdown} for the "buckets" (start dates of
+    closed periods) found in the cache, {bucket: key} to cache the others
+    under with cache_buckets()). The keys include a generation per bucket,
+    read before the buckets are computed, so that a value computed while a
+    write to the same period is being committed is cached under an outdated
+    key rather than kept.
+    """
+    if not buckets:
+        return {}, {}
+
+    epoch = get_counter(BUCKET_EPOCH_KEY)
+    generation_keys = {
+        bucket: get_bucket_generation_key(period, bucket) for bucket in buckets
+    }
+    generations = cache.get_many(generation_keys.values())
+
+    keys = {}
+    for bucket, generation_key in generation_keys.items():
+        generation = generations.get(generation_key)
+        if generation is None:
+            generation = get_counter(generation_key)
+        keys[bucket] = (
+            f"stats:buckets:{epoch}:{period}:{bucket.isoformat()}:{generation}"
+        )
+
+    values = cache.get_many(keys.values())
+    found = {
+        bucket: values[key] for bucket, key in keys.items() if key in values
+    }
+    missing = {
+        bucket: key for bucket, key in keys.items() if key not in values
+    }
+    return found, missing
+
+
+def cache_buckets(keys, details):
+    """
+    Caches the FruitBreakdown of each bucket in "details" indefinitely, under
+    the key from get_cached_buckets().
+    """
+    cache.set_many(
+        {keys[bucket]: value for bucket, value in details.items()},
+        timeout=None,
+    )
+
+
+def bump_bucket_generations(days):
+    """
+    Moves the generation of the day, week, month and year buckets that
+    "days" are in on to a new value. The distinct buckets are worked out
+    first and all of them are set with a single set_many() call, however
+    many days there are. The new value is random, so it can't be one used
+    before, and unlike incrementing it doesn't need the current value.
+    """
+    buckets = {
+        (period, truncate_date(day, period))
+        for day in days
+        for period in BUCKET_PERIODS
+    }
+    generation = uuid.uuid4().hex
+    cache.set_many(
+        {
+            get_bucket_generation_key(period, bucket): generation
+            for period, bucket in buckets
+        },
+        timeout=None,
+    )
+
+
+def invalidate_buckets(days):
+    """
+    Invalidates the cached report rows of the periods that "days" (local
+    dates whose sales changed) are in, both straight away and once the
+    transaction is committed.
+    """
+    days = set(days)
+    if not days:
+        return
+    bump_bucket_generations(days)
+    transaction.on_commit(lambda: bump_bucket_generations(days))
+
+
+def invalidate_all_buckets():
+    bump_counter(BUCKET_EPOCH_KEY)
@@ -0,0 +1,222 @@
+from array import array
+from datetime import date, datetime, timedelta
+from django.db.models import Func, BigIntegerField
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of rows fetched from the DB at a time
+CHUNK_SIZE = 20000
+
+EPOCH = date(1970, 1, 1)
+
+
+class UnixTime(Func):
+    """
+    Seconds since 1970-01-01 UTC of a datetime field, so that sold_on is read
+    as an integer rather than parsed into a datetime object per row.
+    """
+
+    output_field = BigIntegerField()
+    template = "CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)"
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="UNIX_TIMESTAMP(%(expressions)s)",
+            **extra_context,
+        )
+
+
+class SalesColumns:
+    """
+    Sales held as arrays of the local day (days since 1970-01-01), local
+    hour, fruit (index in fruit_names), quantity and proceeds of each sale.
+    """
+
+    def __init__(self, local_timezone=None):
+        self.local_timezone = local_timezone or timezone.get_default_timezone()
+        self.fruit_names = []
+        self.fruit_indexes = {}
+        self.days = array("i")
+        self.hours = array("b")
+        self.fruits = array("i")
+        self.quantities = array("q")
+        self.proceeds = array("q")
+        # UTC offset in seconds of each UTC hour, as DST changes on the hour
+        self.offsets = {}
+
+    def __len__(self):
+        return len(self.days)
+
+    def get_offset(self, hour):
+        offset = self.offsets.get(hour)
+        if offset is None:
+            moment = datetime.fromtimestamp(hour * 3600, self.local_timezone)
+            offset = int(moment.utcoffset().total_seconds())
+            self.offsets[hour] = offset
+        return offset
+
+    def get_fruit_index(self, fruit_name):
+        index = self.fruit_indexes.get(fruit_name)
+        if index is None:
+            index = len(self.fruit_names)
+            self.fruit_names.append(fruit_name)
+            self.fruit_indexes[fruit_name] = index
+        return index
+
+    def extend(self, rows):
+        """
+        Appends (sold_on as UnixTime, fruit_name, quantity, proceeds) rows.
+        """
+        for seconds, fruit_name, quantity, proceeds in rows:
+            seconds += self.get_offset(seconds // 3600)
+            day, seconds_of_day = divmod(seconds, 86400)
+            self.days.append(day)
+            self.hours.append(seconds_of_day // 3600)
+            self.fruits.append(self.get_fruit_index(fruit_name))
+            self.quantities.append(quantity)
+            self.proceeds.append(proceeds or 0)
+
+
+def load_sales_columns(sales, chunk_size=CHUNK_SIZE):
+    """
+    Returns SalesColumns holding the sales of the "sales" queryset, e.g. all
+    of them when the DailyFruitSales or WeekdayHourFruitSales rollup is
+    rebuilt or checked. Only (sold_on, fruit_name, quantity, proceeds) is
+    read, "chunk_size" rows at a time, into one compact array per field
+    rather than one Sale object per row.
+    """
+    columns = SalesColumns()
+    rows = (
+        sales.annotate(seconds=UnixTime("sold_on"))
+        .values_list("seconds", "fruit_name", "quantity", "proceeds")
+        .order_by()
+    )
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            columns.extend(chunk)
+            chunk = []
+    columns.extend(chunk)
+    return columns
+
+
+def summarise_columns_by_day(columns):
+    """
+    Returns {(local date, fruit name): [quantity, proceeds, sale count]} for
+    the sales in "columns", as stats.rollups.summarise_sales_by_day() does.
+    """
+    fruit_names = columns.fruit_names
+    return {
+        (EPOCH + timedelta(days=slot), fruit_names[fruit]): totals
+        for slot, fruit, totals in group_columns(columns)
+    }
+
+
+def summarise_columns_by_hour_of_week(columns):
+    """
+    Returns {(local weekday, hour, fruit name): [quantity, proceeds, sale
+    count]} for the sales in "columns", Monday being weekday 0, as
+    stats.rollups.summarise_sales_by_hour_of_week() does.
+    """
+    fruit_names = columns.fruit_names
+    return {
+        (*divmod(slot, 24), fruit_names[fruit]): totals
+        for slot, fruit, totals in group_columns(columns, hour_of_week=True)
+    }
+
+
+def group_columns(columns, hour_of_week=False):
+    """
+    Helper function for summarise_columns_by_day() and
+    summarise_columns_by_hour_of_week().
+    Yields (slot, fruit, [quantity, proceeds, count]) per group, the slot
+    being the day, or the weekday * 24 + hour if "hour_of_week" is True. The
+    sales are grouped with NumPy if it is installed, or with a single loop
+    over the arrays otherwise.
+    """
+    if not len(columns):
+        return iter(())
+    if numpy is not None:
+        return group_with_numpy(columns, hour_of_week)
+    return group_with_loop(columns, hour_of_week)
+
+
+def group_with_numpy(columns, hour_of_week):
+    """
+    Helper function for group_columns().
+    Sorts the slot and fruit of each sale combined into one key and sums
+    each run of equal keys.
+    """
+    fruit_count = len(columns.fruit_names)
+    keys = numpy.frombuffer(columns.days, dtype=numpy.int32).astype(
+        numpy.int64
+    )
+    if hour_of_week:
+        # 1970-01-01 was a Thursday (weekday 3)
+        keys += 3
+        keys %= 7
+        keys *= 24
+        keys += numpy.frombuffer(columns.hours, dtype=numpy.int8)
+    keys *= fruit_count
+    keys += numpy.frombuffer(columns.fruits, dtype=numpy.int32)
+
+    order = numpy.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.diff(keys, prepend=keys[0] - 1))
+    quantities = numpy.add.reduceat(
+        numpy.frombuffer(columns.quantities, dtype=numpy.int64)[order], starts
+    )
+    proceeds = numpy.add.reduceat(
+        numpy.frombuffer(columns.proceeds, dtype=numpy.int64)[order], starts
+    )
+    counts = numpy.diff(numpy.append(starts, len(keys)))
+
+    for key, quantity, total, count in zip(
+        keys[starts].tolist(),
+        quantities.tolist(),
+        proceeds.tolist(),
+        counts.tolist(),
+    ):
+        yield (*divmod(key, fruit_count), [quantity, total, count])
+
+
+def group_with_loop(columns, hour_of_week):
+    """
+    Helper function for group_columns(), used without NumPy.
+    """
+    groups = {}
+    for day, hour, fruit, quantity, proceeds in zip(
+        columns.days,
+        columns.hours,
+        columns.fruits,
+        columns.quantities,
+        columns.proceeds,
+    ):
+        if hour_of_week:
+            key = (((day + 3) % 7) * 24 + hour, fruit)
+        else:
+            key = (day, fruit)
+        totals = groups.get(key)
+        if totals is None:
+            groups[key] = [quantity, proceeds, 1]
+        else:
+            totals[0] += quantity
+            totals[1] += proceeds
+            totals[2] += 1
+    for (slot, fruit), totals in groups.items():
+        yield slot, fruit, totals
@@ -0,0 +1,121 @@
+from datetime import date
+from django import forms
+from django.utils import timezone
+
+from .aggregates import PERIODS
+from .reports import MAX_BUCKETS, LEADERBOARD_METRICS, count_buckets
+
+# Largest number of fruits that a leaderboard can list
+MAX_LEADERBOARD_FRUITS = 100
+
+# Earliest date that can be selected. The reports work out the day after the
+# range, so dates are kept well inside the range of datetime.date.
+MIN_DATE = date(1900, 1, 1)
+
+
+class DateRangeForm(forms.Form):
+
+    # "from" is a keyword, so that field is added in __init__()
+    to = forms.DateField(
+        label="To",
+        error_messages={
+            "required": "Required.",
+            "invalid": "Please use the format YYYY-MM-DD.",
+        },
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["from"] = forms.DateField(
+            label="From",
+            error_messages={
+                "required": "Required.",
+                "invalid": "Please use the format YYYY-MM-DD.",
+            },
+        )
+        self.order_fields(["from", "to"])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("from")
+        end = cleaned_data.get("to")
+        if start is not None and start < MIN_DATE:
+            self.add_error(
+                "from", f"Please select a date from {MIN_DATE} onwards."
+            )
+            start = None
+        if end is not None and end > timezone.localdate():
+            self.add_error("to", "Please select a date no later than today.")
+            end = None
+        if start is not None and end is not None and start > end:
+            raise forms.ValidationError(
+                "The start date must not be after the end date."
+            )
+        return cleaned_data
+
+
+class StatsReportForm(DateRangeForm):
+
+    by = forms.ChoiceField(
+        label="By",
+        choices=[(period, period.capitalize()) for period in PERIODS],
+        error_messages={
+            "required": "Required.",
+            "invalid_choice": "Please select one of the listed periods.",
+        },
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.order_fields(["from", "to", "by"])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("from")
+        end = cleaned_data.get("to")
+        period = cleaned_data.get("by")
+        if start is None or end is None or period is None:
+            return cleaned_data
+
+        if count_buckets(start, end, period) > MAX_BUCKETS:
+            raise forms.ValidationError(
+                f"The report would have more than {MAX_BUCKETS:,} rows. "
+                "Please select a shorter range or a longer period."
+            )
+        return cleaned_data
+
+
+class StatsLeaderboardForm(DateRangeForm):
+
+    by = forms.ChoiceField(
+        label="By",
+        choices=[
+            (metric, label)
+            for metric, label in zip(
+                LEADERBOARD_METRICS,
+                ["Proceeds", "Quantity", "Number of sales"],
+            )
+        ],
+        error_messages={
+            "required": "Required.",
+            "invalid_choice": "Please select one of the listed totals.",
+        },
+    )
+
+    top = forms.IntegerField(
+        label="Top",
+        min_value=1,
+        max_value=MAX_LEADERBOARD_FRUITS,
+        error_messages={
+            "required": "Required.",
+            "invalid": "Please enter a whole number.",
+            "min_value": "Please enter a number of at least 1.",
+            "max_value": (
+                f"Please enter a number of at most {MAX_LEADERBOARD_FRUITS}."
+            ),
+        },
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.order_fields(["from", "to", "by", "top"])
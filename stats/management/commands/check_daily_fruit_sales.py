@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.rollups import find_daily_fruit_sales_differences
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the daily per-fruit sales rollup with the recorded sales "
+        "and lists the days and fruits where they differ."
+    )
+
+    def handle(self, *args, **options):
+        differences = find_daily_fruit_sales_differences()
+        for date, fruit_name, expected, actual in differences:
+            self.stdout.write(
+                f"{date} {fruit_name}: sales have quantity {expected[0]}, "
+                f"proceeds {expected[1]}, {expected[2]} sales, the rollup "
+                f"has quantity {actual[0]}, proceeds {actual[1]}, "
+                f"{actual[2]} sales"
+            )
+        if differences:
+            raise CommandError(
+                f"{len(differences)} rows differ. Run "
+                '"manage.py rebuild_daily_fruit_sales" to rebuild the rollup.'
+            )
+        self.stdout.write("The daily fruit sales rollup matches the sales.")
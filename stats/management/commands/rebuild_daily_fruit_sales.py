@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from stats.rollups import rebuild_daily_fruit_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily per-fruit sales rollup used by the stats pages "
+        "from all recorded sales."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_fruit_sales()
+        self.stdout.write(f"{rows} daily fruit sales rows written.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from stats.rollups import rebuild_weekday_hour_fruit_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the per-fruit sales rollup by day of the week and hour used "
+        "by the sales heatmap from all recorded sales."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_weekday_hour_fruit_sales()
+        self.stdout.write(f"{rows} weekday hour fruit sales rows written.")
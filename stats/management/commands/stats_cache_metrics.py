@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from stats.cache import get_stats_cache_metrics, reset_stats_cache_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows how often cached stats were served, recomputed or coalesced "
+        "with a recomputation already running in another process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counts after showing them.",
+        )
+
+    def handle(self, *args, **options):
+        metrics = get_stats_cache_metrics()
+        for event, count in metrics.items():
+            self.stdout.write(f"{event}: {count}")
+
+        coalesced = metrics["served_stale"] + metrics["waited"]
+        misses = coalesced + metrics["recomputed"]
+        if misses:
+            self.stdout.write(
+                f"{coalesced / misses:.0%} of cache misses were coalesced."
+            )
+
+        if options["reset"]:
+            reset_stats_cache_metrics()
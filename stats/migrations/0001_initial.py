@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyFruitSales",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("fruit_name", models.CharField(max_length=100)),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("proceeds", models.PositiveIntegerField(default=0)),
+                ("sale_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "daily fruit sales",
+                "verbose_name_plural": "daily fruit sales",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyfruitsales",
+            constraint=models.UniqueConstraint(
+                fields=("date", "fruit_name"),
+                name="dailyfruitsales_unique_date_fruit_name",
+            ),
+        ),
+    ]
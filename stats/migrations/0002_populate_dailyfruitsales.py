@@ -0,0 +1,52 @@
+from django.db import migrations
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+# Kept below SQLite's limit of 999 variables per query
+BATCH_SIZE = 400
+
+
+def populate_daily_fruit_sales(apps, schema_editor):
+    """
+    Builds the rollup from the existing sales, grouped in the DB by sold_on
+    truncated to the day in TIME_ZONE.
+    """
+    Sale = apps.get_model("sales", "Sale")
+    DailyFruitSales = apps.get_model("stats", "DailyFruitSales")
+
+    rows = (
+        Sale.objects.annotate(
+            day=TruncDay("sold_on", tzinfo=timezone.get_default_timezone())
+        )
+        .values_list("day", "fruit_name")
+        .annotate(Sum("quantity"), Sum("proceeds"), Count("pk"))
+        .order_by()
+    )
+    DailyFruitSales.objects.bulk_create(
+        [
+            DailyFruitSales(
+                date=day.date(),
+                fruit_name=fruit_name,
+                quantity=quantity,
+                proceeds=proceeds or 0,
+                sale_count=sale_count,
+            )
+            for day, fruit_name, quantity, proceeds, sale_count in rows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0001_initial"),
+        ("sales", "0008_sale_sale_import"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_daily_fruit_sales, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0002_populate_dailyfruitsales"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeekdayHourFruitSales",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("weekday", models.PositiveSmallIntegerField()),
+                ("hour", models.PositiveSmallIntegerField()),
+                ("fruit_name", models.CharField(max_length=100)),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("proceeds", models.PositiveIntegerField(default=0)),
+                ("sale_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "weekday hour fruit sales",
+                "verbose_name_plural": "weekday hour fruit sales",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="weekdayhourfruitsales",
+            constraint=models.UniqueConstraint(
+                fields=("weekday", "hour", "fruit_name"),
+                name="weekdayhourfruitsales_unique_weekday_hour_fruit_name",
+            ),
+        ),
+    ]
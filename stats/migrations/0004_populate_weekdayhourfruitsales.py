@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import Sum, Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+# Kept below SQLite's limit of 999 variables per query
+BATCH_SIZE = 400
+
+
+def populate_weekday_hour_fruit_sales(apps, schema_editor):
+    """
+    Builds the rollup from the existing sales, grouped in the DB by the day
+    of the week and hour of sold_on in TIME_ZONE.
+    """
+    Sale = apps.get_model("sales", "Sale")
+    WeekdayHourFruitSales = apps.get_model("stats", "WeekdayHourFruitSales")
+
+    local_timezone = timezone.get_default_timezone()
+    rows = (
+        Sale.objects.annotate(
+            weekday=ExtractIsoWeekDay("sold_on", tzinfo=local_timezone),
+            hour=ExtractHour("sold_on", tzinfo=local_timezone),
+        )
+        .values_list("weekday", "hour", "fruit_name")
+        .annotate(Sum("quantity"), Sum("proceeds"), Count("pk"))
+        .order_by()
+    )
+    WeekdayHourFruitSales.objects.bulk_create(
+        [
+            WeekdayHourFruitSales(
+                # ISO weekdays start at 1 for Monday
+                weekday=weekday - 1,
+                hour=hour,
+                fruit_name=fruit_name,
+                quantity=quantity,
+                proceeds=proceeds or 0,
+                sale_count=sale_count,
+            )
+            for weekday, hour, fruit_name, quantity, proceeds, sale_count in rows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0003_weekdayhourfruitsales"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_weekday_hour_fruit_sales,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import models
+
+
+class DailyFruitSales(models.Model):
+
+    # Day in the shop's local timezone (TIME_ZONE) that the sales were made on
+    date = models.DateField()
+
+    fruit_name = models.CharField(max_length=100)
+
+    quantity = models.PositiveIntegerField(default=0)
+
+    proceeds = models.PositiveIntegerField(default=0)
+
+    sale_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "daily fruit sales"
+        verbose_name_plural = "daily fruit sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "fruit_name"],
+                name="dailyfruitsales_unique_date_fruit_name",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.fruit_name}"
+
+
+class WeekdayHourFruitSales(models.Model):
+
+    # Day of the week (0 is Monday) and hour in the shop's local timezone
+    # (TIME_ZONE) that the sales were made in
+    weekday = models.PositiveSmallIntegerField()
+
+    hour = models.PositiveSmallIntegerField()
+
+    fruit_name = models.CharField(max_length=100)
+
+    quantity = models.PositiveIntegerField(default=0)
+
+    proceeds = models.PositiveIntegerField(default=0)
+
+    sale_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "weekday hour fruit sales"
+        verbose_name_plural = "weekday hour fruit sales"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["weekday", "hour", "fruit_name"],
+                name="weekdayhourfruitsales_unique_weekday_hour_fruit_name",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.weekday} {self.hour} {self.fruit_name}"
@@ -0,0 +1,310 @@
+import heapq
+from datetime import datetime, time, timedelta
+from collections import namedtuple
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+from django.utils import timezone
+
+from sales.models import Sale
+from .models import DailyFruitSales, WeekdayHourFruitSales
+from .cache import get_cached_buckets, cache_buckets
+from .aggregates import (
+    PERIODS,
+    FruitBreakdown,
+    summarise_sales_by_fruit,
+    truncate_date,
+)
+
+# Largest number of rows a report can have, so that e.g. hourly reports over
+# several years are rejected rather than built
+MAX_BUCKETS = 1000
+
+# Length of each period, used to step from one row to the next
+PERIOD_STEPS = {
+    "day": relativedelta(days=1),
+    "week": relativedelta(weeks=1),
+    "month": relativedelta(months=1),
+    "year": relativedelta(years=1),
+}
+
+ONE_DAY = timedelta(days=1)
+
+# Rows of the heatmap, from weekday 0
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+HeatmapCell = namedtuple("HeatmapCell", ["quantity", "proceeds", "shade"])
+
+# Totals that fruits can be ranked by in a leaderboard
+LEADERBOARD_METRICS = ("proceeds", "quantity", "sale_count")
+
+LeaderboardEntry = namedtuple(
+    "LeaderboardEntry", ["fruit_name", "proceeds", "quantity", "sale_count"]
+)
+
+
+class Row:
+    """
+    Class representing a row in the table to be displayed on the stats page,
+    including sales details data per day and per month.
+    """
+
+    def __init__(self, date, details):
+        self.date = date
+        # FruitBreakdown of the proceeds and quantity of each fruit, in
+        # descending order of proceeds
+        self.details = details
+        self.proceeds = details.proceeds
+
+
+class Leaderboard:
+    """
+    The top fruits by one of LEADERBOARD_METRICS, as LeaderboardEntry tuples
+    in descending order, and the totals of the rest of the fruits added up
+    as "others" (a LeaderboardEntry without a fruit name).
+    """
+
+    __slots__ = ("metric", "entries", "others", "other_fruit_count")
+
+    def __init__(self, metric, entries, others, other_fruit_count):
+        self.metric = metric
+        self.entries = entries
+        self.others = others
+        self.other_fruit_count = other_fruit_count
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def as_dict(self):
+        """
+        Returns the leaderboard as a dict that can be serialised to JSON.
+        """
+        return {
+            "metric": self.metric,
+            "fruits": [entry._asdict() for entry in self.entries],
+            "others": {
+                "fruit_count": self.other_fruit_count,
+                "proceeds": self.others.proceeds,
+                "quantity": self.others.quantity,
+                "sale_count": self.others.sale_count,
+            },
+        }
+
+
+def count_buckets(start, end, period):
+    """
+    Returns the number of rows in a report on the days from "start" to "end"
+    (both included), without building them.
+    """
+    days = (end - start).days + 1
+    if period == "hour":
+        return days * 24
+    if period == "week":
+        weeks = truncate_date(end, "week") - truncate_date(start, "week")
+        return weeks.days // 7 + 1
+    if period == "month":
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    if period == "year":
+        return end.year - start.year + 1
+    return days
+
+
+def get_local_day_start(day):
+    """
+    Returns midnight at the start of "day" in the current (JPT) timezone.
+    """
+    local_timezone = timezone.get_current_timezone()
+    return timezone.make_aware(datetime.combine(day, time()), local_timezone)
+
+
+def get_bucket_starts(start, end, period):
+    """
+    Returns the start of each period from the one containing "start" to the
+    one containing "end", as local datetimes for hours and dates otherwise.
+    """
+    if period == "hour":
+        # Stepped in UTC, so that each hour is included once across DST
+        # changes, and then converted back to local time
+        first = get_local_day_start(start)
+        local_timezone = timezone.get_current_timezone()
+        return [
+            timezone.localtime(first + timedelta(hours=i), local_timezone)
+            for i in range(count_buckets(start, end, period))
+        ]
+
+    bucket = truncate_date(start, period)
+    step = PERIOD_STEPS[period]
+    buckets = []
+    while bucket <= end:
+        buckets.append(bucket)
+        bucket += step
+    return buckets
+
+
+def summarise_rollup(start, end, period, buckets):
+    """
+    Helper function for build_sales_report().
+    Returns {bucket: FruitBreakdown} for the "buckets" (start dates of the
+    periods from "start" to "end") from the DailyFruitSales rollup. Periods
+    that have closed (ended before today) and are wholly in the range are
+    cached indefinitely, until a sale made in them is written. So usually
+    only the current day, week, month or year is read from the DB.
+    """
+    step = PERIOD_STEPS[period]
+    today = timezone.localtime(timezone.now()).date()
+    closed = [
+        bucket
+        for bucket in buckets
+        if bucket >= start and bucket + step <= min(today, end + ONE_DAY)
+    ]
+    details, keys = get_cached_buckets(period, closed)
+
+    missing = [bucket for bucket in buckets if bucket not in details]
+    if missing:
+        # One range query for all of the missing periods
+        rollup = DailyFruitSales.objects.filter(
+            date__range=(
+                max(start, missing[0]),
+                min(end, missing[-1] + step - ONE_DAY),
+            )
+        )
+        found = summarise_sales_by_fruit(rollup, period, date_field="date")
+        for bucket in missing:
+            details[bucket] = found.get(bucket, FruitBreakdown())
+        cache_buckets(keys, {bucket: details[bucket] for bucket in keys})
+
+    return details
+
+
+def build_sales_report(start, end, period):
+    """
+    Returns a Row for each hour, day, week, month or year ("period") from the
+    one containing the "start" date to the one containing the "end" date,
+    including rows without any sales. Only sales made from "start" to "end"
+    are included, so the first and last weeks, months or years can be
+    partial.
+
+    Reports by day or longer are read from the DailyFruitSales rollup, so
+    their cost depends on the number of days and fruits rather than the
+    number of sales, and closed periods are cached (see summarise_rollup()).
+    Hourly reports are read from the Sale table, through the index on
+    sold_on.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'"{period}" is not one of {", ".join(PERIODS)}.')
+
+    buckets = get_bucket_starts(start, end, period)
+
+    if period == "hour":
+        sales = Sale.objects.filter(
+            sold_on__gte=get_local_day_start(start),
+            sold_on__lt=get_local_day_start(end + timedelta(days=1)),
+        )
+        details = summarise_sales_by_fruit(sales, period)
+    else:
+        details = summarise_rollup(start, end, period, buckets)
+
+    return [
+        Row(date=bucket, details=details.get(bucket, FruitBreakdown()))
+        for bucket in buckets
+    ]
+
+
+def build_recent_sales_report(period, count):
+    """
+    Returns Rows for the current day or month ("period") and the "count" - 1
+    before it, the most recent first, as shown on the stats page.
+    """
+    today = timezone.localtime(timezone.now()).date()
+    start = truncate_date(today, period) - PERIOD_STEPS[period] * (count - 1)
+    return build_sales_report(start, today, period)[::-1]
+
+
+def build_sales_heatmap(fruit_name=None):
+    """
+    Returns a (weekday name, [HeatmapCell for each hour]) row for each day of
+    the week, Monday first, with the quantity and proceeds of all sales (or
+    those of "fruit_name") made in each local hour of that day. The shade of
+    each cell is its proceeds as a fraction of the highest proceeds.
+
+    Read from the WeekdayHourFruitSales rollup, which has at most 7 * 24 rows
+    per fruit, so the cost doesn't grow with the sales.
+    """
+    rollup = WeekdayHourFruitSales.objects.all()
+    if fruit_name:
+        rollup = rollup.filter(fruit_name=fruit_name)
+    totals = {
+        (weekday, hour): (quantity, proceeds)
+        for weekday, hour, quantity, proceeds in rollup.values_list(
+            "weekday", "hour"
+        )
+        .annotate(Sum("quantity"), Sum("proceeds"))
+        .order_by()
+    }
+
+    highest = max((proceeds for _, proceeds in totals.values()), default=0)
+    rows = []
+    for weekday, weekday_name in enumerate(WEEKDAY_NAMES):
+        cells = []
+        for hour in range(24):
+            quantity, proceeds = totals.get((weekday, hour), (0, 0))
+            shade = round(proceeds / highest, 2) if highest else 0
+            cells.append(HeatmapCell(quantity, proceeds, shade))
+        rows.append((weekday_name, cells))
+    return rows
+
+
+def get_heatmap_fruit_names():
+    """
+    Returns the names of the fruits in the WeekdayHourFruitSales rollup.
+    """
+    return list(
+        WeekdayHourFruitSales.objects.values_list("fruit_name", flat=True)
+        .distinct()
+        .order_by("fruit_name")
+    )
+
+
+def build_fruit_leaderboard(start, end, metric="proceeds", count=10):
+    """
+    Returns a Leaderboard of the "count" fruits with the highest "metric"
+    (one of LEADERBOARD_METRICS) in the sales made from "start" to "end"
+    (both included).
+
+    The totals of each fruit are read in one query grouped by fruit from
+    the DailyFruitSales rollup, and the top fruits are picked with a heap
+    of "count" entries rather than by sorting all of the fruits. Ties keep
+    the alphabetical order of the fruit names.
+    """
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(
+            f'"{metric}" is not one of {", ".join(LEADERBOARD_METRICS)}.'
+        )
+
+    rows = (
+        DailyFruitSales.objects.filter(date__range=(start, end))
+        .values("fruit_name")
+        .annotate(
+            proceeds=Sum("proceeds"),
+            quantity=Sum("quantity"),
+            sale_count=Sum("sale_count"),
+        )
+        .order_by("fruit_name")
+        .values_list("fruit_name", "proceeds", "quantity", "sale_count")
+    )
+    fruits = [LeaderboardEntry(*row) for row in rows]
+
+    entries = heapq.nlargest(
+        count, fruits, key=lambda entry: getattr(entry, metric)
+    )
+    others = LeaderboardEntry(
+        None,
+        *(
+            sum(fruit[i] for fruit in fruits)
+            - sum(entry[i] for entry in entries)
+            for i in range(1, 4)
+        ),
+    )
+    return Leaderboard(metric, entries, others, len(fruits) - len(entries))
@@ -0,0 +1,324 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import F, Sum, Count
+from django.db.models.query import QuerySet
+from django.db.models.functions import TruncDay, ExtractHour, Greatest
+from django.utils import timezone
+
+from sales.models import Sale
+from .models import DailyFruitSales, WeekdayHourFruitSales
+from .columnar import (
+    load_sales_columns,
+    summarise_columns_by_day,
+    summarise_columns_by_hour_of_week,
+)
+from .cache import (
+    bump_stats_version,
+    invalidate_buckets,
+    invalidate_all_buckets,
+)
+
+# Number of rollup rows looked up or written per query. Kept below SQLite's
+# limit of 999 variables per query.
+BATCH_SIZE = 400
+
+# Fields of the rollups that changes are added to
+TOTAL_FIELDS = ("quantity", "proceeds", "sale_count")
+
+
+def summarise_sales_by_hour(sales):
+    """
+    Returns {(local date, local hour, fruit name): [quantity, proceeds, sale
+    count]} for "sales", either a queryset or an iterable of Sale objects.
+    Querysets are grouped in the DB by the day and hour of sold_on in
+    TIME_ZONE, so only one row per hour and fruit is fetched.
+    """
+    local_timezone = timezone.get_default_timezone()
+    summary = defaultdict(lambda: [0, 0, 0])
+
+    if isinstance(sales, QuerySet):
+        rows = (
+            sales.annotate(
+                day=TruncDay("sold_on", tzinfo=local_timezone),
+                hour=ExtractHour("sold_on", tzinfo=local_timezone),
+            )
+            .values_list("day", "hour", "fruit_name")
+            .annotate(Sum("quantity"), Sum("proceeds"), Count("pk"))
+            .order_by()
+        )
+        for (
+            day,
+            hour,
+            fruit_name,
+            quantity,
+            proceeds,
+            count,
+        ) in rows.iterator():
+            totals = summary[(day.date(), hour, fruit_name)]
+            totals[0] += quantity
+            totals[1] += proceeds or 0
+            totals[2] += count
+        return summary
+
+    for sale in sales:
+        sold_on = timezone.localtime(sale.sold_on, local_timezone)
+        totals = summary[(sold_on.date(), sold_on.hour, sale.fruit_name)]
+        totals[0] += sale.quantity
+        totals[1] += sale.proceeds or 0
+        totals[2] += 1
+    return summary
+
+
+def fold_summary(summary, get_key):
+    """
+    Returns the totals of a summarise_sales_by_hour() "summary" added up by
+    get_key(date, hour, fruit name).
+    """
+    folded = defaultdict(lambda: [0, 0, 0])
+    for key, totals in summary.items():
+        folded_totals = folded[get_key(*key)]
+        for i, value in enumerate(totals):
+            folded_totals[i] += value
+    return folded
+
+
+def get_day_key(date, hour, fruit_name):
+    return date, fruit_name
+
+
+def get_hour_of_week_key(date, hour, fruit_name):
+    return date.weekday(), hour, fruit_name
+
+
+def summarise_sales_by_day(sales):
+    """
+    Returns {(local date, fruit name): [quantity, proceeds, sale count]} for
+    "sales", as summarise_sales_by_hour() does.
+    """
+    return fold_summary(summarise_sales_by_hour(sales), get_day_key)
+
+
+def summarise_sales_by_hour_of_week(sales):
+    """
+    Returns {(local weekday, local hour, fruit name): [quantity, proceeds,
+    sale count]} for "sales", Monday being weekday 0, as
+    summarise_sales_by_hour() does.
+    """
+    return fold_summary(summarise_sales_by_hour(sales), get_hour_of_week_key)
+
+
+def summarise_all_sales_by_day():
+    """
+    Returns summarise_sales_by_day() for all Sale objects. The sales are
+    grouped in memory from compact columns (see stats.columnar), as grouping
+    by local day in the DB converts the timezone of each sale one at a time
+    in SQLite.
+    """
+    return summarise_columns_by_day(load_sales_columns(Sale.objects.all()))
+
+
+def summarise_all_sales_by_hour_of_week():
+    """
+    Returns summarise_sales_by_hour_of_week() for all Sale objects, grouped
+    in memory as summarise_all_sales_by_day() does.
+    """
+    return summarise_columns_by_hour_of_week(
+        load_sales_columns(Sale.objects.all())
+    )
+
+
+def upsert_rollup_rows(model, key_fields, rows):
+    """
+    Helper function for apply_rollup_changes().
+    Adds the (*key, quantity, proceeds, sale count) "rows" to the rows of the
+    rollup "model" with one INSERT ... ON CONFLICT DO UPDATE statement, which
+    creates the rows of new keys. As the addition is made by the DB, sales
+    written at the same time for a new key can't both try to create its row.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in key_fields]
+    table = quote_name(model._meta.db_table)
+    keys = [quote_name(field.column) for field in fields]
+    totals = [quote_name(name) for name in TOTAL_FIELDS]
+    columns = ", ".join(keys + totals)
+    row_sql = f"({', '.join(['%s'] * (len(keys) + len(totals)))})"
+
+    if connection.vendor == "mysql":
+        updates = ", ".join(
+            f"{name} = {name} + VALUES({name})" for name in totals
+        )
+        conflict = f"ON DUPLICATE KEY UPDATE {updates}"
+    else:
+        updates = ", ".join(
+            f"{name} = {table}.{name} + excluded.{name}" for name in totals
+        )
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+    params = []
+    for row in rows:
+        params.extend(
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, row)
+        )
+        params.extend(row[len(fields) :])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"VALUES {', '.join([row_sql] * len(rows))} {conflict}",
+            params,
+        )
+
+
+def subtract_rollup_rows(model, key_fields, rows):
+    """
+    Helper function for apply_rollup_changes().
+    Adds the (*key, quantity, proceeds, sale count) "rows", which include
+    negative changes, to the existing rows of the rollup "model" with one
+    UPDATE per key, and then deletes the rows left without any sales. The
+    totals don't go below 0 if the rollup was already out of step (which
+    rebuilding it fixes).
+    """
+    for *key, quantity, proceeds, sale_count in rows:
+        model.objects.filter(**dict(zip(key_fields, key))).update(
+            quantity=Greatest(F("quantity") + quantity, 0),
+            proceeds=Greatest(F("proceeds") + proceeds, 0),
+            sale_count=Greatest(F("sale_count") + sale_count, 0),
+        )
+
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch = rows[i : i + BATCH_SIZE]
+        lookups = {
+            f"{name}__in": {row[j] for row in batch}
+            for j, name in enumerate(key_fields)
+        }
+        model.objects.filter(**lookups, sale_count=0).delete()
+
+
+def apply_rollup_changes(model, key_fields, changes):
+    """
+    Adds {key: [quantity, proceeds, sale count]} changes, which are negative
+    for removed sales, to the rows of the rollup "model", whose "key_fields"
+    make up the key. Changes that only add to the totals (e.g. all of those
+    of an upload) are written as upserts, in batches, without the rows being
+    read first. Rows left without any sales are deleted.
+    """
+    # In key order, so that concurrent writers lock rows in the same order
+    additions, subtractions = [], []
+    for key, totals in sorted(changes.items()):
+        if not any(totals):
+            continue
+        if min(totals) < 0:
+            subtractions.append((*key, *totals))
+        else:
+            additions.append((*key, *totals))
+
+    # Kept below SQLite's limit of 999 variables per query
+    rows_per_query = 999 // (len(key_fields) + len(TOTAL_FIELDS))
+    for i in range(0, len(additions), rows_per_query):
+        upsert_rollup_rows(
+            model, key_fields, additions[i : i + rows_per_query]
+        )
+    if subtractions:
+        subtract_rollup_rows(model, key_fields, subtractions)
+
+
+def update_sales_rollups(sender, added=(), removed=(), **kwargs):
+    """
+    Receiver of the sales_changed signal. Moves the quantity, proceeds and
+    count of the added and removed sales into the DailyFruitSales and
+    WeekdayHourFruitSales rollups, so that an edit that changes the day or
+    hour of a sale is taken off the old one and added to the new one.
+    """
+    changes = summarise_sales_by_hour(added)
+    for key, totals in summarise_sales_by_hour(removed).items():
+        change = changes[key]
+        for i, value in enumerate(totals):
+            change[i] -= value
+    day_changes = fold_summary(changes, get_day_key)
+
+    # The sales are usually written in a transaction already, which the
+    # rollup changes join without a savepoint of their own
+    with transaction.atomic(savepoint=False):
+        apply_rollup_changes(
+            DailyFruitSales, ["date", "fruit_name"], day_changes
+        )
+        apply_rollup_changes(
+            WeekdayHourFruitSales,
+            ["weekday", "hour", "fruit_name"],
+            fold_summary(changes, get_hour_of_week_key),
+        )
+    invalidate_buckets(
+        date for (date, _), totals in day_changes.items() if any(totals)
+    )
+
+
+def rebuild_rollup(model, key_fields, summary):
+    """
+    Helper function for rebuild_daily_fruit_sales() and
+    rebuild_weekday_hour_fruit_sales().
+    Replaces the rows of the rollup "model" with the {key: [quantity,
+    proceeds, sale count]} "summary".
+    """
+    with transaction.atomic():
+        model.objects.all().delete()
+        model.objects.bulk_create(
+            [
+                model(
+                    **dict(zip(key_fields, key)),
+                    quantity=quantity,
+                    proceeds=proceeds,
+                    sale_count=sale_count,
+                )
+                for key, (quantity, proceeds, sale_count) in summary.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    bump_stats_version()
+
+
+def rebuild_daily_fruit_sales():
+    """
+    Replaces the DailyFruitSales rollup with one built from all Sale objects
+    and returns the number of rows written.
+    """
+    summary = summarise_all_sales_by_day()
+    rebuild_rollup(DailyFruitSales, ["date", "fruit_name"], summary)
+    invalidate_all_buckets()
+    return len(summary)
+
+
+def rebuild_weekday_hour_fruit_sales():
+    """
+    Replaces the WeekdayHourFruitSales rollup with one built from all Sale
+    objects and returns the number of rows written.
+    """
+    summary = summarise_all_sales_by_hour_of_week()
+    rebuild_rollup(
+        WeekdayHourFruitSales, ["weekday", "hour", "fruit_name"], summary
+    )
+    return len(summary)
+
+
+def find_daily_fruit_sales_differences():
+    """
+    Compares the DailyFruitSales rollup with the Sale table. Returns a (date,
+    fruit name, [quantity, proceeds, sale count] in the Sale table, the same
+    in the rollup) tuple for each day and fruit where they differ.
+    """
+    expected = summarise_all_sales_by_day()
+    actual = {
+        (row.date, row.fruit_name): [
+            row.quantity,
+            row.proceeds,
+            row.sale_count,
+        ]
+        for row in DailyFruitSales.objects.iterator()
+    }
+
+    differences = []
+    for key in sorted(expected.keys() | actual.keys()):
+        expected_totals = expected.get(key, [0, 0, 0])
+        actual_totals = actual.get(key, [0, 0, 0])
+        if expected_totals != actual_totals:
+            differences.append((*key, expected_totals, actual_totals))
+    return differences
@@ -0,0 +1,23 @@
+import pytz
+from datetime import datetime
+
+from sales.models import Sale
+
+
+def local_date_time(value):
+    tz = pytz.timezone("Asia/Tokyo")
+    return tz.localize(datetime.strptime(value, "%Y-%m-%d %H:%M"))
+
+
+def create_sale(fruit, quantity, sold_on):
+    """
+    Creates a Sale object of "fruit" at its current price, sold at the local
+    date and time "sold_on" in the format "YYYY-MM-DD HH:MM".
+    """
+    return Sale.objects.create(
+        fruit=fruit,
+        quantity=quantity,
+        fruit_price_when_sold=fruit.price,
+        proceeds=fruit.price * quantity,
+        sold_on=local_date_time(sold_on),
+    )
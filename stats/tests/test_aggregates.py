@@ -0,0 +1,72 @@
+from datetime import date
+from django.test import TestCase
+
+from stock.models import Fruit
+from sales.models import Sale
+from ..aggregates import FruitBreakdown, FruitTotal, summarise_sales_by_fruit
+from .helpers import local_date_time, create_sale
+
+
+class SummariseSalesByFruitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.apple = Fruit.objects.create(name="apple", price=100)
+        cls.lemon = Fruit.objects.create(name="lemon", price=50)
+        cls.kiwi = Fruit.objects.create(name="kiwi", price=200)
+        sales = [
+            (cls.apple, 1, "2020-04-15 10:00"),
+            (cls.apple, 2, "2020-04-15 11:00"),
+            (cls.lemon, 6, "2020-04-15 12:00"),
+            (cls.kiwi, 1, "2020-04-16 08:30"),
+            (cls.lemon, 1, "2020-05-01 00:00"),
+        ]
+        for fruit, quantity, sold_on in sales:
+            create_sale(fruit, quantity, sold_on)
+
+    def test_sales_are_grouped_by_fruit_in_descending_order_of_proceeds(self):
+        with self.assertNumQueries(1):
+            breakdown = summarise_sales_by_fruit(Sale.objects.all())
+        self.assertEqual(
+            list(breakdown),
+            [
+                FruitTotal("lemon", 350, 7),
+                FruitTotal("apple", 300, 3),
+                FruitTotal("kiwi", 200, 1),
+            ],
+        )
+        self.assertEqual(breakdown.proceeds, 850)
+        self.assertEqual(breakdown.quantity, 11)
+
+    def test_equal_proceeds_are_sorted_by_quantity(self):
+        breakdown = summarise_sales_by_fruit(
+            Sale.objects.filter(
+                sold_on__lt=local_date_time("2020-04-16 00:00")
+            )
+        )
+        self.assertEqual(
+            list(breakdown),
+            [FruitTotal("lemon", 300, 6), FruitTotal("apple", 300, 3)],
+        )
+
+    def test_sales_are_grouped_by_local_day_and_month(self):
+        days = summarise_sales_by_fruit(Sale.objects.all(), "day")
+        self.assertEqual(
+            {day: breakdown.as_dict() for day, breakdown in days.items()},
+            {
+                date(2020, 4, 15): {"lemon": [300, 6], "apple": [300, 3]},
+                date(2020, 4, 16): {"kiwi": [200, 1]},
+                date(2020, 5, 1): {"lemon": [50, 1]},
+            },
+        )
+        months = summarise_sales_by_fruit(Sale.objects.all(), "month")
+        self.assertEqual(list(months), [date(2020, 4, 1), date(2020, 5, 1)])
+        self.assertEqual(months[date(2020, 4, 1)].proceeds, 800)
+
+    def test_no_sales(self):
+        breakdown = summarise_sales_by_fruit(Sale.objects.none())
+        self.assertEqual(len(breakdown), 0)
+        self.assertEqual(breakdown.proceeds, 0)
+        self.assertEqual(
+            summarise_sales_by_fruit(Sale.objects.none(), "day"), {}
+        )
+        self.assertEqual(FruitBreakdown().as_dict(), {})
@@ -0,0 +1,69 @@
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import TestCase, override_settings
+
+from stock.models import Fruit
+from sales.models import Sale
+from ..rollups import summarise_sales_by_day, summarise_sales_by_hour_of_week
+from ..columnar import (
+    load_sales_columns,
+    summarise_columns_by_day,
+    summarise_columns_by_hour_of_week,
+)
+
+
+class ColumnarSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fruits = [
+            Fruit.objects.create(name=name, price=100)
+            for name in ["apple", "lemon", "kiwi"]
+        ]
+        # Sales every 7 hours and 13 minutes, so that they fall on both sides
+        # of midnight in Tokyo and New York, and across DST changes there
+        start = datetime(2020, 3, 1, tzinfo=dt_timezone.utc)
+        sales = []
+        for i in range(300):
+            fruit = fruits[i % 3]
+            sales.append(
+                Sale(
+                    fruit=fruit,
+                    fruit_name=fruit.name,
+                    quantity=i % 5 + 1,
+                    proceeds=None if i % 50 == 0 else (i % 5 + 1) * 100,
+                    sold_on=start + i * timedelta(hours=7, minutes=13),
+                    dedup_key=str(i),
+                )
+            )
+        Sale.objects.bulk_create(sales)
+
+    def assertMatchesDB(self, chunk_size=20000):
+        columns = load_sales_columns(Sale.objects.all(), chunk_size=chunk_size)
+        self.assertEqual(len(columns), 300)
+        self.assertEqual(
+            summarise_columns_by_day(columns),
+            dict(summarise_sales_by_day(Sale.objects.all())),
+        )
+        self.assertEqual(
+            summarise_columns_by_hour_of_week(columns),
+            dict(summarise_sales_by_hour_of_week(Sale.objects.all())),
+        )
+
+    def test_columnar_summary_matches_db_summary(self):
+        self.assertMatchesDB()
+        self.assertMatchesDB(chunk_size=7)
+
+    def test_columnar_summary_without_numpy(self):
+        with mock.patch("stats.columnar.numpy", None):
+            self.assertMatchesDB()
+
+    @override_settings(TIME_ZONE="America/New_York")
+    def test_columnar_summary_across_dst_changes(self):
+        self.assertMatchesDB()
+        with mock.patch("stats.columnar.numpy", None):
+            self.assertMatchesDB()
+
+    def test_no_sales(self):
+        columns = load_sales_columns(Sale.objects.none())
+        self.assertEqual(summarise_columns_by_day(columns), {})
+        self.assertEqual(summarise_columns_by_hour_of_week(columns), {})
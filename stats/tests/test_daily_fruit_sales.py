@@ -0,0 +1,202 @@
+from io import StringIO
+from datetime import date
+
+from django.urls import reverse
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from users.models import CustomUser
+from stock.models import Fruit
+from sales.models import Sale
+from sales.imports import generate_sale_objects, delete_sale_import
+from ..models import DailyFruitSales
+from ..rollups import (
+    apply_rollup_changes,
+    rebuild_daily_fruit_sales,
+    find_daily_fruit_sales_differences,
+)
+from .helpers import local_date_time, create_sale
+
+
+class DailyFruitSalesTests(TestCase):
+    def setUp(self):
+        self.apple = Fruit.objects.create(name="apple", price=100)
+        self.lemon = Fruit.objects.create(name="lemon", price=120)
+
+    def get_rollup(self):
+        return {
+            (row.date, row.fruit_name): (
+                row.quantity,
+                row.proceeds,
+                row.sale_count,
+            )
+            for row in DailyFruitSales.objects.all()
+        }
+
+    def test_created_sales_are_added_to_their_local_day(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 2, "2020-04-15 23:30")
+        # 08:30 in Tokyo is still the previous day in UTC
+        create_sale(self.apple, 3, "2020-04-16 08:30")
+        create_sale(self.lemon, 1, "2020-04-15 12:00")
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (date(2020, 4, 15), "apple"): (3, 300, 2),
+                (date(2020, 4, 16), "apple"): (3, 300, 1),
+                (date(2020, 4, 15), "lemon"): (1, 120, 1),
+            },
+        )
+
+    def test_updated_sale_is_moved_to_its_new_day(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        sale = create_sale(self.lemon, 5, "2020-04-15 10:00")
+        create_sale(self.lemon, 1, "2020-04-15 11:00")
+
+        response = self.client.get(reverse("sale_update", args=[sale.pk]))
+        data = response.context["form"].initial
+        data["quantity"] = 10
+        data["sold_on"] = local_date_time("2020-03-01 12:00")
+        self.client.post(reverse("sale_update", args=[sale.pk]), data)
+
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (date(2020, 4, 15), "lemon"): (1, 120, 1),
+                (date(2020, 3, 1), "lemon"): (10, 1200, 1),
+            },
+        )
+
+    def test_deleted_sale_is_taken_off_its_day(self):
+        sale = create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 2, "2020-04-15 11:00")
+        other_sale = create_sale(self.lemon, 1, "2020-04-15 12:00")
+        sale.delete()
+        # Days and fruits left without sales don't keep a row
+        Sale.objects.get(pk=other_sale.pk).delete()
+        self.assertEqual(
+            self.get_rollup(), {(date(2020, 4, 15), "apple"): (2, 200, 1)}
+        )
+
+    def test_sales_loaded_with_deferred_fields_are_updated_and_deleted(self):
+        sale = create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 2, "2020-04-16 10:00")
+
+        deferred = Sale.objects.only("quantity").get(pk=sale.pk)
+        deferred.sold_on = local_date_time("2020-04-16 11:00")
+        deferred.save()
+        self.assertEqual(
+            self.get_rollup(), {(date(2020, 4, 16), "apple"): (3, 300, 2)}
+        )
+
+        Sale.objects.only("quantity").get(pk=sale.pk).delete()
+        self.assertEqual(
+            self.get_rollup(), {(date(2020, 4, 16), "apple"): (2, 200, 1)}
+        )
+
+    def test_uploaded_sales_are_added_once(self):
+        rows = [
+            ["apple", "1", "100", "2020-04-15 10:00"],
+            ["apple", "2", "200", "2020-04-15 11:00"],
+            ["lemon", "1", "120", "2020-04-16 10:00"],
+        ]
+        generate_sale_objects(rows)
+        # Identical rows aren't written again, so aren't counted again
+        generate_sale_objects(
+            rows + [["lemon", "2", "240", "2020-04-16 11:00"]]
+        )
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (date(2020, 4, 15), "apple"): (3, 300, 2),
+                (date(2020, 4, 16), "lemon"): (3, 360, 2),
+            },
+        )
+        self.assertEqual(find_daily_fruit_sales_differences(), [])
+
+    def test_deleted_upload_is_taken_off_the_rollup(self):
+        create_sale(self.apple, 5, "2020-04-15 09:00")
+        summary = generate_sale_objects(
+            [
+                ["apple", "1", "100", "2020-04-15 10:00"],
+                ["lemon", "1", "120", "2020-04-16 10:00"],
+            ]
+        )
+        delete_sale_import(summary.sale_import)
+        self.assertEqual(
+            self.get_rollup(), {(date(2020, 4, 15), "apple"): (5, 500, 1)}
+        )
+
+    def test_changes_are_added_to_rows_created_meanwhile(self):
+        # Another writer created the row after the changes were summarised
+        DailyFruitSales.objects.create(
+            date=date(2020, 4, 15),
+            fruit_name="apple",
+            quantity=1,
+            proceeds=100,
+            sale_count=1,
+        )
+        with self.assertNumQueries(1):
+            apply_rollup_changes(
+                DailyFruitSales,
+                ["date", "fruit_name"],
+                {
+                    (date(2020, 4, 15), "apple"): [2, 200, 1],
+                    (date(2020, 4, 16), "apple"): [3, 300, 1],
+                },
+            )
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (date(2020, 4, 15), "apple"): (3, 300, 2),
+                (date(2020, 4, 16), "apple"): (3, 300, 1),
+            },
+        )
+
+    def test_removing_more_than_the_rollup_holds(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        # The rollup is out of step, e.g. after sales were deleted in the DB
+        apply_rollup_changes(
+            DailyFruitSales,
+            ["date", "fruit_name"],
+            {
+                (date(2020, 4, 15), "apple"): [-5, -500, -1],
+                (date(2020, 4, 16), "apple"): [-1, -100, -1],
+            },
+        )
+        self.assertEqual(self.get_rollup(), {})
+
+    def test_rebuild_command_replaces_the_rollup(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.lemon, 2, "2020-04-16 10:00")
+        DailyFruitSales.objects.filter(fruit_name="apple").update(quantity=9)
+        DailyFruitSales.objects.create(
+            date=date(2020, 1, 1), fruit_name="kiwi", quantity=1, sale_count=1
+        )
+        expected = {
+            (date(2020, 4, 15), "apple"): (1, 100, 1),
+            (date(2020, 4, 16), "lemon"): (2, 240, 1),
+        }
+
+        out = StringIO()
+        call_command("rebuild_daily_fruit_sales", stdout=out)
+        self.assertIn("2 daily fruit sales rows written.", out.getvalue())
+        self.assertEqual(self.get_rollup(), expected)
+        self.assertEqual(rebuild_daily_fruit_sales(), 2)
+        self.assertEqual(self.get_rollup(), expected)
+
+    def test_check_command_lists_differences(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        out = StringIO()
+        call_command("check_daily_fruit_sales", stdout=out)
+        self.assertIn("matches the sales", out.getvalue())
+
+        DailyFruitSales.objects.update(quantity=9)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 rows differ."):
+            call_command("check_daily_fruit_sales", stdout=out)
+        self.assertIn(
+            "2020-04-15 apple: sales have quantity 1", out.getvalue()
+        )
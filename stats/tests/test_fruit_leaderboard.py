@@ -0,0 +1,188 @@
+from datetime import date
+from django.urls import reverse
+from django.test import TestCase
+from django.core.cache import cache
+
+from users.models import CustomUser
+from stock.models import Fruit
+from ..reports import build_fruit_leaderboard
+from .helpers import create_sale
+
+from freezegun import freeze_time
+
+
+class FruitLeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # fruit, price, quantity of each sale, days of the sales in April
+        sales = [
+            ("apple", 100, 1, [10, 11, 12, 13]),
+            ("banana", 50, 10, [10]),
+            ("kiwi", 300, 1, [11, 12]),
+            ("lemon", 120, 1, [14]),
+            ("melon", 1000, 1, [1]),
+        ]
+        for name, price, quantity, days in sales:
+            fruit = Fruit.objects.create(name=name, price=price)
+            for day in days:
+                create_sale(fruit, quantity, f"2020-04-{day:02d} 12:00")
+
+    def get_fruits(self, leaderboard):
+        return [entry.fruit_name for entry in leaderboard]
+
+    def test_top_fruits_by_each_metric(self):
+        start, end = date(2020, 4, 10), date(2020, 4, 14)
+        leaderboard = build_fruit_leaderboard(start, end, "proceeds", 2)
+        self.assertEqual(self.get_fruits(leaderboard), ["kiwi", "banana"])
+        self.assertEqual(leaderboard.entries[0], ("kiwi", 600, 2, 2))
+
+        leaderboard = build_fruit_leaderboard(start, end, "quantity", 2)
+        self.assertEqual(self.get_fruits(leaderboard), ["banana", "apple"])
+
+        leaderboard = build_fruit_leaderboard(start, end, "sale_count", 2)
+        self.assertEqual(self.get_fruits(leaderboard), ["apple", "kiwi"])
+
+    def test_other_fruits_are_added_up(self):
+        leaderboard = build_fruit_leaderboard(
+            date(2020, 4, 10), date(2020, 4, 14), "proceeds", 2
+        )
+        self.assertEqual(leaderboard.other_fruit_count, 2)
+        self.assertEqual(leaderboard.others, (None, 520, 5, 5))
+        self.assertEqual(
+            leaderboard.as_dict()["others"],
+            {
+                "fruit_count": 2,
+                "proceeds": 520,
+                "quantity": 5,
+                "sale_count": 5,
+            },
+        )
+
+        leaderboard = build_fruit_leaderboard(
+            date(2020, 4, 1), date(2020, 4, 30), "proceeds", 10
+        )
+        self.assertEqual(len(leaderboard), 5)
+        self.assertEqual(leaderboard.other_fruit_count, 0)
+        self.assertEqual(leaderboard.others, (None, 0, 0, 0))
+
+    def test_only_sales_in_the_range_are_ranked(self):
+        leaderboard = build_fruit_leaderboard(
+            date(2020, 4, 1), date(2020, 4, 1), "proceeds", 3
+        )
+        self.assertEqual(self.get_fruits(leaderboard), ["melon"])
+
+        leaderboard = build_fruit_leaderboard(
+            date(2021, 1, 1), date(2021, 1, 31), "proceeds", 3
+        )
+        self.assertEqual(len(leaderboard), 0)
+
+    def test_ties_are_in_alphabetical_order(self):
+        # apple and lemon have one sale each on the 13th and 14th
+        leaderboard = build_fruit_leaderboard(
+            date(2020, 4, 13), date(2020, 4, 14), "sale_count", 1
+        )
+        self.assertEqual(self.get_fruits(leaderboard), ["apple"])
+
+    def test_leaderboard_is_read_in_one_query(self):
+        with self.assertNumQueries(1):
+            build_fruit_leaderboard(
+                date(2020, 1, 1), date(2020, 12, 31), "quantity", 3
+            )
+
+    def test_unknown_metric_is_rejected(self):
+        with self.assertRaises(ValueError):
+            build_fruit_leaderboard(
+                date(2020, 1, 1), date(2020, 12, 31), "price", 3
+            )
+
+
+class StatsLeaderboardViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        for name, price, quantity in [
+            ("apple", 100, 3),
+            ("lemon", 120, 1),
+            ("kiwi", 300, 2),
+        ]:
+            fruit = Fruit.objects.create(name=name, price=price)
+            create_sale(fruit, quantity, "2020-04-15 10:00")
+
+    def test_stats_leaderboard_view_redirection_when_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("stats_leaderboard"))
+        self.assertRedirects(
+            response, "/accounts/login/?next=/stats/leaderboard/"
+        )
+
+    @freeze_time("2020-04-17")
+    def test_stats_leaderboard_view_defaults_to_last_30_days(self):
+        response = self.client.get(reverse("stats_leaderboard"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["from"], "2020-03-19")
+        self.assertEqual(data["to"], "2020-04-17")
+        self.assertEqual(data["metric"], "proceeds")
+        self.assertEqual(
+            [fruit["fruit_name"] for fruit in data["fruits"]],
+            ["kiwi", "apple", "lemon"],
+        )
+        self.assertEqual(
+            data["fruits"][0],
+            {
+                "fruit_name": "kiwi",
+                "proceeds": 600,
+                "quantity": 2,
+                "sale_count": 1,
+            },
+        )
+
+    def test_stats_leaderboard_view_with_range_metric_and_count(self):
+        response = self.client.get(
+            reverse("stats_leaderboard"),
+            {"from": "2020-04-01", "to": "2020-04-30", "by": "quantity"},
+        )
+        self.assertEqual(
+            [fruit["fruit_name"] for fruit in response.json()["fruits"]],
+            ["apple", "kiwi", "lemon"],
+        )
+
+        response = self.client.get(
+            reverse("stats_leaderboard"),
+            {"from": "2020-04-01", "to": "2020-04-30", "top": "1"},
+        )
+        data = response.json()
+        self.assertEqual(len(data["fruits"]), 1)
+        self.assertEqual(data["others"]["fruit_count"], 2)
+        self.assertEqual(data["others"]["proceeds"], 420)
+
+    def test_stats_leaderboard_view_rejects_invalid_parameters(self):
+        response = self.client.get(
+            reverse("stats_leaderboard"),
+            {"from": "2020-05-01", "to": "2020-04-01"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"]["__all__"],
+            ["The start date must not be after the end date."],
+        )
+
+        response = self.client.get(
+            reverse("stats_leaderboard"), {"by": "price", "top": "0"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"]), {"by", "top"})
+
+    @freeze_time("2020-04-17")
+    def test_stats_list_view_shows_top_fruits(self):
+        response = self.client.get(reverse("stats_list"))
+        self.assertEqual(
+            [entry.fruit_name for entry in response.context["leaderboard"]],
+            ["kiwi", "apple", "lemon"],
+        )
+        self.assertContains(
+            response, "<p>Top fruits for the last 30 days:</p>", 1
+        )
+        self.assertContains(response, "<td>Kiwi</td>", 1)
+        self.assertNotContains(response, "Others (")
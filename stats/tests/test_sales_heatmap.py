@@ -0,0 +1,182 @@
+from io import StringIO
+
+from django.urls import reverse
+from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+
+from users.models import CustomUser
+from stock.models import Fruit
+from sales.imports import generate_sale_objects, delete_sale_import
+from ..models import WeekdayHourFruitSales
+from ..reports import build_sales_heatmap
+from ..rollups import summarise_all_sales_by_hour_of_week
+from .helpers import local_date_time, create_sale
+
+
+class WeekdayHourFruitSalesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.apple = Fruit.objects.create(name="apple", price=100)
+        self.lemon = Fruit.objects.create(name="lemon", price=120)
+
+    def get_rollup(self):
+        return {
+            (row.weekday, row.hour, row.fruit_name): (
+                row.quantity,
+                row.proceeds,
+                row.sale_count,
+            )
+            for row in WeekdayHourFruitSales.objects.all()
+        }
+
+    def test_sales_are_added_to_their_local_weekday_and_hour(self):
+        # 2020-04-15 was a Wednesday (weekday 2)
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 2, "2020-04-22 10:59")
+        # 08:30 on Thursday in Tokyo is still Wednesday in UTC
+        create_sale(self.lemon, 1, "2020-04-16 08:30")
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (2, 10, "apple"): (3, 300, 2),
+                (3, 8, "lemon"): (1, 120, 1),
+            },
+        )
+
+    def test_updated_and_deleted_sales_are_moved_and_taken_off(self):
+        sale = create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.lemon, 1, "2020-04-15 10:00")
+        sale.sold_on = local_date_time("2020-04-18 21:00")
+        sale.save()
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (5, 21, "apple"): (1, 100, 1),
+                (2, 10, "lemon"): (1, 120, 1),
+            },
+        )
+        sale.delete()
+        self.assertEqual(self.get_rollup(), {(2, 10, "lemon"): (1, 120, 1)})
+
+    def test_uploaded_and_deleted_imports_update_the_rollup(self):
+        create_sale(self.apple, 5, "2020-04-15 09:00")
+        summary = generate_sale_objects(
+            [
+                ["apple", "1", "100", "2020-04-15 09:30"],
+                ["lemon", "1", "120", "2020-04-19 23:00"],
+            ]
+        )
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (2, 9, "apple"): (6, 600, 2),
+                (6, 23, "lemon"): (1, 120, 1),
+            },
+        )
+        delete_sale_import(summary.sale_import)
+        self.assertEqual(self.get_rollup(), {(2, 9, "apple"): (5, 500, 1)})
+
+    def test_rebuild_command_replaces_the_rollup(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.lemon, 2, "2020-04-16 10:00")
+        WeekdayHourFruitSales.objects.filter(fruit_name="apple").update(
+            quantity=9
+        )
+        WeekdayHourFruitSales.objects.create(
+            weekday=0, hour=0, fruit_name="kiwi", quantity=1, sale_count=1
+        )
+
+        out = StringIO()
+        call_command("rebuild_weekday_hour_fruit_sales", stdout=out)
+        self.assertIn(
+            "2 weekday hour fruit sales rows written.", out.getvalue()
+        )
+        self.assertEqual(
+            self.get_rollup(),
+            {
+                (2, 10, "apple"): (1, 100, 1),
+                (3, 10, "lemon"): (2, 240, 1),
+            },
+        )
+
+    def test_columnar_summary_matches_the_rollup(self):
+        for day in range(1, 15):
+            create_sale(self.apple, day, f"2020-03-{day:02d} {day}:15")
+            create_sale(self.lemon, 1, f"2020-03-{day:02d} 23:45")
+        self.assertEqual(
+            dict(summarise_all_sales_by_hour_of_week()),
+            {key: list(totals) for key, totals in self.get_rollup().items()},
+        )
+
+    def test_heatmap_has_a_cell_for_each_weekday_and_hour(self):
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 3, "2020-04-22 10:30")
+        create_sale(self.lemon, 1, "2020-04-19 23:00")
+        rows = build_sales_heatmap()
+        self.assertEqual([name for name, _ in rows][0], "Mon")
+        self.assertEqual([len(cells) for _, cells in rows], [24] * 7)
+        self.assertEqual(rows[2][1][10], (4, 400, 1))
+        self.assertEqual(rows[6][1][23], (1, 120, 0.3))
+        self.assertEqual(rows[0][1][0], (0, 0, 0))
+
+        rows = build_sales_heatmap("lemon")
+        self.assertEqual(rows[2][1][10], (0, 0, 0))
+        self.assertEqual(rows[6][1][23], (1, 120, 1))
+
+    def test_heatmap_query_count_does_not_depend_on_sales(self):
+        for minute in range(60):
+            create_sale(self.apple, 1, f"2020-04-15 10:{minute:02d}")
+        with self.assertNumQueries(1):
+            rows = build_sales_heatmap()
+        self.assertEqual(rows[2][1][10].proceeds, 6000)
+
+
+class StatsHeatmapViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        apple = Fruit.objects.create(name="apple", price=100)
+        lemon = Fruit.objects.create(name="lemon", price=120)
+        for fruit, sold_on in [
+            (apple, "2020-04-15 10:00"),
+            (lemon, "2020-04-16 12:00"),
+        ]:
+            create_sale(fruit, 2, sold_on)
+
+    def test_stats_heatmap_view_redirection_when_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("stats_heatmap"))
+        self.assertRedirects(response, "/accounts/login/?next=/stats/heatmap/")
+
+    def test_stats_heatmap_view(self):
+        response = self.client.get(reverse("stats_heatmap"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "stats/stats_heatmap.html")
+        self.assertEqual(response.context["fruit_names"], ["apple", "lemon"])
+        self.assertContains(response, "¥200 (2)", 1)
+        self.assertContains(response, "¥240 (2)", 1)
+
+    def test_stats_heatmap_view_for_one_fruit(self):
+        response = self.client.get(
+            reverse("stats_heatmap"), {"fruit": "lemon"}
+        )
+        self.assertEqual(response.context["fruit_name"], "lemon")
+        self.assertNotContains(response, "¥200 (2)")
+        self.assertContains(response, "¥240 (2)", 1)
+
+        # Unknown fruits show all sales
+        response = self.client.get(reverse("stats_heatmap"), {"fruit": "kiwi"})
+        self.assertEqual(response.context["fruit_name"], "")
+        self.assertContains(response, "¥200 (2)", 1)
+
+    def test_stats_heatmap_view_is_cached_until_sales_are_written(self):
+        self.client.get(reverse("stats_heatmap"))
+        # Session and user lookups only
+        with self.assertNumQueries(2):
+            self.client.get(reverse("stats_heatmap"))
+
+        create_sale(Fruit.objects.get(name="apple"), 5, "2020-04-17 09:00")
+        response = self.client.get(reverse("stats_heatmap"))
+        self.assertContains(response, "¥500 (5)", 1)
@@ -0,0 +1,170 @@
+import time
+from unittest import mock
+from django.urls import reverse
+from django.test import TestCase
+from django.core.cache import cache
+
+from users.models import CustomUser
+from stock.models import Fruit
+from ..cache import get_stats_version
+from .helpers import create_sale
+
+from freezegun import freeze_time
+
+
+@freeze_time("2020-04-17 12:00")
+class StatsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        self.apple = Fruit.objects.create(name="apple", price=100)
+        self.lemon = Fruit.objects.create(name="lemon", price=120)
+        create_sale(self.apple, 2, "2020-04-17 10:00")
+        create_sale(self.lemon, 1, "2020-04-16 10:00")
+        create_sale(self.apple, 1, "2020-03-01 10:00")
+
+    def test_stats_api_view_redirection_when_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("stats_api"))
+        self.assertRedirects(response, "/accounts/login/?next=/stats/api/")
+
+    def test_stats_api_view_returns_the_stats_page_buckets(self):
+        response = self.client.get(reverse("stats_api"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        data = response.json()
+        self.assertEqual(data["total_proceeds"], 420)
+        self.assertEqual(
+            [(row["date"], row["proceeds"]) for row in data["day_sales"]],
+            [("2020-04-17", 200), ("2020-04-16", 120), ("2020-04-15", 0)],
+        )
+        self.assertEqual(
+            data["day_sales"][0]["fruits"],
+            [{"fruit_name": "apple", "proceeds": 200, "quantity": 2}],
+        )
+        self.assertEqual(
+            [(row["date"], row["proceeds"]) for row in data["month_sales"]],
+            [("2020-04-01", 320), ("2020-03-01", 100), ("2020-02-01", 0)],
+        )
+        self.assertEqual(data["top_fruits"]["days"], 30)
+        self.assertEqual(
+            [fruit["fruit_name"] for fruit in data["top_fruits"]["fruits"]],
+            ["apple", "lemon"],
+        )
+
+    def test_stats_api_view_sends_a_strong_etag(self):
+        response = self.client.get(reverse("stats_api"))
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        # The same stats have the same ETag
+        response = self.client.get(reverse("stats_api"))
+        self.assertEqual(response["ETag"], etag)
+
+    def test_unchanged_stats_are_not_modified(self):
+        etag = self.client.get(reverse("stats_api"))["ETag"]
+        with mock.patch(
+            "stats.views.build_stats_api_content"
+        ) as build_content:
+            # Session and user lookups only
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+                )
+        build_content.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_etag_changes_when_sales_are_written(self):
+        etag = self.client.get(reverse("stats_api"))["ETag"]
+        sale = create_sale(self.lemon, 5, "2020-04-17 11:00")
+        response = self.client.get(
+            reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["total_proceeds"], 1020)
+
+        etag = response["ETag"]
+        sale.delete()
+        response = self.client.get(
+            reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_proceeds"], 420)
+
+    def test_stale_stats_keep_their_own_etag(self):
+        etag = self.client.get(reverse("stats_api"))["ETag"]
+        create_sale(self.lemon, 5, "2020-04-17 11:00")
+
+        # Another process is recomputing the stats after the write, so the
+        # previous stats are served with the ETag they were built for
+        lock_key = f"stats:api:{get_stats_version()}:2020-04-17:lock"
+        cache.add(lock_key, 1)
+        response = self.client.get(reverse("stats_api"))
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["total_proceeds"], 420)
+        response = self.client.get(
+            reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Once the stats are recomputed, the same client gets them
+        cache.delete(lock_key)
+        response = self.client.get(
+            reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["total_proceeds"], 1020)
+
+    def test_etag_changes_at_midnight(self):
+        etag = self.client.get(reverse("stats_api"))["ETag"]
+        # Midnight in Tokyo
+        with freeze_time("2020-04-17 15:00"):
+            response = self.client.get(
+                reverse("stats_api"), HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["day_sales"][0]["date"], "2020-04-18")
+
+
+# The clock ticks so that time.perf_counter() isn't frozen along with it
+@freeze_time("2020-04-17 12:00", tick=True)
+class StatsApiResponseTimeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+
+    def test_payload_size_and_response_time(self):
+        # 51 fruits sold on each of the three days shown
+        for i in range(51):
+            fruit = Fruit.objects.create(name=f"fruit {i:02d}", price=100)
+            for day in range(15, 18):
+                create_sale(fruit, 1, f"2020-04-{day} 09:00")
+
+        started = time.perf_counter()
+        response = self.client.get(reverse("stats_api"))
+        first_seconds = time.perf_counter() - started
+        html = self.client.get(reverse("stats_list"))
+
+        self.assertEqual(len(response.json()["day_sales"][0]["fruits"]), 51)
+        # Compact JSON is smaller than the rendered stats page
+        self.assertLess(len(response.content), 20_000)
+        self.assertLess(len(response.content), len(html.content))
+
+        started = time.perf_counter()
+        response = self.client.get(
+            reverse("stats_api"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        not_modified_seconds = time.perf_counter() - started
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(response.content), 0)
+        # Generous bounds, to catch the stats being rebuilt rather than to
+        # benchmark them
+        self.assertLess(first_seconds, 5)
+        self.assertLess(not_modified_seconds, 1)
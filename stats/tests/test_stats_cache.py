@@ -0,0 +1,273 @@
+import re
+import time
+import pytz
+import threading
+from unittest import mock
+from io import StringIO
+from datetime import date, datetime, timedelta
+from django.urls import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+
+from users.models import CustomUser
+from stock.models import Fruit
+from sales.models import Sale
+from sales.imports import generate_sale_objects, delete_sale_import
+from ..models import DailyFruitSales
+from ..reports import build_sales_report, build_recent_sales_report
+from ..cache import (
+    VERSION_KEY,
+    get_stats_version,
+    get_cached_stats,
+    get_seconds_until_tomorrow,
+    get_stats_cache_metrics,
+    bump_stats_version,
+    invalidate_buckets,
+)
+from .helpers import local_date_time, create_sale
+
+from freezegun import freeze_time
+
+
+class StatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.apple = Fruit.objects.create(name="apple", price=100)
+
+    def assertVersionBumped(self, write):
+        version = get_stats_version()
+        write()
+        self.assertGreater(get_stats_version(), version)
+
+    def test_sale_writes_bump_the_version(self):
+        sale = create_sale(self.apple, 1, "2020-04-15 10:00")
+
+        def update_sale():
+            sale.quantity = 2
+            sale.save()
+
+        self.assertVersionBumped(
+            lambda: create_sale(self.apple, 3, "2020-04-15 11:00")
+        )
+        self.assertVersionBumped(update_sale)
+        self.assertVersionBumped(sale.delete)
+
+    def test_uploads_and_rebuilds_bump_the_version(self):
+        rows = [["apple", "1", "100", "2020-04-15 10:00"]]
+        self.assertVersionBumped(lambda: generate_sale_objects(rows))
+        sale_import = Sale.objects.get().sale_import
+        self.assertVersionBumped(lambda: delete_sale_import(sale_import))
+        self.assertVersionBumped(
+            lambda: call_command(
+                "rebuild_daily_fruit_sales", stdout=StringIO()
+            )
+        )
+
+    def test_evicted_version_does_not_restart(self):
+        version = get_stats_version()
+        cache.delete(VERSION_KEY)
+        self.assertGreater(get_stats_version(), version)
+
+    def test_cached_stats_are_kept_until_a_write(self):
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return len(computed)
+
+        self.assertEqual(get_cached_stats("test", compute), 1)
+        self.assertEqual(get_cached_stats("test", compute), 1)
+        create_sale(self.apple, 1, "2020-04-15 10:00")
+        self.assertEqual(get_cached_stats("test", compute), 2)
+
+    def test_cached_stats_expire_at_local_midnight(self):
+        with freeze_time("2020-04-17 14:59"):  # 23:59 in Tokyo
+            self.assertEqual(get_seconds_until_tomorrow(), 60)
+            self.assertEqual(get_cached_stats("test", lambda: "17th"), "17th")
+        with freeze_time("2020-04-17 15:01"):  # 00:01 on the 18th in Tokyo
+            self.assertEqual(get_cached_stats("test", lambda: "18th"), "18th")
+
+    def test_stats_list_view_is_served_from_the_cache(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        with freeze_time("2020-04-17 03:00"):
+            create_sale(self.apple, 2, "2020-04-17 10:00")
+            response = self.client.get(reverse("stats_list"))
+            self.assertEqual(response.context["total_proceeds"], 200)
+
+            # Session and user only
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse("stats_list"))
+            self.assertEqual(response.context["day_sales"][0].proceeds, 200)
+
+            create_sale(self.apple, 1, "2020-04-16 10:00")
+            response = self.client.get(reverse("stats_list"))
+            self.assertEqual(response.context["total_proceeds"], 300)
+            self.assertEqual(response.context["day_sales"][1].proceeds, 100)
+
+        # On the next day, the same sales are shown one row further down
+        with freeze_time("2020-04-17 15:30"):
+            response = self.client.get(reverse("stats_list"))
+            self.assertEqual(response.context["day_sales"][0].proceeds, 0)
+            self.assertEqual(response.context["day_sales"][1].proceeds, 200)
+
+
+class StatsCacheCoalescingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def hold_lock(self, name):
+        today = datetime.now(pytz.timezone("Asia/Tokyo")).date()
+        key = f"stats:{name}:{get_stats_version()}:{today.isoformat()}"
+        cache.add(f"{key}:lock", 1)
+
+    def test_concurrent_misses_are_computed_once(self):
+        computed = []
+
+        def compute():
+            computed.append(True)
+            time.sleep(0.2)
+            return "stats"
+
+        results = []
+        barrier = threading.Barrier(5)
+
+        def request():
+            barrier.wait()
+            results.append(get_cached_stats("test", compute))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results, ["stats"] * 5)
+        metrics = get_stats_cache_metrics()
+        self.assertEqual(metrics["recomputed"], 1)
+        self.assertEqual(metrics["waited"], 4)
+
+    def test_previous_value_is_served_while_recomputing(self):
+        get_cached_stats("test", lambda: "old")
+        bump_stats_version()
+        self.hold_lock("test")
+        self.assertEqual(get_cached_stats("test", lambda: "new"), "old")
+        self.assertEqual(get_stats_cache_metrics()["served_stale"], 1)
+
+    @override_settings(STATS_CACHE_WAIT=0.1)
+    def test_value_is_computed_if_the_lock_is_not_released(self):
+        self.hold_lock("test")
+        self.assertEqual(get_cached_stats("test", lambda: "new"), "new")
+        metrics = get_stats_cache_metrics()
+        self.assertEqual(metrics["wait_timeouts"], 1)
+        self.assertEqual(metrics["recomputed"], 1)
+
+    def test_lock_is_released_if_computing_fails(self):
+        def compute():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            get_cached_stats("test", compute)
+        self.assertEqual(get_cached_stats("test", lambda: "new"), "new")
+
+    def test_stats_cache_metrics_command(self):
+        get_cached_stats("test", lambda: "stats")
+        get_cached_stats("test", lambda: "stats")
+        out = StringIO()
+        call_command("stats_cache_metrics", "--reset", stdout=out)
+        self.assertIn("hits: 1", out.getvalue())
+        self.assertIn("recomputed: 1", out.getvalue())
+        self.assertIn("0% of cache misses were coalesced.", out.getvalue())
+        self.assertEqual(get_stats_cache_metrics()["hits"], 0)
+
+
+@freeze_time("2020-04-17 03:00")  # 12:00 in Tokyo
+class ClosedBucketCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.apple = Fruit.objects.create(name="apple", price=100)
+        self.sale = create_sale(self.apple, 1, "2020-04-15 10:00")
+        create_sale(self.apple, 2, "2020-04-16 10:00")
+        create_sale(self.apple, 3, "2020-04-17 10:00")
+
+    def get_range_read(self, build_report):
+        """
+        Returns the first and last dates of the rollup range read by
+        "build_report" (or None if it was cached) and its result.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            rows = build_report()
+        self.assertLessEqual(len(queries), 1)
+        if not queries:
+            return None, rows
+        match = re.search(r"BETWEEN '(\S+)' AND '(\S+)'", queries[0]["sql"])
+        return match.groups(), rows
+
+    def test_only_open_buckets_are_read_once_cached(self):
+        build_recent_sales_report("day", 3)
+        read, rows = self.get_range_read(
+            lambda: build_recent_sales_report("day", 3)
+        )
+        self.assertEqual(read, ("2020-04-17", "2020-04-17"))
+        self.assertEqual([row.proceeds for row in rows], [300, 200, 100])
+
+        create_sale(self.apple, 4, "2020-04-17 11:00")
+        read, rows = self.get_range_read(
+            lambda: build_recent_sales_report("day", 3)
+        )
+        self.assertEqual(read, ("2020-04-17", "2020-04-17"))
+        self.assertEqual([row.proceeds for row in rows], [700, 200, 100])
+
+    def test_closed_months_are_cached(self):
+        create_sale(self.apple, 5, "2020-03-10 10:00")
+        build_recent_sales_report("month", 3)
+        with self.assertNumQueries(1):
+            rows = build_recent_sales_report("month", 3)
+        self.assertEqual([row.proceeds for row in rows], [600, 500, 0])
+        with self.assertNumQueries(0):
+            build_sales_report(date(2020, 2, 1), date(2020, 3, 31), "month")
+
+    def test_writes_only_invalidate_the_buckets_they_touch(self):
+        build_recent_sales_report("day", 3)
+        create_sale(self.apple, 5, "2020-03-10 10:00")
+        read, _ = self.get_range_read(
+            lambda: build_recent_sales_report("day", 3)
+        )
+        self.assertEqual(read, ("2020-04-17", "2020-04-17"))
+
+        # A backdated edit moves the sale from the 15th to the 16th
+        self.sale.sold_on = local_date_time("2020-04-16 09:00")
+        self.sale.save()
+        read, rows = self.get_range_read(
+            lambda: build_recent_sales_report("day", 3)
+        )
+        self.assertEqual(read, ("2020-04-15", "2020-04-17"))
+        self.assertEqual([row.proceeds for row in rows], [300, 300, 0])
+
+    def test_invalidating_many_days_sets_each_bucket_once(self):
+        days = [date(2018, 1, 1) + timedelta(days=i) for i in range(3 * 365)]
+        with mock.patch.object(
+            cache, "set_many", wraps=cache.set_many
+        ) as set_many:
+            invalidate_buckets(days + days)
+        set_many.assert_called_once()
+        # Days, weeks, months and years
+        self.assertEqual(len(set_many.call_args[0][0]), 3 * 365 + 157 + 36 + 3)
+
+    def test_uploads_and_rebuilds_invalidate_buckets(self):
+        build_recent_sales_report("day", 3)
+        generate_sale_objects([["apple", "2", "200", "2020-04-15 11:00"]])
+        rows = build_recent_sales_report("day", 3)
+        self.assertEqual(rows[2].proceeds, 300)
+
+        DailyFruitSales.objects.all().delete()
+        call_command("rebuild_daily_fruit_sales", stdout=StringIO())
+        read, rows = self.get_range_read(
+            lambda: build_recent_sales_report("day", 3)
+        )
+        self.assertEqual(read, ("2020-04-15", "2020-04-17"))
+        self.assertEqual(rows[2].proceeds, 300)
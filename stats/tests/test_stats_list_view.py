@@ -1,20 +1,16 @@
 import pytz
-from datetime import datetime
-import dateutil.relativedelta
+from datetime import datetime, timedelta
 from django.urls import reverse
 from django.test import TestCase
 from django.utils import timezone
+from django.core.cache import cache
 
 from users.models import CustomUser
 from stock.models import Fruit
 from sales.models import Sale
-from ..views import (
-    calculate_total_proceeds,
-    get_sales_for_period,
-    sort_sales_by_day,
-    sort_sales_by_month,
-    build_sales_details,
-)
+from ..models import DailyFruitSales
+from ..views import calculate_total_proceeds
+from ..reports import build_recent_sales_report
 
 from freezegun import freeze_time
 
@@ -180,40 +176,41 @@ class StatsListTests(TestCase):
                 proceeds=900,
                 sold_on=timezone.now(),
             )
+            # Identical sales are rejected, so these are a minute later
             cls.sale21 = Sale.objects.create(
                 fruit=cls.apple,
                 quantity=1,
                 fruit_price_when_sold=100,
                 proceeds=100,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale22 = Sale.objects.create(
                 fruit=cls.lemon,
                 quantity=2,
                 fruit_price_when_sold=120,
                 proceeds=240,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale23 = Sale.objects.create(
                 fruit=cls.orange,
                 quantity=3,
                 fruit_price_when_sold=140,
                 proceeds=420,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale24 = Sale.objects.create(
                 fruit=cls.kiwi,
                 quantity=4,
                 fruit_price_when_sold=160,
                 proceeds=640,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale25 = Sale.objects.create(
                 fruit=cls.banana,
                 quantity=5,
                 fruit_price_when_sold=180,
                 proceeds=900,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
 
         # 3ヶ月目
@@ -253,40 +250,41 @@ class StatsListTests(TestCase):
                 proceeds=900,
                 sold_on=timezone.now(),
             )
+            # Identical sales are rejected, so these are a minute later
             cls.sale31 = Sale.objects.create(
                 fruit=cls.apple,
                 quantity=1,
                 fruit_price_when_sold=100,
                 proceeds=100,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale32 = Sale.objects.create(
                 fruit=cls.lemon,
                 quantity=2,
                 fruit_price_when_sold=120,
                 proceeds=240,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale33 = Sale.objects.create(
                 fruit=cls.orange,
                 quantity=3,
                 fruit_price_when_sold=140,
                 proceeds=420,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale34 = Sale.objects.create(
                 fruit=cls.kiwi,
                 quantity=4,
                 fruit_price_when_sold=160,
                 proceeds=640,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
             cls.sale35 = Sale.objects.create(
                 fruit=cls.banana,
                 quantity=5,
                 fruit_price_when_sold=180,
                 proceeds=900,
-                sold_on=timezone.now(),
+                sold_on=timezone.now() + timedelta(minutes=1),
             )
 
         # 4ヶ月目
@@ -370,36 +368,23 @@ class StatsListTests(TestCase):
             cls.sale40,
         ]
 
+    def setUp(self):
+        # Cached stats would otherwise be shared between tests
+        cache.clear()
+
     # ヘルパー関数のテスト
 
     def test_total_proceeds_calculated_correctly(self):
-        self.assertEqual(calculate_total_proceeds(self.sales), 18400)
-        self.assertNotEqual(calculate_total_proceeds(self.sales), 0)
-
-    @freeze_time("2020-04-17")
-    def test_get_sales_for_period_days(self):
-        sales = get_sales_for_period(self.sales, "days")
-        self.assertEqual(len(sales), 15)
-        three_days_ago = timezone.now() - dateutil.relativedelta.relativedelta(
-            days=3
-        )
-        for sale in sales:
-            self.assertTrue(sale.sold_on >= three_days_ago)
-
-    @freeze_time("2020-04-17")
-    def test_get_sales_for_period_months(self):
-        sales = get_sales_for_period(self.sales, "months")
-        self.assertEqual(len(sales), 35)
-        start_day = timezone.now() - dateutil.relativedelta.relativedelta(
-            days=16, months=2
-        )
-        for sale in sales:
-            self.assertTrue(sale.sold_on >= start_day)
+        sales = Sale.objects.all()
+        self.assertEqual(calculate_total_proceeds(sales), 18400)
+        self.assertNotEqual(calculate_total_proceeds(sales), 0)
+        self.assertEqual(calculate_total_proceeds(Sale.objects.none()), 0)
+        rollup = DailyFruitSales.objects.all()
+        self.assertEqual(calculate_total_proceeds(rollup), 18400)
 
     @freeze_time("2020-04-17")
-    def test_sort_sales_by_day(self):
-        day_sales = get_sales_for_period(self.sales, "days")
-        sorted_sales = sort_sales_by_day(day_sales)
+    def test_recent_sales_by_day(self):
+        sorted_sales = build_recent_sales_report("day", 3)
         # 各行の日付を確認する
         self.assertEqual(
             sorted_sales[0].date, datetime(year=2020, month=4, day=17).date()
@@ -410,82 +395,85 @@ class StatsListTests(TestCase):
         self.assertEqual(
             sorted_sales[2].date, datetime(year=2020, month=4, day=15).date()
         )
-        # 各saleの日付がその行の日付と一致することを確認する
+        # 各行の内訳がその日のsaleのみを集計していることを確認する
         for row in sorted_sales:
-            for sale in row.sales:
-                # 比較できるように、naiveなdatetimeオブジェクトに変換する
-                sale_date = sale.sold_on.replace(tzinfo=None).date()
-                self.assertEqual(row.date, sale_date)
+            self.assertEqual(
+                row.details.as_dict(),
+                {
+                    "apple": [100, 1],
+                    "lemon": [240, 2],
+                    "orange": [420, 3],
+                    "kiwi": [640, 4],
+                    "banana": [900, 5],
+                },
+            )
 
     @freeze_time("2020-04-17")
-    def test_sort_sales_by_month(self):
-        month_sales = get_sales_for_period(self.sales, "months")
-        sorted_sales = sort_sales_by_month(month_sales)
+    def test_recent_sales_by_month(self):
+        sorted_sales = build_recent_sales_report("month", 3)
         # Check date of each row
         self.assertEqual(
-            sorted_sales[0].date.replace(tzinfo=None),
-            datetime(year=2020, month=4, day=1),
+            sorted_sales[0].date, datetime(year=2020, month=4, day=1).date()
         )
         self.assertEqual(
-            sorted_sales[1].date.replace(tzinfo=None),
-            datetime(year=2020, month=3, day=1),
+            sorted_sales[1].date, datetime(year=2020, month=3, day=1).date()
         )
         self.assertEqual(
-            sorted_sales[2].date.replace(tzinfo=None),
-            datetime(year=2020, month=2, day=1),
+            sorted_sales[2].date, datetime(year=2020, month=2, day=1).date()
         )
-        # 各saleの日付がその行の日付範囲に一致することを確認する
+        # 各行の内訳がその月のsaleのみを集計していることを確認する
+        details = [row.details.as_dict() for row in sorted_sales]
+        self.assertEqual(details[0]["apple"], [300, 3])
+        self.assertEqual(details[1]["apple"], [200, 2])
+        self.assertEqual(details[2]["apple"], [200, 2])
+        self.assertEqual(details[2]["banana"], [1800, 10])
+
+    @freeze_time("2020-04-17")
+    def test_sales_details_by_day_are_sorted_by_proceeds(self):
+        sorted_sales = build_recent_sales_report("day", 3)
         for row in sorted_sales:
-            for sale in row.sales:
-                # 対応する日付範囲の境界値を取得する
-                lower_bound = row.date
-                upper_bound = (
-                    lower_bound + dateutil.relativedelta.relativedelta(day=31)
-                )
-                # 比較できるように、naiveなdatetimeオブジェクトに変換する
-                lower_bound = lower_bound.replace(tzinfo=None)
-                upper_bound = upper_bound.replace(tzinfo=None)
-                self.assertTrue(
-                    sale.sold_on.replace(tzinfo=None) >= lower_bound
-                )
-                self.assertTrue(
-                    sale.sold_on.replace(tzinfo=None) < upper_bound
-                )
+            self.assertEqual(row.proceeds, 2300)
+            self.assertEqual(
+                [fruit.fruit_name for fruit in row.details],
+                ["banana", "kiwi", "orange", "lemon", "apple"],
+            )
 
     @freeze_time("2020-04-17")
-    def test_build_sales_details_by_day(self):
-        day_sales = get_sales_for_period(self.sales, "days")
-        sorted_sales = sort_sales_by_day(day_sales)
-        day_sales_with_bd = build_sales_details(sorted_sales)
+    def test_sales_details_by_month_are_sorted_by_proceeds(self):
+        sorted_sales = build_recent_sales_report("month", 3)
+        self.assertEqual(sorted_sales[0].proceeds, 6900)
+        self.assertEqual(sorted_sales[1].proceeds, 4600)
+        self.assertEqual(sorted_sales[2].proceeds, 4600)
         self.assertEqual(
-            sorted_sales[0].details_str,
-            "Banana: ¥900 (5), Kiwi: ¥640 (4), Orange: ¥420 (3), Lemon: ¥240 (2), Apple: ¥100 (1)",
-        )
-        self.assertEqual(
-            sorted_sales[1].details_str,
-            "Banana: ¥900 (5), Kiwi: ¥640 (4), Orange: ¥420 (3), Lemon: ¥240 (2), Apple: ¥100 (1)",
-        )
-        self.assertEqual(
-            sorted_sales[2].details_str,
-            "Banana: ¥900 (5), Kiwi: ¥640 (4), Orange: ¥420 (3), Lemon: ¥240 (2), Apple: ¥100 (1)",
+            list(sorted_sales[0].details),
+            [
+                ("banana", 2700, 15),
+                ("kiwi", 1920, 12),
+                ("orange", 1260, 9),
+                ("lemon", 720, 6),
+                ("apple", 300, 3),
+            ],
         )
 
     @freeze_time("2020-04-17")
-    def test_build_sales_details_by_month(self):
-        month_sales = get_sales_for_period(self.sales, "months")
-        sorted_sales = sort_sales_by_month(month_sales)
-        month_sales_with_bd = build_sales_details(sorted_sales)
-        self.assertEqual(
-            sorted_sales[0].details_str,
-            "Banana: ¥2,700 (15), Kiwi: ¥1,920 (12), Orange: ¥1,260 (9), Lemon: ¥720 (6), Apple: ¥300 (3)",
+    def test_stats_list_view_displays_sales_details(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        response = self.client.get(reverse("stats_list"))
+        self.assertContains(
+            response,
+            "<td>Banana: ¥900 (5), Kiwi: ¥640 (4), Orange: ¥420 (3), Lemon: ¥240 (2), Apple: ¥100 (1)</td>",
+            3,
         )
-        self.assertEqual(
-            sorted_sales[1].details_str,
-            "Banana: ¥1,800 (10), Kiwi: ¥1,280 (8), Orange: ¥840 (6), Lemon: ¥480 (4), Apple: ¥200 (2)",
+        self.assertContains(
+            response,
+            "<td>Banana: ¥2,700 (15), Kiwi: ¥1,920 (12), Orange: ¥1,260 (9), Lemon: ¥720 (6), Apple: ¥300 (3)</td>",
+            1,
         )
-        self.assertEqual(
-            sorted_sales[2].details_str,
-            "Banana: ¥1,800 (10), Kiwi: ¥1,280 (8), Orange: ¥840 (6), Lemon: ¥480 (4), Apple: ¥200 (2)",
+        self.assertContains(
+            response,
+            "<td>Banana: ¥1,800 (10), Kiwi: ¥1,280 (8), Orange: ¥840 (6), Lemon: ¥480 (4), Apple: ¥200 (2)</td>",
+            2,
         )
 
     # viewのテスト
@@ -520,6 +508,35 @@ class StatsListTests(TestCase):
         self.assertIn("day_sales", response.context)
         self.assertTrue(len(response.context["day_sales"]) == 3)
 
+    @freeze_time("2020-04-17")
+    def test_stats_list_view_query_count_is_fixed(self):
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        # Session and user, then the total, day, month and leaderboard
+        # aggregates
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("stats_list"))
+        self.assertEqual(response.context["total_proceeds"], 18400)
+        self.assertEqual(response.context["day_sales"][0].proceeds, 2300)
+        self.assertEqual(response.context["month_sales"][0].proceeds, 6900)
+
+        # The stats are cached until sales are written
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("stats_list"))
+        self.assertEqual(response.context["total_proceeds"], 18400)
+
+        # Adding more sales to the same days doesn't add queries
+        for minute in range(1, 21):
+            Sale.objects.create(
+                fruit=self.apple,
+                quantity=1,
+                proceeds=100,
+                sold_on=timezone.now() - timedelta(minutes=minute),
+            )
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("stats_list"))
+        self.assertEqual(response.context["total_proceeds"], 20400)
+
     def test_stats_list_view_template_display(self):
         user = CustomUser.objects.create_user("testuser", "123456")
         self.client.force_login(user=user)
@@ -533,7 +550,7 @@ class StatsListTests(TestCase):
         )
         self.assertContains(response, "Day</th>", 1)
         self.assertContains(response, "Month</th>", 1)
-        self.assertContains(response, "Proceeds</th>", 2)
+        self.assertContains(response, "Proceeds</th>", 3)
         self.assertContains(
             response,
             "Breakdown (descending order of proceeds, quantities in parentheses)</th>",
@@ -0,0 +1,201 @@
+from datetime import date
+from django.urls import reverse
+from django.test import TestCase
+from django.core.cache import cache
+
+from users.models import CustomUser
+from stock.models import Fruit
+from ..reports import build_sales_report, count_buckets, get_bucket_starts
+from .helpers import local_date_time, create_sale
+
+from freezegun import freeze_time
+
+
+class SalesReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.apple = Fruit.objects.create(name="apple", price=100)
+        cls.lemon = Fruit.objects.create(name="lemon", price=50)
+        sales = [
+            (cls.apple, 1, "2020-01-06 10:00"),
+            (cls.apple, 2, "2020-01-06 10:30"),
+            (cls.lemon, 4, "2020-01-07 08:00"),
+            (cls.apple, 1, "2020-01-20 23:59"),
+            (cls.lemon, 2, "2020-03-01 00:00"),
+            (cls.apple, 3, "2021-02-01 12:00"),
+        ]
+        for fruit, quantity, sold_on in sales:
+            create_sale(fruit, quantity, sold_on)
+
+    def setUp(self):
+        # Cached report rows would otherwise be shared between tests
+        cache.clear()
+
+    def test_daily_report_includes_days_without_sales(self):
+        rows = build_sales_report(date(2020, 1, 5), date(2020, 1, 8), "day")
+        self.assertEqual(
+            [(row.date, row.proceeds) for row in rows],
+            [
+                (date(2020, 1, 5), 0),
+                (date(2020, 1, 6), 300),
+                (date(2020, 1, 7), 200),
+                (date(2020, 1, 8), 0),
+            ],
+        )
+        self.assertEqual(rows[1].details.as_dict(), {"apple": [300, 3]})
+        self.assertEqual(len(rows[0].details), 0)
+
+    def test_weekly_report_starts_on_mondays(self):
+        rows = build_sales_report(date(2020, 1, 1), date(2020, 1, 31), "week")
+        self.assertEqual(
+            [(row.date, row.proceeds) for row in rows],
+            [
+                (date(2019, 12, 30), 0),
+                (date(2020, 1, 6), 500),
+                (date(2020, 1, 13), 0),
+                (date(2020, 1, 20), 100),
+                (date(2020, 1, 27), 0),
+            ],
+        )
+
+    def test_monthly_and_yearly_reports(self):
+        rows = build_sales_report(date(2020, 1, 1), date(2021, 3, 31), "month")
+        self.assertEqual(len(rows), 15)
+        self.assertEqual(rows[0].proceeds, 600)
+        self.assertEqual(rows[1].proceeds, 0)
+        self.assertEqual(rows[2].details.as_dict(), {"lemon": [100, 2]})
+        self.assertEqual(rows[13].date, date(2021, 2, 1))
+
+        rows = build_sales_report(date(2019, 6, 1), date(2021, 6, 1), "year")
+        self.assertEqual(
+            [(row.date, row.proceeds) for row in rows],
+            [
+                (date(2019, 1, 1), 0),
+                (date(2020, 1, 1), 700),
+                (date(2021, 1, 1), 300),
+            ],
+        )
+
+    def test_partial_periods_only_include_sales_in_the_range(self):
+        rows = build_sales_report(date(2020, 1, 7), date(2020, 2, 29), "month")
+        self.assertEqual([row.proceeds for row in rows], [300, 0])
+
+    def test_hourly_report_uses_local_hours(self):
+        rows = build_sales_report(date(2020, 1, 6), date(2020, 1, 7), "hour")
+        self.assertEqual(len(rows), 48)
+        self.assertEqual(rows[0].date, local_date_time("2020-01-06 00:00"))
+        self.assertEqual(rows[10].proceeds, 300)
+        self.assertEqual(rows[32].proceeds, 200)
+        self.assertEqual(sum(row.proceeds for row in rows), 500)
+
+    def test_query_count_does_not_depend_on_sales_or_buckets(self):
+        for minute in range(50):
+            create_sale(self.apple, 1, f"2020-01-08 11:{minute:02d}")
+        with self.assertNumQueries(1):
+            rows = build_sales_report(
+                date(2019, 1, 1), date(2021, 12, 31), "day"
+            )
+        self.assertEqual(len(rows), 1096)
+        self.assertEqual(rows[372].proceeds, 5000)
+
+    def test_count_buckets_matches_bucket_starts(self):
+        start, end = date(2019, 12, 31), date(2021, 1, 1)
+        for period in ["hour", "day", "week", "month", "year"]:
+            self.assertEqual(
+                count_buckets(start, end, period),
+                len(get_bucket_starts(start, end, period)),
+            )
+
+    def test_unknown_period_is_rejected(self):
+        with self.assertRaises(ValueError):
+            build_sales_report(date(2020, 1, 1), date(2020, 1, 2), "minute")
+
+
+class StatsReportViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = CustomUser.objects.create_user("testuser", "123456")
+        self.client.force_login(user=user)
+        apple = Fruit.objects.create(name="apple", price=100)
+        create_sale(apple, 2, "2020-04-15 10:00")
+
+    def test_stats_report_view_redirection_when_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("stats_report"))
+        self.assertRedirects(response, "/accounts/login/?next=/stats/report/")
+
+    @freeze_time("2020-04-17")
+    def test_stats_report_view_shows_last_30_days_by_default(self):
+        response = self.client.get(reverse("stats_report"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "stats/stats_report.html")
+        rows = response.context["rows"]
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(rows[-1].date, date(2020, 4, 17))
+        self.assertEqual(response.context["total_proceeds"], 200)
+        self.assertContains(response, "<td>Apple: ¥200 (2)</td>", 1)
+
+    def test_stats_report_view_with_range_and_period(self):
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "2020-01-01", "to": "2020-12-31", "by": "month"},
+        )
+        rows = response.context["rows"]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[3].proceeds, 200)
+        self.assertContains(response, "<td>2020-04</td>", 1)
+        self.assertContains(response, "Month</th>", 1)
+
+    def test_stats_report_view_rejects_invalid_ranges(self):
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "2020-02-01", "to": "2020-01-01", "by": "day"},
+        )
+        self.assertEqual(response.context["rows"], [])
+        self.assertContains(
+            response, "The start date must not be after the end date."
+        )
+
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "2020-01-01", "to": "2020-12-31", "by": "hour"},
+        )
+        self.assertEqual(response.context["rows"], [])
+        self.assertContains(response, "more than 1,000 rows")
+
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "2020-01-01", "to": "2020-12-31", "by": "minute"},
+        )
+        self.assertEqual(response.context["rows"], [])
+
+    def test_stats_report_view_rejects_dates_before_1900(self):
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "0001-01-01", "to": "0001-01-01", "by": "hour"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["rows"], [])
+        self.assertContains(response, "Please select a date from 1900-01-01")
+
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "1900-01-01", "to": "1900-01-01", "by": "hour"},
+        )
+        self.assertEqual(len(response.context["rows"]), 24)
+
+    @freeze_time("2020-04-17")
+    def test_stats_report_view_rejects_dates_after_today(self):
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "9999-12-31", "to": "9999-12-31", "by": "day"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["rows"], [])
+        self.assertContains(response, "no later than today")
+
+        response = self.client.get(
+            reverse("stats_report"),
+            {"from": "2020-04-17", "to": "2020-04-17", "by": "day"},
+        )
+        self.assertEqual(len(response.context["rows"]), 1)
@@ -1,8 +1,18 @@
 from django.urls import path
 
-from .views import stats_list
+from .views import (
+    stats_list,
+    stats_api,
+    stats_report,
+    stats_heatmap,
+    stats_leaderboard,
+)
 
 
 urlpatterns = [
     path("list/", stats_list, name="stats_list"),
+    path("api/", stats_api, name="stats_api"),
+    path("report/", stats_report, name="stats_report"),
+    path("heatmap/", stats_heatmap, name="stats_heatmap"),
+    path("leaderboard/", stats_leaderboard, name="stats_leaderboard"),
 ]
@@ -1,209 +1,236 @@
-import dateutil.relativedelta
+import json
+from datetime import timedelta
+from django.db.models import Sum
 from django.utils import timezone
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, quote_etag
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+
+from .cache import get_cached_stats, get_stats_etag
+from .forms import StatsReportForm, StatsLeaderboardForm
+from .models import DailyFruitSales
+from .reports import (
+    build_sales_report,
+    build_recent_sales_report,
+    build_sales_heatmap,
+    build_fruit_leaderboard,
+    get_heatmap_fruit_names,
+)
+
+# Date formats of the report rows for each period
+DATE_FORMATS = {
+    "hour": "Y-m-d H:i",
+    "day": "Y-m-d",
+    "week": "Y-m-d",
+    "month": "Y-m",
+    "year": "Y",
+}
+
+# Number of days shown in the report when no range is selected
+DEFAULT_REPORT_DAYS = 30
+
+# Number of fruits in the leaderboard on the stats page, and by default in
+# the JSON leaderboard
+STATS_LIST_LEADERBOARD_FRUITS = 5
+DEFAULT_LEADERBOARD_FRUITS = 10
 
-from sales.models import Sale
+
+def calculate_total_proceeds(sales):
+    return sales.aggregate(total=Sum("proceeds"))["total"] or 0
 
 
-class Row:
+def get_default_report_data():
     """
-    Class representing a row in the table to be displayed on the stats page,
-    including sales details data per day and per month.
+    Helper function for stats_report().
+    Returns form data for a daily report on the last DEFAULT_REPORT_DAYS days.
     """
-
-    def __init__(self, date, proceeds, sales, details, details_str):
-        self.date = date
-        self.proceeds = proceeds
-        self.sales = sales
-        # Dict for holding details information
-        self.details = details
-        # Above dict converted to a string
-        self.details_str = details_str
+    today = timezone.localtime(timezone.now()).date()
+    start = today - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+    return {"from": start.isoformat(), "to": today.isoformat(), "by": "day"}
 
 
-def calculate_total_proceeds(sales):
-    proceeds = [sale.proceeds for sale in sales]
-    return sum(proceeds)
+def get_default_leaderboard_data():
+    """
+    Helper function for stats_leaderboard().
+    Returns form data for the top DEFAULT_LEADERBOARD_FRUITS fruits by
+    proceeds over the last DEFAULT_REPORT_DAYS days.
+    """
+    return {
+        **get_default_report_data(),
+        "by": "proceeds",
+        "top": DEFAULT_LEADERBOARD_FRUITS,
+    }
 
 
-def get_sales_for_period(sales, period):
+def build_stats_list_context():
     """
-    Note regarding "time" in the code below:
-    Within code used in a Django view (i.e. this file), time is represented as
-    datetime objects that are UTC timezone-aware. However, in order to get and
-    sort Sale objects correctly for outputting in the statistics template, it
-    is necessary to convert the Sale.sold_on values from UTC time to JPT time
-    and then to compare these with the local time according to JPY timezone.
+    Helper function for stats_list().
     """
+    # Read from the daily rollup, so the cost doesn't grow with the sales
+    total_proceeds = calculate_total_proceeds(DailyFruitSales.objects.all())
+
+    # Get sales for most recent three days and three months
+    day_sales = build_recent_sales_report("day", 3)
+    month_sales = build_recent_sales_report("month", 3)
+
+    # Top fruits by proceeds over the last DEFAULT_REPORT_DAYS days
+    today = timezone.localtime(timezone.now()).date()
+    leaderboard = build_fruit_leaderboard(
+        today - timedelta(days=DEFAULT_REPORT_DAYS - 1),
+        today,
+        count=STATS_LIST_LEADERBOARD_FRUITS,
+    )
 
-    # Get local time in JPT (i.e. JPT timezone aware datetime obj)
-    now = timezone.localtime(timezone.now())
-
-    if period == "days":
-        # Get start point (minus two days from the current day)
-        now_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        start = now_day - dateutil.relativedelta.relativedelta(days=2)
-    else:
-        # Get start point (start of the current month minus two months)
-        now_month = now.replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        start = now_month - dateutil.relativedelta.relativedelta(months=2)
+    return {
+        "total_proceeds": total_proceeds,
+        "month_sales": month_sales,
+        "day_sales": day_sales,
+        "leaderboard": leaderboard,
+        "leaderboard_days": DEFAULT_REPORT_DAYS,
+    }
 
-    target_sales = []
 
-    for sale in sales:
-        sold_on_jpt = timezone.localtime(sale.sold_on)  # Convert to JPT
-        if sold_on_jpt >= start:
-            target_sales.append(sale)
+def serialise_rows(rows):
+    """
+    Helper function for build_stats_api_content().
+    """
+    return [
+        {
+            "date": row.date.isoformat(),
+            "proceeds": row.proceeds,
+            "quantity": row.details.quantity,
+            "fruits": [fruit._asdict() for fruit in row.details],
+        }
+        for row in rows
+    ]
 
-    return target_sales
 
+def build_stats_api_content():
+    """
+    Helper function for stats_api().
+    Returns (ETag, JSON string) of the stats shown on the stats page. The
+    ETag is read before the stats are built, so it is never newer than the
+    stats. They are built rather than read from the cached stats page, which
+    may be a stale copy served while another process recomputes it.
+    """
+    etag = get_stats_etag()
+    context = build_stats_list_context()
+    content = json.dumps(
+        {
+            "total_proceeds": context["total_proceeds"],
+            "day_sales": serialise_rows(context["day_sales"]),
+            "month_sales": serialise_rows(context["month_sales"]),
+            "top_fruits": {
+                "days": context["leaderboard_days"],
+                **context["leaderboard"].as_dict(),
+            },
+        },
+        separators=(",", ":"),
+    )
+    return etag, content
 
-def sort_sales_by_day(sales):
 
-    # Get current day in local JPT timezone
-    now_day = timezone.localtime(timezone.now()).date()
-    one_day_b4 = now_day - dateutil.relativedelta.relativedelta(days=1)
-    two_days_b4 = now_day - dateutil.relativedelta.relativedelta(days=2)
+@login_required
+def stats_list(request):
 
-    row1 = Row(date=now_day, proceeds=0, sales=[], details={}, details_str="")
-    row2 = Row(
-        date=one_day_b4, proceeds=0, sales=[], details={}, details_str=""
-    )
-    row3 = Row(
-        date=two_days_b4, proceeds=0, sales=[], details={}, details_str=""
-    )
+    # Recomputed only after sales are written or at the start of a new day
+    context = get_cached_stats("list", build_stats_list_context)
 
-    for sale in sales:
+    return render(request, "stats/stats_list.html", context)
 
-        sold_on_jpt = timezone.localtime(sale.sold_on).date()  # Convert to JPT
 
-        if sold_on_jpt == now_day:
-            row1.sales.append(sale)
-        elif sold_on_jpt == one_day_b4:
-            row2.sales.append(sale)
-        else:
-            row3.sales.append(sale)
+@login_required
+@cache_control(private=True, no_cache=True)
+def stats_api(request):
 
-    return [row1, row2, row3]
+    # The JSON is cached as a string along with the ETag of the stats it was
+    # built from, so it isn't rebuilt or re-serialised until sales are
+    # written. A stale copy served while another process recomputes it keeps
+    # its own ETag, so clients holding that ETag aren't told it's current.
+    etag, content = get_cached_stats("api", build_stats_api_content)
 
+    # Requests with that ETag in If-None-Match get 304 Not Modified
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    if response is None:
+        response = HttpResponse(content, content_type="application/json")
+    response["ETag"] = quote_etag(etag)
+    return response
 
-def sort_sales_by_month(sales):
 
-    # Get start of current month in local JPT timezone
-    now = timezone.localtime(timezone.now())
+@login_required
+def stats_report(request):
 
-    now_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    one_month_b4 = now_month - dateutil.relativedelta.relativedelta(months=1)
-    two_month_b4 = now_month - dateutil.relativedelta.relativedelta(months=2)
+    form = StatsReportForm(request.GET or get_default_report_data())
+    rows = []
+    period = None
 
-    row1 = Row(
-        date=now_month, proceeds=0, sales=[], details={}, details_str=""
-    )
-    row2 = Row(
-        date=one_month_b4, proceeds=0, sales=[], details={}, details_str=""
-    )
-    row3 = Row(
-        date=two_month_b4, proceeds=0, sales=[], details={}, details_str=""
-    )
+    if form.is_valid():
+        period = form.cleaned_data["by"]
+        rows = build_sales_report(
+            form.cleaned_data["from"], form.cleaned_data["to"], period
+        )
 
-    for sale in sales:
-
-        sold_on_jpt = timezone.localtime(sale.sold_on)  # Convert to JPT
-
-        if sold_on_jpt >= now_month:
-            row1.sales.append(sale)
-        elif sold_on_jpt >= one_month_b4 and sale.sold_on < now_month:
-            row2.sales.append(sale)
-        else:
-            row3.sales.append(sale)
-
-    return [row1, row2, row3]
-
-
-def build_sales_details(sales):
-
-    sorted_sales = []
-
-    for row in sales:
-        if row.sales:
-
-            # Get total proceeds for this row
-            all_proceeds = [sale.proceeds for sale in row.sales]
-            row.proceeds = sum(all_proceeds)
-
-            # Build the details dict
-            # key = fruit name (str), val = [proceeds (int), quantity (int)]
-            all_fruit_names = [sale.fruit_name for sale in row.sales]
-            unique_fruit_names = set(all_fruit_names)
-            for name in unique_fruit_names:
-                row.details[name] = []
-
-            # Get total proceeds and quantity for each fruit in this row
-            for name in unique_fruit_names:
-                total_proceeds = 0
-                quantity = 0
-                for sale in row.sales:
-                    if sale.fruit_name == name:
-                        total_proceeds += sale.proceeds
-                        quantity += sale.quantity
-                row.details[name].append(total_proceeds)
-                row.details[name].append(quantity)
-
-            # Sort the details dict according in descending order of proceeds
-            sorted_details = dict(
-                sorted(
-                    row.details.items(),
-                    key=lambda item: item[1],
-                    reverse=True,
-                )
-            )
-            row.details = sorted_details
-
-            # Convert the details dict into a str
-            # format() used to insert commas into long numbers
-            for entry in row.details:
-                row.details_str += (
-                    entry.capitalize()
-                    + ": ¥"
-                    + "{:,}".format(row.details[entry][0])
-                    + " ("
-                    + "{:,}".format(row.details[entry][1])
-                    + "), "
-                )
-            # Remove trailing comma and space
-            row.details_str = row.details_str[:-2]
-
-        sorted_sales.append(row)
-
-    return sorted_sales
+    return render(
+        request,
+        "stats/stats_report.html",
+        {
+            "form": form,
+            "rows": rows,
+            "total_proceeds": sum(row.proceeds for row in rows),
+            "date_format": DATE_FORMATS.get(period),
+        },
+    )
 
 
 @login_required
-def stats_list(request):
-
-    sales = Sale.objects.all()
+def stats_leaderboard(request):
+
+    data = get_default_leaderboard_data()
+    data.update(request.GET.dict())
+    form = StatsLeaderboardForm(data)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    start = form.cleaned_data["from"]
+    end = form.cleaned_data["to"]
+    leaderboard = build_fruit_leaderboard(
+        start, end, form.cleaned_data["by"], form.cleaned_data["top"]
+    )
 
-    total_proceeds = calculate_total_proceeds(sales)
+    return JsonResponse(
+        {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            **leaderboard.as_dict(),
+        }
+    )
 
-    # Get sales for most recent three days
-    day_sales = get_sales_for_period(sales, "days")
-    day_sales = sort_sales_by_day(day_sales)
-    day_sales = build_sales_details(day_sales)
 
-    # Get sales for most recent three months
-    month_sales = get_sales_for_period(sales, "month")
-    month_sales = sort_sales_by_month(month_sales)
-    month_sales = build_sales_details(month_sales)
+@login_required
+def stats_heatmap(request):
+
+    fruit_names = get_cached_stats("heatmap_fruits", get_heatmap_fruit_names)
+    fruit_name = request.GET.get("fruit", "")
+    if fruit_name not in fruit_names:
+        fruit_name = ""
+
+    # Cached per fruit, by its position in the list rather than its name so
+    # that the cache key is valid for any name, and recomputed only after
+    # sales are written (which may change the list)
+    fruit_key = fruit_names.index(fruit_name) if fruit_name else "all"
+    rows = get_cached_stats(
+        f"heatmap:{fruit_key}", lambda: build_sales_heatmap(fruit_name)
+    )
 
     return render(
         request,
-        "stats/stats_list.html",
+        "stats/stats_heatmap.html",
         {
-            "total_proceeds": total_proceeds,
-            "month_sales": month_sales,
-            "day_sales": day_sales,
+            "rows": rows,
+            "hours": range(24),
+            "fruit_names": fruit_names,
+            "fruit_name": fruit_name,
         },
     )